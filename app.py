@@ -2,36 +2,117 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import csv
+import hashlib
+import io
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from datetime import datetime, timedelta, timezone
+from itertools import groupby, islice
+from functools import lru_cache
+from flask import Flask, Blueprint, current_app, render_template, request, Response, flash, redirect, url_for, abort, session, stream_with_context, jsonify, g
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form, CsrfProtect
-from forms import *
-from flask_migrate import Migrate
+from choices import GENRES, SHOW_DURATION_MINUTES, SHOW_MAX_DURATION_MINUTES
+from cache import RenderCache
+from assets import Assets, BUNDLES, build, send_bundle
+from metrics import RequestMetrics
+from compression import Compression
+from autocomplete import NameIndex
+from partitions import SHOW_PERIOD, OVERLAPPING_START, add_months, booking_constraint, default_shows, maintain_partitions, month_start, partition_month, partition_name
+from database import database_uri, engine_options, pool_status, RoutingSQLAlchemy, read_only
 import sys
+import time
+import click
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Executable, ClauseElement
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from werkzeug.http import is_resource_modified
 #----------------------------------------------------------------------------#
 # App Config.
+#
+# create_app() builds the app. Rarely needed modules (Babel, dateutil, the
+# WTForms classes, Flask-Migrate and Alembic) are imported where they are
+# used, and nothing connects to the database until the first request, so a
+# forking server can preload the app.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+moment = Moment()
+db = RoutingSQLAlchemy()
+request_metrics = RequestMetrics()
+compression = Compression()
+# venue and artist names for /api/autocomplete
+venue_names = NameIndex()
+artist_names = NameIndex()
+# rendered venue and artist pages with their validators and compressed copies, keyed by ('venue', id) / ('artist', id)
+page_cache = RenderCache()
+# the fingerprinted bundles built by `flask assets`
+assets = Assets()
+bp = Blueprint('fyyur', __name__, cli_group=None)
+
+def create_app(config='config'):
+  app = Flask(__name__)
+  app.config.from_object(config)
+  if not app.debug and app.config['SECRET_KEY'] == app.config['DEVELOPMENT_SECRET_KEY']:
+    raise RuntimeError('Set SECRET_KEY, every worker needs the same key to read the session cookie.')
+  app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+  moment.init_app(app)
+  db.init_app(app)
+  request_metrics.init_app(app)
+  # registered after the metrics so the time spent compressing is part of the request latency
+  compression.init_app(app)
+  page_cache.init_app(app, grace=app.config['REPLICA_LAG_WINDOW'] if db.router else 0)
+  assets.init_app(app)
+  venue_names.init_app(app, lambda: db.session.query(Venue.id, Venue.name).filter(Venue.deleted_at.is_(None)))
+  artist_names.init_app(app, lambda: db.session.query(Artist.id, Artist.name))
+  app.register_blueprint(bp)
+  if click.get_current_context(silent=True) is not None:
+    # only the flask command needs Flask-Migrate for `flask db`
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
+  if not app.debug:
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
+    app.logger.info('errors')
+  return app
+
+@bp.before_app_request
+def route_reads():
+  # read-only views may use a replica, unless this client wrote moments ago and
+  # the replica might not have caught up with that write yet
+  view = current_app.view_functions.get(request.endpoint)
+  g.read_only = getattr(view, 'read_only', False) and session.get('primary_until', 0) < time.time()
 
-# TODO: connect to a local postgresql database
+@bp.after_app_request
+def remember_writes(response):
+  if db.router is not None and g.get('db_wrote', False):
+    session['primary_until'] = time.time() + current_app.config['REPLICA_LAG_WINDOW']
+  return response
 
-migrate=Migrate(app,db)
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+      db.Index('ix_Venue_updated_at', 'updated_at'),
+      # the listing, search, genre and area indexes leave out soft-deleted venues, which
+      # every query of those pages filters out as well
+      db.Index('ix_Venue_live_id', 'id', postgresql_where=db.text('deleted_at IS NULL')),
+      db.Index('ix_Venue_city_state', 'city', 'state', 'id', postgresql_where=db.text('deleted_at IS NULL')),
+      db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_where=db.text('deleted_at IS NULL')),
+      db.Index('ix_Venue_genres', 'genres', postgresql_using='gin', postgresql_where=db.text('deleted_at IS NULL')),
+      db.Index('ix_Venue_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -45,6 +126,10 @@ class Venue(db.Model):
     website=db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120), nullable=False)
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.text("timezone('utc', now())"))
+    # set when the venue is soft-deleted, see remove_venue()
+    deleted_at = db.Column(db.DateTime)
     
 
 
@@ -55,6 +140,11 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+      db.Index('ix_Artist_updated_at', 'updated_at'),
+      db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+      db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String,nullable=False)
@@ -67,6 +157,8 @@ class Artist(db.Model):
     seeking_venue= db.Column(db.Boolean, nullable=False, default=False)
     website=db.Column(db.String(120))
     seeking_talent=db.Column(db.String(120))
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.text("timezone('utc', now())"))
     
     
     def __repr__(self):
@@ -77,12 +169,30 @@ class Artist(db.Model):
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
 class Show(db.Model):
+    # partitioned by month of start_time, see partitions.py; the partitions carry the venue and
+    # artist booking exclusion constraints, whose GiST indexes also answer the availability search
     __tablename__ = 'Show'
+    __table_args__ = (
+      db.Index('ix_Show_updated_at', 'updated_at'),
+      db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+      db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+      db.Index('ix_Show_start_time', 'start_time'),
+      db.Index('ix_Show_counted_upcoming_start_time', 'start_time', postgresql_where=db.text('counted_upcoming')),
+      db.CheckConstraint(f'duration_minutes BETWEEN 1 AND {SHOW_MAX_DURATION_MINUTES}', name='ck_Show_duration_minutes'),
+      {'postgresql_partition_by': 'RANGE (start_time)'},
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
+    # the key of a partitioned table includes the partition key; ids still come from one sequence
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', onupdate='CASCADE', ondelete='CASCADE'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', onupdate='CASCADE', ondelete='CASCADE'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow())
+    start_time = db.Column(db.DateTime, primary_key=True, nullable=False, default=datetime.utcnow())
+    duration_minutes = db.Column(db.Integer, nullable=False, default=SHOW_DURATION_MINUTES, server_default=str(SHOW_DURATION_MINUTES))
+    # whether the show is included in its venue's and artist's upcoming_show_count
+    counted_upcoming = db.Column(db.Boolean, nullable=False, default=False, server_default='false')
+    # set on the upcoming shows of a soft-deleted venue, which are kept but no longer book the artist
+    cancelled = db.Column(db.Boolean, nullable=False, default=False, server_default='false')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.text("timezone('utc', now())"))
 
     venue = db.relationship('Venue', backref=db.backref('shows', lazy=True))
     artist = db.relationship('Artist', backref=db.backref('shows', lazy=True))
@@ -90,19 +200,316 @@ class Show(db.Model):
     def __repr__(self):
       return f'<Show {self.id, self.start_time, self.artist}>'
 
+class VenueArchive(db.Model):
+    # soft-deleted venues and their shows, moved here by `flask purge-venues`
+    __tablename__ = 'VenueArchive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, server_default=db.text('LOCALTIMESTAMP'))
+    # the Venue row and its Show rows as they were when archived
+    venue = db.Column(JSONB, nullable=False)
+    shows = db.Column(JSONB, nullable=False)
+
+    def __repr__(self):
+      return f'<VenueArchive {self.id} {self.name}>'
+
 #----------------------------------------------------------------------------#
-# Filters.
+# Upcoming show counters.
+#----------------------------------------------------------------------------#
+
+def adjust_upcoming_show_count(connection, show, delta):
+  # the update also sets updated_at through its onupdate, the venue and artist pages list the show
+  for model, entity_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+    connection.execute(
+      model.__table__.update()
+        .where(model.__table__.c.id == entity_id)
+        .values(upcoming_show_count=model.__table__.c.upcoming_show_count + delta)
+    )
+
+@db.event.listens_for(Show, 'before_insert')
+def count_upcoming_show(mapper, connection, show):
+  show.counted_upcoming = show.start_time > datetime.now()
+
+@db.event.listens_for(Show, 'after_insert')
+def increment_upcoming_show_count(mapper, connection, show):
+  # runs on the flush connection, so the counters commit or roll back with the show;
+  # a past show leaves the counters alone but still marks its venue and artist as updated
+  adjust_upcoming_show_count(connection, show, 1 if show.counted_upcoming else 0)
+
+@db.event.listens_for(Show, 'after_delete')
+def decrement_upcoming_show_count(mapper, connection, show):
+  adjust_upcoming_show_count(connection, show, -1 if show.counted_upcoming else 0)
+
+ROLL_SHOW_COUNTERS = db.text('''
+  WITH passed AS (
+    UPDATE "Show" SET counted_upcoming = false, updated_at = timezone('utc', now())
+    WHERE counted_upcoming AND start_time <= :now
+    RETURNING venue_id, artist_id
+  ), venues AS (
+    UPDATE "Venue" SET upcoming_show_count = upcoming_show_count - passed_venues.shows, updated_at = timezone('utc', now())
+    FROM (SELECT venue_id, count(*) AS shows FROM passed GROUP BY venue_id) AS passed_venues
+    WHERE "Venue".id = passed_venues.venue_id
+  ), artists AS (
+    UPDATE "Artist" SET upcoming_show_count = upcoming_show_count - passed_artists.shows, updated_at = timezone('utc', now())
+    FROM (SELECT artist_id, count(*) AS shows FROM passed GROUP BY artist_id) AS passed_artists
+    WHERE "Artist".id = passed_artists.artist_id
+  )
+  SELECT count(*) FROM passed
+''')
+
+def roll_show_counters(now):
+  # shows that started since the last run stop counting as upcoming, in one statement
+  return db.session.execute(ROLL_SHOW_COUNTERS, {'now': now}).scalar()
+
+RECONCILE_SHOW_FLAGS = db.text('''
+  UPDATE "Show" SET counted_upcoming = NOT counted_upcoming, updated_at = timezone('utc', now())
+  FROM "Venue"
+  WHERE "Venue".id = "Show".venue_id AND counted_upcoming <> (start_time > :now AND "Venue".deleted_at IS NULL AND NOT cancelled)
+''')
+
+RECONCILE_SHOW_COUNTERS = '''
+  WITH actual AS (
+    SELECT entity.id, count("Show".id) FILTER (WHERE "Show".counted_upcoming) AS shows
+    FROM "{table}" AS entity LEFT JOIN "Show" ON "Show".{foreign_key} = entity.id
+    GROUP BY entity.id
+  )
+  UPDATE "{table}" SET upcoming_show_count = actual.shows, updated_at = timezone('utc', now())
+  FROM actual JOIN "{table}" AS stored ON stored.id = actual.id
+  WHERE "{table}".id = actual.id AND stored.upcoming_show_count <> actual.shows
+  RETURNING "{table}".id, stored.upcoming_show_count AS stored, actual.shows AS actual
+'''
+
+def reconcile_show_counters(now):
+  # recomputes every counter from the Show table and returns the drifted rows per table
+  flags = db.session.execute(RECONCILE_SHOW_FLAGS, {'now': now}).rowcount
+  drift = {}
+  for model, foreign_key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+    statement = RECONCILE_SHOW_COUNTERS.format(table=model.__tablename__, foreign_key=foreign_key)
+    drift[model.__tablename__] = db.session.execute(db.text(statement)).fetchall()
+  return flags, drift
+
+#----------------------------------------------------------------------------#
+# Booking shows.
+#
+# A show, or every show of a recurring booking, is inserted with one
+# statement. Dates overlapping a show of the venue or of the artist are
+# found by probing the booking GiST indexes in the same statement, which
+# also catches the overlaps across a month boundary that the constraints
+# of the Show partitions can't see. The probes are bounded on start_time,
+# so they only read the partitions around the date. Unless the booking asks
+# to skip them, a single taken date books none of the shows. The counters
+# of the venue and artist are updated there too, since the ORM events that
+# maintain them don't see Core inserts. The venue and the artist are locked
+# first, always in that order, and the statement runs once both locks are
+# held: two bookings of the same venue or artist take turns, so one sees the
+# show of the other even when they only overlap across a month boundary,
+# where no constraint would stop them. A soft delete takes the venue lock
+# too, and a deleted venue books nothing.
+#----------------------------------------------------------------------------#
+
+LOCK_LIVE_VENUE = db.text('SELECT 1 FROM "Venue" WHERE id = :venue_id AND deleted_at IS NULL FOR UPDATE')
+LOCK_ARTIST = db.text('SELECT 1 FROM "Artist" WHERE id = :artist_id FOR UPDATE')
+
+BOOK_SHOWS = db.text(f'''
+  WITH requested AS (
+    SELECT requested_start, tsrange(requested_start, requested_start + :duration_minutes * interval '1 minute') AS period
+    FROM unnest(CAST(:start_times AS timestamp[])) AS requested_start
+  ), checked AS (
+    SELECT requested_start,
+      EXISTS (SELECT 1 FROM "Show" WHERE venue_id = :venue_id AND {SHOW_PERIOD} && period AND {OVERLAPPING_START} AND NOT cancelled) AS venue_booked,
+      EXISTS (SELECT 1 FROM "Show" WHERE artist_id = :artist_id AND {SHOW_PERIOD} && period AND {OVERLAPPING_START} AND NOT cancelled) AS artist_booked
+    FROM requested
+  ), inserted AS (
+    INSERT INTO "Show" (venue_id, artist_id, start_time, duration_minutes, counted_upcoming)
+    SELECT :venue_id, :artist_id, requested_start, :duration_minutes, requested_start > :now
+    FROM checked
+    WHERE NOT (venue_booked OR artist_booked)
+      AND (:skip_conflicts OR NOT EXISTS (SELECT 1 FROM checked WHERE venue_booked OR artist_booked))
+    RETURNING id, start_time, counted_upcoming
+  ), venue AS (
+    UPDATE "Venue" SET upcoming_show_count = upcoming_show_count + (SELECT count(*) FROM inserted WHERE counted_upcoming), updated_at = timezone('utc', now())
+    WHERE id = :venue_id AND EXISTS (SELECT 1 FROM inserted)
+  ), artist AS (
+    UPDATE "Artist" SET upcoming_show_count = upcoming_show_count + (SELECT count(*) FROM inserted WHERE counted_upcoming), updated_at = timezone('utc', now())
+    WHERE id = :artist_id AND EXISTS (SELECT 1 FROM inserted)
+  )
+  SELECT checked.requested_start AS start_time, checked.venue_booked, checked.artist_booked, inserted.id
+  FROM checked LEFT JOIN inserted ON inserted.start_time = checked.requested_start
+  ORDER BY checked.requested_start
+''')
+
+RECURRENCE_RULES = {'daily': 'DAILY', 'weekly': 'WEEKLY', 'monthly': 'MONTHLY'}
+
+def recurring_start_times(start_time, frequency, interval, until, limit):
+  # the start times from <start_time> through the day <until>, or None if there are more than <limit>
+  from dateutil import rrule
+  rule = rrule.rrule(getattr(rrule, RECURRENCE_RULES[frequency]), dtstart=start_time, interval=interval, until=datetime.combine(until, datetime.max.time()))
+  start_times = list(islice(rule, limit + 1))
+  return start_times if len(start_times) <= limit else None
+
+def book_shows(venue_id, artist_id, start_times, duration_minutes, skip_conflicts, now):
+  # one row per start time: the id of its new show, or None and whether the venue and
+  # the artist are already booked then; None if the venue is missing or deleted, or the
+  # artist is missing. The statement runs on a snapshot taken once the locks are held
+  if db.session.execute(LOCK_LIVE_VENUE, {'venue_id': venue_id}).first() is None:
+    return None
+  if db.session.execute(LOCK_ARTIST, {'artist_id': artist_id}).first() is None:
+    return None
+  return db.session.execute(BOOK_SHOWS, {
+    'venue_id': venue_id,
+    'artist_id': artist_id,
+    'start_times': start_times,
+    'duration_minutes': duration_minutes,
+    'skip_conflicts': skip_conflicts,
+    'now': now,
+  }).fetchall()
+
 #----------------------------------------------------------------------------#
+# Venue deletion.
+#
+# A venue is deleted with one statement and its shows go with it through the
+# ON DELETE CASCADE foreign key, instead of being loaded and deleted one by
+# one by the ORM. The statement also takes the venue's upcoming shows off
+# the counters of their artists, since the cascade bypasses the ORM events.
+#
+# With VENUE_SOFT_DELETE the venue is only marked with deleted_at. It drops
+# out of every listing, search and page, which filter on deleted_at through
+# the partial Venue indexes. Its upcoming shows are kept but marked
+# cancelled, which takes them off the counters and out of the booking
+# constraints and probes, so they no longer book its artists. `flask
+# purge-venues` later moves such venues and all their shows to VenueArchive.
+#----------------------------------------------------------------------------#
+
+DELETE_VENUE = db.text('''
+  WITH venue_shows AS (
+    SELECT artist_id, count(*) FILTER (WHERE counted_upcoming) AS upcoming
+    FROM "Show" WHERE venue_id = :venue_id
+    GROUP BY artist_id
+  ), deleted AS (
+    DELETE FROM "Venue" WHERE id = :venue_id
+    RETURNING id, name
+  ), artists AS (
+    UPDATE "Artist" SET upcoming_show_count = upcoming_show_count - venue_shows.upcoming, updated_at = timezone('utc', now())
+    FROM venue_shows
+    WHERE "Artist".id = venue_shows.artist_id AND EXISTS (SELECT 1 FROM deleted)
+  )
+  SELECT deleted.name, ARRAY(SELECT artist_id FROM venue_shows) AS artist_ids
+  FROM deleted
+''')
+
+SOFT_DELETE_VENUE = db.text('''
+  WITH deleted AS (
+    UPDATE "Venue" SET deleted_at = LOCALTIMESTAMP, upcoming_show_count = 0, updated_at = timezone('utc', now())
+    WHERE id = :venue_id AND deleted_at IS NULL
+    RETURNING id, name
+  ), cancelled AS (
+    UPDATE "Show" SET counted_upcoming = false, cancelled = start_time > :now, updated_at = timezone('utc', now())
+    WHERE venue_id IN (SELECT id FROM deleted) AND (counted_upcoming OR start_time > :now)
+  ), artists AS (
+    UPDATE "Artist" SET upcoming_show_count = upcoming_show_count - uncounted.shows, updated_at = timezone('utc', now())
+    FROM (
+      -- read from the snapshot the statement started with, before the shows were uncounted
+      SELECT artist_id, count(*) AS shows
+      FROM "Show"
+      WHERE venue_id IN (SELECT id FROM deleted) AND counted_upcoming
+      GROUP BY artist_id
+    ) AS uncounted
+    WHERE "Artist".id = uncounted.artist_id
+  )
+  SELECT deleted.name, ARRAY(SELECT DISTINCT artist_id FROM "Show" WHERE venue_id = deleted.id) AS artist_ids
+  FROM deleted
+''')
+
+PURGE_VENUES = db.text('''
+  WITH batch AS (
+    SELECT id FROM "Venue"
+    WHERE deleted_at < :cutoff
+    ORDER BY deleted_at
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+  ), archived AS (
+    INSERT INTO "VenueArchive" (id, name, deleted_at, venue, shows)
+    SELECT venue.id, venue.name, venue.deleted_at, to_jsonb(venue),
+      (SELECT COALESCE(jsonb_agg(to_jsonb(show) ORDER BY show.start_time), '[]') FROM "Show" AS show WHERE show.venue_id = venue.id)
+    FROM "Venue" AS venue JOIN batch USING (id)
+    RETURNING id, jsonb_array_length(shows) AS shows
+  ), purged AS (
+    DELETE FROM "Venue" WHERE id IN (SELECT id FROM archived)
+    RETURNING id
+  )
+  SELECT (SELECT count(*) FROM purged) AS venues, (SELECT COALESCE(sum(shows), 0) FROM archived) AS shows
+''')
+
+def exclude_deleted(query, model):
+  # leaves out soft-deleted rows, the partial Venue indexes only serve queries filtering on this
+  if hasattr(model, 'deleted_at'):
+    return query.filter(model.deleted_at.is_(None))
+  return query
+
+def remove_venue(venue_id, soft, now):
+  # deletes or soft-deletes a venue; returns its name and the artists of its shows, whose
+  # pages listed it, or None if there is no such venue
+  # the lock keeps shows from being added to the venue between the statement reading its
+  # shows and deleting them; the statement runs on a snapshot taken once the lock is held
+  db.session.execute(db.text('SELECT 1 FROM "Venue" WHERE id = :venue_id FOR UPDATE'), {'venue_id': venue_id})
+  if soft:
+    return db.session.execute(SOFT_DELETE_VENUE, {'venue_id': venue_id, 'now': now}).first()
+  return db.session.execute(DELETE_VENUE, {'venue_id': venue_id}).first()
+
+def purge_venues(cutoff, batch_size):
+  # archives and deletes up to <batch_size> venues soft-deleted before <cutoff>, oldest first,
+  # along with their shows; returns the number of venues and shows moved
+  return db.session.execute(PURGE_VENUES, {'cutoff': cutoff, 'batch_size': batch_size}).first()
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+#----------------------------------------------------------------------------#
+# Filters.
+#----------------------------------------------------------------------------#
 
-app.jinja_env.filters['datetime'] = format_datetime
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=64)
+def compiled_datetime_format(format, locale):
+  # parsing a Babel pattern and a locale is the costly part of formatting,
+  # so each (format, locale) pair is compiled once; Babel itself loads on first use
+  from babel import Locale
+  from babel.dates import LC_TIME, parse_pattern
+  return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale or LC_TIME)
+
+def parse_datetime(value):
+  import dateutil.parser
+  return dateutil.parser.parse(value)
+
+def utc_datetime(value):
+  # updated_at is naive UTC; a timestamp without an offset is taken to be UTC as well
+  if value.tzinfo is not None:
+    value = value.astimezone(timezone.utc).replace(tzinfo=None)
+  return value
+
+def format_datetime(value, format='medium', locale=None):
+  if isinstance(value, str):
+    value = parse_datetime(value)
+  pattern, locale = compiled_datetime_format(format, locale)
+  return pattern.apply(value, locale)
+
+def format_datetimes(values, format='medium', locale=None):
+  # formats a whole page of datetimes with one pattern lookup
+  pattern, locale = compiled_datetime_format(format, locale)
+  return [pattern.apply(value, locale) for value in values]
+
+bp.add_app_template_filter(format_datetime, 'datetime')
+
+@bp.app_template_global()
+def asset_urls(bundle):
+  # the URL of a built bundle, or of each of its source files when there is no build
+  filename = assets.built(bundle)
+  if filename is not None:
+    return [url_for('fyyur.asset', filename=filename)]
+  return [url_for('static', filename=source) for source in BUNDLES[bundle]]
 
 def get_value(field_name):
   if field_name=='genres':
@@ -113,13 +520,379 @@ def get_value(field_name):
     return False
   else:
     return request.form[field_name]
-  
+
+def filter_by_genre(query, model, genre):
+  # genres @> ARRAY[genre] is answered by the GIN index on the genres array,
+  # the literal is cast to varchar[] as Postgres has no varchar[] @> text[] operator
+  if not genre:
+    return query
+  if genre not in GENRES:
+    abort(404)
+  return query.filter(model.genres.op('@>')(db.cast([genre], model.genres.type)))
+
+def search_by_name(model, search_term, genre=None):
+  # the ilike is answered by the trigram GIN index on name and similarity() ranks the hits,
+  # the total number of matches is taken in the same query; returns the query, not its rows
+  pattern = '%' + search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+  query = db.session.query(
+      model.id,
+      model.name,
+      model.upcoming_show_count.label('num_upcoming_shows'),
+      db.func.count().over().label('total')
+    )
+  return filter_by_genre(exclude_deleted(query, model), model, genre)\
+    .filter(model.name.ilike(pattern, escape='\\'))\
+    .order_by(db.func.similarity(model.name, search_term).desc(), model.name, model.id)\
+    .limit(current_app.config['SEARCH_RESULTS_LIMIT'])
+
+def search_results(rows):
+  results={
+    "count": rows[0].total if rows else 0,
+    "data": []
+  }
+  for row in rows:
+    results["data"].append({
+      'id': row.id,
+      'name':row.name,
+      'num_upcoming_shows':row.num_upcoming_shows
+    })
+  return results
+
+
+def venues_with_upcoming_counts():
+  # venues with the number of their shows still to come, read from the maintained counter
+  return db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_show_count.label('num_upcoming_shows'), Venue.updated_at)\
+    .filter(Venue.deleted_at.is_(None))
+
+# the listing is ordered and paged by area, so an area is split over pages only when it doesn't fit
+# one; ix_Venue_city_state serves the order
+VENUE_LISTING_KEY = (Venue.city, Venue.state, Venue.id)
+
+def venue_areas(rows):
+  areas=[]
+  #the page is ordered by area, each area is one consecutive run
+  for (city, state), area_rows in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+      'city':city,
+      'state':state,
+      'venues':[{
+        'id':row.id,
+        'name':row.name,
+        'num_upcoming_shows':row.num_upcoming_shows
+      } for row in area_rows]
+    })
+  return areas
+
+def artist_listing(rows):
+  return [{'id': row.id, 'name': row.name} for row in rows]
+
+def shows_with_names():
+  return db.session.query(
+      Show.id,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+      Show.start_time,
+      db.func.greatest(Show.updated_at, Venue.updated_at, Artist.updated_at).label('updated_at')
+    ).join(Artist).join(Venue)\
+    .filter(Venue.deleted_at.is_(None))
+
+def show_listing(rows):
+  shows=[]
+  start_times = format_datetimes([row.start_time for row in rows], 'full')
+  for row, start_time in zip(rows, start_times):
+    shows.append({
+      "venue_id": row.venue_id,
+      "venue_name": row.venue_name,
+      "artist_id": row.artist_id,
+      "artist_name": row.artist_name,
+      "artist_image_link": row.artist_image_link,
+      "start_time": row.start_time,
+      "start_time_full": start_time
+    })
+  return shows
+
+def show_period():
+  # SHOW_PERIOD as a query expression, written the same way so the booking GiST indexes match it
+  return db.func.tsrange(Show.start_time, Show.start_time + Show.duration_minutes * db.literal_column("interval '1 minute'"))
+
+def entity_shows_query(model, show_foreign_key, other_model, entity_id, *columns):
+  # <columns> aggregated over an entity, its shows and the artists or venues playing them; like
+  # show_history_query(), the shows of soft-deleted venues are left out
+  shows = show_foreign_key == model.id
+  if other_model is Venue:
+    # an alias, the query joins Venue too
+    deleted = db.aliased(Venue)
+    shows = db.and_(shows, ~db.exists().where(db.and_(deleted.id == Show.venue_id, deleted.deleted_at.isnot(None))))
+  query = db.session.query(*columns)\
+    .outerjoin(Show, shows)\
+    .outerjoin(other_model)\
+    .filter(model.id == entity_id)\
+    .group_by(model.id)
+  return exclude_deleted(query, model)
+
+def with_show_counts(model, show_foreign_key, other_model, entity_id, now):
+  # the entity row together with its past and upcoming show counts and the columns of
+  # entity_changes(), in one query
+  return entity_shows_query(model, show_foreign_key, other_model, entity_id,
+    model,
+    db.func.count(Show.id).filter(Show.start_time <= now).label('past_shows_count'),
+    db.func.count(Show.id).filter(Show.start_time > now).label('upcoming_shows_count'),
+    *change_columns(model, other_model, now)
+  )
+
+def show_history_query(show_foreign_key, entity_id, other_model, prefix, now, past_limit):
+  # every upcoming show and the most recent <past_limit> past shows of an entity, joined to
+  # the artist or venue playing them and split into past and upcoming by the database
+  upcoming = (Show.start_time > now).label('upcoming')
+  history = db.session.query(
+      Show.start_time,
+      other_model.id.label(f'{prefix}_id'),
+      other_model.name.label(f'{prefix}_name'),
+      other_model.image_link.label(f'{prefix}_image_link'),
+      upcoming,
+      db.func.row_number().over(partition_by=upcoming, order_by=Show.start_time.desc()).label('recency')
+    )\
+    .join(other_model)\
+    .filter(show_foreign_key == entity_id)
+  history = exclude_deleted(history, other_model).subquery()
+  return db.session.query(history)\
+    .filter(db.or_(history.c.upcoming, history.c.recency <= past_limit))\
+    .order_by(history.c.start_time)
+
+def show_history(rows, prefix):
+  # the rows of show_history_query() split into past and upcoming shows
+  past_shows=[]
+  upcoming_shows=[]
+  next_show_time=None
+  for row in rows:
+    show_attributes={
+      f'{prefix}_id':getattr(row, f'{prefix}_id'),
+      f'{prefix}_name':getattr(row, f'{prefix}_name'),
+      f'{prefix}_image_link':getattr(row, f'{prefix}_image_link'),
+      'start_time':row.start_time
+    }
+    if row.upcoming:
+      upcoming_shows.append(show_attributes)
+      if next_show_time is None:
+        next_show_time=row.start_time
+    else:
+      past_shows.append(show_attributes)
+  #most recent past show first
+  past_shows.reverse()
+  return past_shows, upcoming_shows, next_show_time
+
+def past_shows_limit():
+  # the number of past shows a venue or artist page lists, from ?past_shows=
+  past_limit = request.args.get('past_shows', current_app.config['PAST_SHOWS_LIMIT'], type=int)
+  if past_limit < 1:
+    abort(400)
+  return min(past_limit, current_app.config['MAX_PAST_SHOWS_LIMIT'])
+
+def more_past_shows(counts, past_shows, past_limit):
+  # the past_shows of the "load more" link, None once all are listed or the limit is reached
+  if counts.past_shows_count <= len(past_shows) or past_limit >= current_app.config['MAX_PAST_SHOWS_LIMIT']:
+    return None
+  return min(past_limit + current_app.config['PAST_SHOWS_LIMIT'], current_app.config['MAX_PAST_SHOWS_LIMIT'])
+
+def venue_page(venue, counts, past_shows, upcoming_shows, past_limit):
+  return {
+    'id':venue.id,
+    'name':venue.name,
+    'genres':venue.genres,
+    'address':venue.address,
+    'city':venue.city,
+    'state':venue.state,
+    'phone':venue.phone,
+    'website':venue.website,
+    'facebook':venue.facebook_link,
+    'seeking_talent':venue.seeking_talent,
+    'seeking_description':venue.seeking_description,
+    'image_link':venue.image_link,
+    'past_shows':past_shows,
+    'upcoming_shows':upcoming_shows,
+    'past_shows_count':counts.past_shows_count,
+    'upcoming_shows_count':counts.upcoming_shows_count,
+    'more_past_shows':more_past_shows(counts, past_shows, past_limit)
+  }
+
+def artist_page(artist, counts, past_shows, upcoming_shows, past_limit):
+  return {
+    'id':artist.id,
+    'name':artist.name,
+    'genres':list(artist.genres),
+    'city':artist.city,
+    'state':artist.state,
+    'phone':artist.phone,
+    'website':artist.website,
+    'facebook':artist.facebook_link,
+    'seeking_venue':artist.seeking_venue,
+    'seeking_description':artist.seeking_talent,
+    'image_link':artist.image_link,
+    'past_shows':past_shows,
+    'upcoming_shows':upcoming_shows,
+    'past_shows_count':counts.past_shows_count,
+    'upcoming_shows_count':counts.upcoming_shows_count,
+    'more_past_shows':more_past_shows(counts, past_shows, past_limit)
+  }
+
+def cached_page(key, validators):
+  # pages are only cached in their default form, without any query arguments, and never
+  # while flashed messages are waiting to be rendered into them. The copy of the page is
+  # looked up by its ETag, so a write through another worker makes this one's copy miss
+  if request.args or '_flashes' in session:
+    return None, False
+  return page_cache.get(key, validators[0]), True
+
+def invalidate_pages(venue_ids=(), artist_ids=()):
+  page_cache.invalidate(*[('venue', id) for id in venue_ids], *[('artist', id) for id in artist_ids])
+
+
+def page_limit():
+  return max(1, min(request.args.get('limit', current_app.config['PAGE_SIZE'], type=int), current_app.config['MAX_PAGE_SIZE']))
+
+def keyset_cursor(name, key_columns):
+  # the cursor of a key on the id is the id, that of a key of several columns the JSON
+  # array of their values; None if missing or malformed
+  if len(key_columns) == 1:
+    return request.args.get(name, type=int)
+  try:
+    cursor = json.loads(request.args[name])
+  except (KeyError, ValueError):
+    return None
+  if not isinstance(cursor, list) or len(cursor) != len(key_columns):
+    return None
+  if not all(isinstance(value, column.type.python_type) for value, column in zip(cursor, key_columns)):
+    return None
+  return db.tuple_(*cursor)
+
+def cursor_value(row, key_columns):
+  if len(key_columns) == 1:
+    return row.id
+  return json.dumps([getattr(row, column.key) for column in key_columns])
+
+def keyset_query(query, *key_columns):
+  # keyset pagination: seek past the cursor on the ordering key instead of using OFFSET,
+  # so a page deep in the listing costs the same as the first one. One row more than
+  # the page is fetched to tell whether there is a next page
+  limit = page_limit()
+  key = db.tuple_(*key_columns) if len(key_columns) > 1 else key_columns[0]
+  after = keyset_cursor('after', key_columns)
+  before = keyset_cursor('before', key_columns)
+  if before is not None:
+    return query.filter(key < before).order_by(*[column.desc() for column in key_columns]).limit(limit + 1)
+  if after is not None:
+    query = query.filter(key > after)
+  return query.order_by(*key_columns).limit(limit + 1)
+
+def keyset_page(rows, *key_columns):
+  # the rows of a keyset_query() on <key_columns> trimmed to one page, and the links to its neighbours
+  limit = page_limit()
+  after = keyset_cursor('after', key_columns)
+  before = keyset_cursor('before', key_columns)
+  if before is not None:
+    has_prev = len(rows) > limit
+    rows = rows[:limit][::-1]
+    has_next = True
+  else:
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    has_prev = after is not None
+
+  page={
+    'limit':limit,
+    'next_after':cursor_value(rows[-1], key_columns) if rows and has_next else None,
+    'prev_before':cursor_value(rows[0], key_columns) if rows and has_prev else None
+  }
+  #the links keep the other query parameters, such as filters, of the current page
+  args={key: value for key, value in request.args.items() if key not in ('after', 'before')}
+  args.update(request.view_args, limit=limit)
+  page['next_url']=url_for(request.endpoint, **args, after=page['next_after']) if page['next_after'] else None
+  page['prev_url']=url_for(request.endpoint, **args, before=page['prev_before']) if page['prev_before'] else None
+  return rows, page
+
+def paginate_keyset(query, *key_columns):
+  return keyset_page(keyset_query(query, *key_columns).all(), *key_columns)
+
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#
+# Venue and artist pages and the listings carry an ETag and a Last-Modified
+# derived from the updated_at of the rows they show. A client revalidating
+# its copy gets a 304 before the page is rendered: listings check the rows
+# of the page, detail pages run one timestamp query first. A detail page
+# requested without validators takes them from the query loading the
+# entity instead, so rendering it still takes two queries.
+#----------------------------------------------------------------------------#
+
+def page_validators(last_modified, contents):
+  # (ETag, Last-Modified) of a page. <contents> catches what a timestamp can't, such as rows
+  # that are gone; RELEASE makes a deploy that changes the templates change every ETag, and
+  # the assets version a rebuild that renames the bundles the pages link
+  etag = hashlib.md5(repr((current_app.config['RELEASE'], assets.version, last_modified, contents)).encode()).hexdigest()
+  return etag, last_modified
+
+def listing_validators(rows, page):
+  return page_validators(max((row.updated_at for row in rows), default=None), ([row.id for row in rows], page['next_after'], page['prev_before']))
+
+def change_columns(model, other_model, now):
+  # when an entity page last changed: the latest update of the entity, its shows or the artists
+  # or venues playing them, or else the start of its latest past show, which moved the show
+  # from upcoming to past. updated_at is UTC, show times are local and converted in the database's
+  # time zone. And the number of shows, which catches a show that is gone
+  return (
+    db.func.greatest(
+      model.updated_at,
+      db.func.max(Show.updated_at),
+      db.func.max(other_model.updated_at),
+      db.func.timezone('utc', db.cast(db.func.max(Show.start_time).filter(Show.start_time <= now), db.DateTime(timezone=True)))
+    ).label('last_modified'),
+    db.func.count(Show.id).label('shows')
+  )
+
+def entity_changes(model, show_foreign_key, other_model, entity_id, now):
+  # the timestamp query of an entity page; no row if the entity doesn't exist or is soft-deleted
+  return entity_shows_query(model, show_foreign_key, other_model, entity_id, *change_columns(model, other_model, now))
+
+def entity_validators(rows):
+  return page_validators(rows[0].last_modified, rows[0].shows) if rows else None
+
+def revalidating():
+  # whether the client asks to revalidate a copy, which the timestamp query alone can answer
+  return bool(request.if_none_match) or request.if_modified_since is not None
+
+def revalidate(validators):
+  # a 304 if the client's copy of the page is still current, otherwise None and the page is
+  # rendered; pages showing flashed messages are sent without validators
+  if '_flashes' in session:
+    return None
+  g.page_validators = validators
+  etag, last_modified = validators
+  if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+    return Response(status=304)
+  return None
+
+@bp.after_app_request
+def add_page_validators(response):
+  validators = g.get('page_validators')
+  if validators is not None and response.status_code in (200, 304):
+    etag, last_modified = validators
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+      response.last_modified = last_modified
+    #the copy may be kept, but must be revalidated before every use
+    response.cache_control.no_cache = True
+  return response
+
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -127,104 +900,75 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
+@read_only
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  venues= Venue.query.all()
-  data=[]
-  #creating a dictionary to sort the different venues based on city and state 
-  venues_dict={}
-  for venue in venues:
-    key= f'{venue.city}, {venue.state}'
-    venues_dict.setdefault(key,[]).append({
-      'id':venue.id,
-      'name':venue.name,
-      'num_upcoming_shows': len(venue.shows),
-      'city':venue.city,
-      'state':venue.state
-    })
-
-  for val in venues_dict.values():
-    data.append({
-      'city':val[0]['city'],
-      'state':val[0]['state'],
-      'venues':val
-    })
-  return render_template('pages/venues.html', areas=data)
-
-@app.route('/venues/search', methods=['POST'])
+  # a page of venues and their upcoming show counts, without touching the Show table
+  genre=request.args.get('genre')
+  rows, page = paginate_keyset(filter_by_genre(venues_with_upcoming_counts(), Venue, genre), *VENUE_LISTING_KEY)
+  response=revalidate(listing_validators(rows, page))
+  if response is not None:
+    return response
+  return render_template('pages/venues.html', areas=venue_areas(rows), page=page, genre=genre)
+
+@bp.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   search_term=get_value('search_term')
-  venue_response=Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-  response={
-    "count": len(venue_response),
-    "data": []
-  }
-
-  for venue in venue_response:
-    response["data"].append({
-      'id': venue.id,
-      'name':venue.name,
-      'num_upcomin_shows':len(venue.shows)
-    })
+  venue_response=search_by_name(Venue, search_term, request.values.get('genre')).all()
+  return render_template('pages/search_venues.html', results=search_results(venue_response), search_term=request.form.get('search_term', ''))
 
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
+@bp.route('/venues/<int:venue_id>')
+@read_only
 def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venues=Venue.query.get(venue_id)
-  past_shows=[]
-  upcoming_shows=[]
-  show_attributes=None
-  for show in venues.shows:
-    show_attributes={
-      'artist_id':show.artist.id,
-      'artist_name':show.artist.name,
-      'artist_image_link':show.artist.image_link,
-      'start_time':show.start_time.strftime('%m/%d/%Y, %H:%M:%S')
-    }
-    if show.start_time <= datetime.now():
-      past_shows.append(show_attributes)
-    else:
-      upcoming_shows.append(show_attributes)
-  
-  venue_dict={
-    'id':venues.id,
-    'name':venues.name,
-    'genres':venues.genres,
-    'address':venues.address,
-    'city':venues.city,
-    'state':venues.state,
-    'phone':venues.phone,
-    'website':venues.website,
-    'facebook':venues.facebook_link,
-    'seeking_talent':venues.seeking_talent,
-    'seeking_description':venues.seeking_description,
-    'image_link':venues.image_link,
-    'past_shows':past_shows,
-    'upcoming_shows':upcoming_shows,
-    'past_show_count':len(past_shows),
-    'upcoming_show_count':len(upcoming_shows)
-
-  }
-
-  return render_template('pages/show_venue.html', venue=venue_dict)
+  # shows the venue page with the given venue_id, built from two queries:
+  # the venue with its show counts and validators, then its upcoming and recent
+  # past shows. A client revalidating its copy is answered from one timestamp
+  # query instead
+  generation=page_cache.generation()
+  now=datetime.now()
+  if revalidating():
+    counts=None
+    validators=entity_validators(entity_changes(Venue, Show.venue_id, Artist, venue_id, now).all())
+  else:
+    counts=with_show_counts(Venue, Show.venue_id, Artist, venue_id, now).all()
+    validators=entity_validators(counts)
+  if validators is None:
+    abort(404)
+  response=revalidate(validators)
+  if response is not None:
+    return response
+  cached, cacheable = cached_page(('venue', venue_id), validators)
+  if cached:
+    compression.keep_variants(cached[1])
+    return cached[0]
+  past_limit=past_shows_limit()
+  if counts is None:
+    counts=with_show_counts(Venue, Show.venue_id, Artist, venue_id, now).all()
+    if not counts:
+      abort(404)
+  history=show_history_query(Show.venue_id, venue_id, Artist, 'artist', now, past_limit).all()
+  past_shows, upcoming_shows, next_show_time = show_history(history, 'artist')
+  venue_dict=venue_page(counts[0].Venue, counts[0], past_shows, upcoming_shows, past_limit)
+  html=render_template('pages/show_venue.html', venue=venue_dict)
+  if cacheable:
+    #the page goes stale once its next upcoming show becomes a past show
+    page_cache.set(('venue', venue_id), validators[0], (html, compression.keep_variants()), generation, expires=next_show_time)
+  return html
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
+  from forms import VenueForm
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
@@ -245,6 +989,7 @@ def create_venue_submission():
   try:
     db.session.add(new_venue)
     db.session.commit()
+    venue_names.update(new_venue.id, new_name=new_venue.name)
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
 
   except:
@@ -254,7 +999,7 @@ def create_venue_submission():
 
   finally:
     db.session.close()
-    return redirect(url_for('venues'))
+    return redirect(url_for('.venues'))
   
   # on successful db insert, flash success
   
@@ -263,23 +1008,25 @@ def create_venue_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-  status=False
+  #one statement deletes the venue and cascades to its shows, or only marks it deleted
   try:
-    venue=Venue.query.get(venue_id)
-    db.session.delete(venue)
-    status=True
-    flash('Venue was successfully deleted')
-
-  except:
-    db.session.rollback()
-    flash('Venue was not successfully deleted')
-  finally:
+    venue=remove_venue(venue_id, current_app.config['VENUE_SOFT_DELETE'], datetime.now())
     db.session.commit()
-    return render_template('pages/home.html')
+  except SQLAlchemyError:
+    db.session.rollback()
+    current_app.logger.exception('deleting venue %s failed', venue_id)
+    flash('Venue was not successfully deleted', category='error')
+    return render_template('pages/home.html'), 500
+  if venue is None:
+    abort(404)
+  invalidate_pages(venue_ids=[venue_id], artist_ids=venue.artist_ids)
+  venue_names.update(venue_id, old_name=venue.name)
+  flash('Venue was successfully deleted')
+  return render_template('pages/home.html')
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
@@ -287,87 +1034,69 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@read_only
 def artists():
-  # TODO: replace with real data returned from querying the database
-  artists=Artist.query.all()
-  data=[]
-  #creating a dictionary to store each artist in the table and to retrive them by id and name 
-  artist_dict={}
-  for artist in artists:
-    artist_dict={
-      'id': artist.id,
-      'name': artist.name
-    }
-    data.append(artist_dict)
-
-  return render_template('pages/artists.html', artists=data)
-
-@app.route('/artists/search', methods=['POST'])
+  genre=request.args.get('genre')
+  artists, page = paginate_keyset(filter_by_genre(db.session.query(Artist.id, Artist.name, Artist.updated_at), Artist, genre), Artist.id)
+  response=revalidate(listing_validators(artists, page))
+  if response is not None:
+    return response
+  return render_template('pages/artists.html', artists=artist_listing(artists), page=page, genre=genre)
+
+@bp.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
   search_term=get_value('search_term')
-  artist_response=Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-  response={
-    "count": len(artist_response),
-    "data": []
-  }
-
-  for artist in artist_response:
-    response["data"].append({
-      'id': artist.id,
-      'name':artist.name,
-      'num_upcomin_shows':len(artist.shows)
-    })
+  artist_response=search_by_name(Artist, search_term, request.values.get('genre')).all()
+  return render_template('pages/search_artists.html', results=search_results(artist_response), search_term=request.form.get('search_term', ''))
 
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
+@read_only
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  artists=Artist.query.get(artist_id)
-  past_shows=[]
-  upcoming_shows=[]
-  show_attributes=None
-  for show in artists.shows:
-    show_attributes={
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": show.start_time.strftime('%m/%d/%Y, %H:%M:%S')
-    }
-    if show.start_time <= datetime.now():
-      past_shows.append(show_attributes)
-    else:
-      upcoming_shows.append(show_attributes)
-  
-  artist_dict={
-    'id':artists.id,
-    'name':artists.name,
-    'genres':list(artists.genres),
-    'city':artists.city,
-    'state':artists.state,
-    'phone':artists.phone,
-    'website':artists.website,
-    'facebook':artists.facebook_link,
-    'seeking_venue':artists.seeking_venue,
-    'seeking_description':artists.seeking_talent,
-    'image_link':artists.image_link,
-    'past_shows':past_shows,
-    'upcoming_shows':upcoming_shows,
-    'past_show_count':len(past_shows),
-    'upcoming_show_count':len(upcoming_shows)
-
-  }
-  return render_template('pages/show_artist.html', artist=artist_dict)
+  # shows the artist page with the given artist_id, built from two queries:
+  # the artist with its show counts and validators, then its upcoming and recent
+  # past shows. A client revalidating its copy is answered from one timestamp
+  # query instead
+  generation=page_cache.generation()
+  now=datetime.now()
+  if revalidating():
+    counts=None
+    validators=entity_validators(entity_changes(Artist, Show.artist_id, Venue, artist_id, now).all())
+  else:
+    counts=with_show_counts(Artist, Show.artist_id, Venue, artist_id, now).all()
+    validators=entity_validators(counts)
+  if validators is None:
+    abort(404)
+  response=revalidate(validators)
+  if response is not None:
+    return response
+  cached, cacheable = cached_page(('artist', artist_id), validators)
+  if cached:
+    compression.keep_variants(cached[1])
+    return cached[0]
+  past_limit=past_shows_limit()
+  if counts is None:
+    counts=with_show_counts(Artist, Show.artist_id, Venue, artist_id, now).all()
+    if not counts:
+      abort(404)
+  history=show_history_query(Show.artist_id, artist_id, Venue, 'venue', now, past_limit).all()
+  past_shows, upcoming_shows, next_show_time = show_history(history, 'venue')
+  artist_dict=artist_page(counts[0].Artist, counts[0], past_shows, upcoming_shows, past_limit)
+  html=render_template('pages/show_artist.html', artist=artist_dict)
+  if cacheable:
+    #the page goes stale once its next upcoming show becomes a past show
+    page_cache.set(('artist', artist_id), validators[0], (html, compression.keep_variants()), generation, expires=next_show_time)
+  return html
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+  from forms import ArtistForm
   form = ArtistForm()
   artist=Artist.query.get(artist_id)
   # TODO: populate form with fields from artist with ID <artist_id>
@@ -384,13 +1113,15 @@ def edit_artist(artist_id):
   form.process()
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
+  from forms import ArtistForm
   form= ArtistForm()
   form.validate_on_submit()
   artist=Artist.query.get(artist_id)
+  old_name=artist.name
   try:
     artist.name=get_value('name')
     artist.genres=get_value('genres')
@@ -403,19 +1134,27 @@ def edit_artist_submission(artist_id):
     artist.facebook_link=get_value('facebook_link')
     artist.image_link=get_value('image_link')
     artist.website=get_value('website')
+    new_name=artist.name
     db.session.commit()
+    artist_names.update(artist_id, old_name, new_name)
+    #venue pages list the artist's name and image next to its shows
+    invalidate_pages(
+      venue_ids=[row.venue_id for row in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()],
+      artist_ids=[artist_id]
+    )
     flash('Artist was updated!!')
   except:
     db.session.rollback()
     flash('Artist was not updated!!')
   finally:
     db.session.close()
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    return redirect(url_for('.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+  from forms import VenueForm
   form = VenueForm()
-  venue=Venue.query.get(venue_id)
+  venue=Venue.query.filter_by(id=venue_id, deleted_at=None).first_or_404()
   form.name.default = venue.name
   form.city.default = venue.city
   form.state.default = venue.state
@@ -430,13 +1169,15 @@ def edit_venue(venue_id):
   # TODO: populate form with values from venue with ID <venue_id>
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
+  from forms import VenueForm
   form= VenueForm()
   form.validate_on_submit()
-  venue=Venue.query.get(venue_id)
+  venue=Venue.query.filter_by(id=venue_id, deleted_at=None).first_or_404()
+  old_name=venue.name
   try:
     venue.name = get_value('name')
     venue.genres = get_value('genres')
@@ -449,8 +1190,15 @@ def edit_venue_submission(venue_id):
     venue.seeking_description = get_value('seeking_description')
     venue.facebook_link = get_value('facebook_link')
     venue.image_link = get_value('image_link')
+    new_name=venue.name
 
     db.session.commit()
+    venue_names.update(venue_id, old_name, new_name)
+    #artist pages list the venue's name and image next to its shows
+    invalidate_pages(
+      venue_ids=[venue_id],
+      artist_ids=[row.artist_id for row in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+    )
     flash('Venue was successfully updated!!')
   except:
     db.session.rollback()
@@ -458,17 +1206,18 @@ def edit_venue_submission(venue_id):
 
   finally:
     db.session.close()
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    return redirect(url_for('.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
+  from forms import ArtistForm
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Venue record in the db, instead
@@ -488,6 +1237,7 @@ def create_artist_submission():
   try:
     db.session.add(new_artist)
     db.session.commit()
+    artist_names.update(new_artist.id, new_name=new_artist.name)
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
   except :
     db.session.rollback()
@@ -502,50 +1252,94 @@ def create_artist_submission():
   
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+@bp.route('/genres/<genre>')
+@read_only
+def show_genre(genre):
+  # venues and artists playing one genre, optionally in one state and city, both found
+  # through the GIN indexes on the genres arrays; the full lists are /venues and /artists?genre=
+  limit=current_app.config['SEARCH_RESULTS_LIMIT']
+  state=request.args.get('state')
+  city=request.args.get('city')
+  results={}
+  for name, model in (('venues', Venue), ('artists', Artist)):
+    query=filter_by_genre(db.session.query(
+      model.id,
+      model.name,
+      model.city,
+      model.state,
+      model.upcoming_show_count.label('num_upcoming_shows'),
+      db.func.count().over().label('total')
+    ), model, genre)
+    query=exclude_deleted(query, model)
+    if state:
+      query=query.filter(model.state == state)
+    if city:
+      query=query.filter(model.city == city)
+    rows=query.order_by(model.upcoming_show_count.desc(), model.name, model.id).limit(limit).all()
+    results[name]={
+      'count':rows[0].total if rows else 0,
+      'data':rows
+    }
+  return render_template('pages/genre.html', genre=genre, state=state, city=city, venues=results['venues'], artists=results['artists'])
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
+@read_only
 def shows():
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #  
-  #     num_shows should be aggregated based on number of upcoming shows per venue.
-
-  shows_query = db.session.query(Show).join(Artist).join(Venue).all()
-
-  data = []
-  for show in shows_query: 
-    data.append({
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "artist_id": show.artist_id,
-      "artist_name": show.artist.name, 
-      "artist_image_link": show.artist.image_link,
-      "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-    })
-  
-  return render_template('pages/shows.html', shows=data)
-
-@app.route('/shows/create')
+  rows, page = paginate_keyset(shows_with_names(), Show.id)
+  response=revalidate(listing_validators(rows, page))
+  if response is not None:
+    return response
+  return render_template('pages/shows.html', shows=show_listing(rows), page=page)
+
+# keyed by the entity of the booking constraint of a Show partition, see booking_constraint
+BOOKING_CONFLICTS = {
+  'venue': 'The venue is already booked at that time. Show could not be listed.',
+  'artist': 'The artist is already booked at that time. Show could not be listed.',
+}
+
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
+  from forms import ShowForm
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
-  new_show=Show(
-    venue_id=get_value('venue_id'),
-    artist_id =get_value('artist_id'),
-    start_time=get_value('start_time')
-  )
   try:
-    db.session.add(new_show)
-    db.session.commit()
-    flash('Show was successfully listed!')
+    venue_id=int(get_value('venue_id'))
+    artist_id=int(get_value('artist_id'))
+    #booked like a recurring show, so that an overlap across a month boundary is found too
+    bookings=book_shows(venue_id, artist_id, [parse_datetime(get_value('start_time'))],
+      request.form.get('duration_minutes', SHOW_DURATION_MINUTES, type=int), False, datetime.now())
+    if bookings is None:
+      db.session.rollback()
+      flash('The venue or the artist does not exist. Show could not be listed.', category='error')
+    elif bookings[0].id is None:
+      db.session.rollback()
+      flash(BOOKING_CONFLICTS['venue' if bookings[0].venue_booked else 'artist'], category='error')
+    else:
+      db.session.commit()
+      invalidate_pages(venue_ids=[venue_id], artist_ids=[artist_id])
+      flash('Show was successfully listed!')
+  except IntegrityError as error:
+    #the booking exclusion constraints reject a show booked concurrently at the same time
+    db.session.rollback()
+    entity=booking_constraint(getattr(getattr(error.orig, 'diag', None), 'constraint_name', None))
+    if entity:
+      flash(BOOKING_CONFLICTS[entity], category='error')
+    else:
+      flash('An error occurred. Show could not be listed.')
   except:
     db.session.rollback()
     flash('An error occurred. Show could not be listed.')
@@ -559,24 +1353,409 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   
 
-@app.errorhandler(404)
+#  Recurring Shows
+#  ----------------------------------------------------------------
+
+def recurring_booking(form):
+  # books the shows of a validated RecurringShowForm, in one statement and one transaction;
+  # returns (a row per date, None) or (None, (error message, status code))
+  limit=current_app.config['RECURRING_SHOWS_LIMIT']
+  start_times=recurring_start_times(form.start_time.data, form.frequency.data, form.interval.data or 1, form.until.data, limit)
+  if start_times is None:
+    return None, (f'A recurring booking can list at most {limit} shows.', 400)
+  if not start_times:
+    return None, ('The last date is before the first show.', 400)
+  try:
+    rows=book_shows(form.venue_id.data, form.artist_id.data, start_times,
+      form.duration_minutes.data or SHOW_DURATION_MINUTES, form.skip_conflicts.data, datetime.now())
+    if rows is None:
+      db.session.rollback()
+      return None, ('The venue or the artist does not exist. No show was listed.', 400)
+    db.session.commit()
+  except IntegrityError as error:
+    #the dates were free when checked, but a show booked concurrently took one of them
+    db.session.rollback()
+    if booking_constraint(getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)):
+      return None, ('The venue or the artist was booked for one of the dates meanwhile. No show was listed.', 409)
+    return None, ('The venue or the artist does not exist. No show was listed.', 400)
+  if any(row.id is not None for row in rows):
+    invalidate_pages(venue_ids=[form.venue_id.data], artist_ids=[form.artist_id.data])
+  return rows, None
+
+def booking_summary(rows):
+  return {
+    'listed': [{'id': row.id, 'start_time': row.start_time.isoformat()} for row in rows if row.id is not None],
+    'conflicts': [
+      {'start_time': row.start_time.isoformat(), 'venue_booked': row.venue_booked, 'artist_booked': row.artist_booked}
+      for row in rows if row.venue_booked or row.artist_booked
+    ],
+  }
+
+@bp.route('/shows/recurring')
+def create_recurring_shows():
+  from forms import RecurringShowForm
+  form = RecurringShowForm()
+  return render_template('forms/new_recurring_show.html', form=form)
+
+@bp.route('/shows/recurring', methods=['POST'])
+def create_recurring_shows_submission():
+  # lists a show on every date of a residency, or reports the dates already taken
+  from forms import RecurringShowForm
+  form = RecurringShowForm()
+  if not form.validate_on_submit():
+    return render_template('forms/new_recurring_show.html', form=form), 400
+  rows, error = recurring_booking(form)
+  if error:
+    message, status = error
+    flash(message, category='error')
+    return render_template('forms/new_recurring_show.html', form=form), status
+  summary=booking_summary(rows)
+  if summary['listed']:
+    flash(f"{len(summary['listed'])} shows were successfully listed!")
+  else:
+    flash(f"{len(summary['conflicts'])} of the dates are taken. No show was listed.", category='error')
+  return render_template('forms/new_recurring_show.html', form=form, bookings=rows)
+
+@bp.route('/api/shows/recurring', methods=['POST'])
+def recurring_shows_api():
+  # the same booking from a JSON object with the fields of RecurringShowForm; answers 201 with
+  # the listed shows and the skipped dates, or 409 with the taken dates if none was listed
+  from forms import RecurringShowForm
+  from importer import to_formdata
+  record=request.get_json(silent=True)
+  if not isinstance(record, dict):
+    abort(400)
+  form=RecurringShowForm(formdata=to_formdata(record, RecurringShowForm), meta={'csrf': False})
+  if not form.validate():
+    return jsonify({'errors': form.errors}), 400
+  rows, error = recurring_booking(form)
+  if error:
+    message, status = error
+    return jsonify({'errors': {'shows': [message]}}), status
+  summary=booking_summary(rows)
+  return jsonify(summary), 201 if summary['listed'] else 409
+
+#  Availability
+#  ----------------------------------------------------------------
+
+@bp.route('/availability')
+@read_only
+def availability():
+  # venues with no show overlapping the requested time range; the NOT EXISTS probes the
+  # GiST indexes behind the venue booking constraints once per venue in the area, only in
+  # the partitions of the shows that can overlap the range
+  city=request.args.get('city')
+  state=request.args.get('state')
+  genre=request.args.get('genre')
+  if not request.args.get('from') or not request.args.get('to'):
+    return render_template('pages/availability.html', venues=None, page=None, city=city, state=state, genre=genre)
+  try:
+    start=parse_datetime(request.args['from'])
+    end=parse_datetime(request.args['to'])
+  except (ValueError, OverflowError):
+    abort(400)
+  if end <= start:
+    abort(400)
+
+  booked=db.session.query(Show.id)\
+    .filter(Show.venue_id == Venue.id, ~Show.cancelled, show_period().op('&&')(db.func.tsrange(start, end)),
+      Show.start_time > start - timedelta(minutes=SHOW_MAX_DURATION_MINUTES), Show.start_time < end)
+  query=filter_by_genre(db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.address), Venue, genre)\
+    .filter(Venue.deleted_at.is_(None), ~booked.exists())
+  if city:
+    query=query.filter(Venue.city == city)
+  if state:
+    query=query.filter(Venue.state == state)
+  venues, page = paginate_keyset(query, Venue.id)
+  return render_template('pages/availability.html', venues=venues, page=page, city=city, state=state, genre=genre, start=start, end=end)
+
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+AUTOCOMPLETE_INDEXES = {'venues': (venue_names, '.show_venue', 'venue_id'), 'artists': (artist_names, '.show_artist', 'artist_id')}
+
+@bp.route('/api/autocomplete')
+def autocomplete():
+  # venue and artist names with a word starting with q, from the in-process name indexes;
+  # ?type=venues or ?type=artists asks for one of the two
+  query=request.args.get('q', '')
+  limit=max(1, min(request.args.get('limit', current_app.config['AUTOCOMPLETE_LIMIT'], type=int), current_app.config['AUTOCOMPLETE_MAX_LIMIT']))
+  kinds=[request.args['type']] if 'type' in request.args else list(AUTOCOMPLETE_INDEXES)
+  if any(kind not in AUTOCOMPLETE_INDEXES for kind in kinds):
+    abort(400)
+  results={}
+  for kind in kinds:
+    index, endpoint, argument = AUTOCOMPLETE_INDEXES[kind]
+    index.ensure_current(current_app._get_current_object())
+    results[kind]=[{'id': entity_id, 'name': name, 'url': url_for(endpoint, **{argument: entity_id})} for entity_id, name in index.search(query, limit)]
+  return jsonify(results)
+
+#  Export API
+#  ----------------------------------------------------------------
+
+EXPORT_MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+
+def export_value(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  return value
+
+@bp.route('/api/export/<entity>')
+@read_only
+def export_entity(entity):
+  # streams every row of a table as NDJSON or CSV, rows are pulled from a server-side
+  # cursor in batches and written out batch by batch so memory stays constant
+  model = EXPORT_MODELS.get(entity)
+  export_format = request.args.get('format', 'ndjson')
+  if model is None:
+    abort(404)
+  if export_format not in ('ndjson', 'csv'):
+    abort(400)
+
+  columns = list(model.__table__.columns)
+  names = [column.name for column in columns]
+  query = db.session.query(*columns).order_by(model.id)
+  updated_since = request.args.get('updated_since')
+  if updated_since:
+    try:
+      query = query.filter(model.updated_at > utc_datetime(parse_datetime(updated_since)))
+    except (ValueError, OverflowError):
+      abort(400)
+  batch_size = current_app.config['EXPORT_BATCH_SIZE']
+
+  def generate():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == 'csv' else None
+    if writer:
+      writer.writerow(names)
+    for number, row in enumerate(query.yield_per(batch_size), 1):
+      values = [export_value(value) for value in row]
+      if writer:
+        #multi-valued columns such as genres are written as one ;-separated cell
+        writer.writerow([';'.join(value) if isinstance(value, list) else value for value in values])
+      else:
+        buffer.write(json.dumps(dict(zip(names, values))) + '\n')
+      if number % batch_size == 0:
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+  mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+  return Response(stream_with_context(generate()), mimetype=mimetype,
+    headers={'Content-Disposition': f'attachment; filename={entity}.{export_format}'})
+
+#  Assets
+#  ----------------------------------------------------------------
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+  # a bundle named after its content never changes, so browsers may keep it for good
+  if not assets.exists(filename):
+    abort(404)
+  return send_bundle(assets.directory, filename, current_app.config['ASSETS_MAX_AGE'])
+
+#  Health
+#  ----------------------------------------------------------------
+
+@bp.route('/healthz')
+def healthz():
+  # database liveness plus the live checkout/overflow numbers of the connection pool
+  try:
+    db.session.execute(db.text('SELECT 1'))
+    database, code = 'ok', 200
+  except Exception as error:
+    db.session.rollback()
+    database, code = f'error: {error.__class__.__name__}', 503
+  status = pool_status(db.engine.pool)
+  status['database'] = database
+  return jsonify(status), code
+
+@bp.route('/metrics')
+def metrics():
+  return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+class explain(Executable, ClauseElement):
+  def __init__(self, statement):
+    self.statement = statement
+
+@compiles(explain, 'postgresql')
+def compile_explain(element, compiler, **kw):
+  return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+def plan_nodes(plan, key):
+  # the values of <key> in every node of an EXPLAIN plan
+  values = {plan[key]} if key in plan else set()
+  for child in plan.get('Plans', []):
+    values |= plan_nodes(child, key)
+  return values
+
+INDEX_ROOTS = db.text('''
+  SELECT index.relname, root.relname AS root
+  FROM pg_class AS index JOIN pg_class AS root ON root.oid = COALESCE(pg_partition_root(index.oid), index.oid)
+  WHERE index.relname = ANY(:names)
+''')
+
+def plan_indexes(plan):
+  # names of every index read anywhere in an EXPLAIN plan, the indexes of the Show partitions
+  # under the name of the index of "Show" they belong to
+  names = plan_nodes(plan, 'Index Name')
+  if not names:
+    return names
+  roots = dict(db.session.execute(INDEX_ROOTS, {'names': list(names)}).fetchall())
+  indexes = set()
+  for name in names:
+    entity = booking_constraint(name)
+    indexes.add(f'ex_Show_{entity}_booking' if entity else roots.get(name, name))
+  return indexes
+
+@bp.cli.command('check-indexes')
+def check_indexes():
+  """EXPLAIN the route queries and check they are served by the Show and Venue indexes."""
+  now = datetime.now()
+  entity_id = 1
+  checks = [
+    ('venues', venues_with_upcoming_counts().order_by(*VENUE_LISTING_KEY).limit(current_app.config['PAGE_SIZE']), 'ix_Venue_city_state'),
+    ('venue search', search_by_name(Venue, 'music'), 'ix_Venue_name_trgm'),
+    ('show_venue', show_history_query(Show.venue_id, entity_id, Artist, 'artist', now, current_app.config['PAST_SHOWS_LIMIT']), 'ix_Show_venue_id_start_time'),
+    ('show_artist', show_history_query(Show.artist_id, entity_id, Venue, 'venue', now, current_app.config['PAST_SHOWS_LIMIT']), 'ix_Show_artist_id_start_time'),
+    ('upcoming shows', Show.query.filter(Show.start_time > now).order_by(Show.start_time).limit(current_app.config['PAGE_SIZE']), 'ix_Show_start_time'),
+    ('passed shows', Show.query.filter(Show.counted_upcoming, Show.start_time <= now), 'ix_Show_counted_upcoming_start_time'),
+    ('venue areas', exclude_deleted(Venue.query, Venue).filter(Venue.city == 'San Francisco', Venue.state == 'CA'), 'ix_Venue_city_state'),
+    ('genre venues', filter_by_genre(exclude_deleted(Venue.query, Venue), Venue, 'Jazz'), 'ix_Venue_genres'),
+    ('deleted venues', Venue.query.filter(Venue.deleted_at < now).order_by(Venue.deleted_at), 'ix_Venue_deleted_at'),
+    ('genre artists', filter_by_genre(Artist.query, Artist, 'Jazz'), 'ix_Artist_genres'),
+    ('venue bookings', Show.query.filter(Show.venue_id == entity_id, ~Show.cancelled, show_period().op('&&')(db.func.tsrange(now, None))), 'ex_Show_venue_booking'),
+  ]
+  # small development tables are cheaper to scan than to index, turn sequential
+  # scans off so the plan shows what the planner picks once the tables are large
+  db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+  failed = False
+  for name, query, index in checks:
+    plan = db.session.execute(explain(query.statement)).scalar()[0]['Plan']
+    indexes = plan_indexes(plan)
+    if index not in indexes:
+      failed = True
+    click.echo(f"{'ok' if index in indexes else 'MISSING':8}{name}: expected {index}, plan uses {', '.join(sorted(indexes)) or 'no index'}")
+  # and the upcoming shows only read the partitions from this month on
+  plan = db.session.execute(explain(Show.query.filter(Show.start_time > now).statement)).scalar()[0]['Plan']
+  months = {name: partition_month(name) for name in plan_nodes(plan, 'Relation Name')}
+  past = sorted(name for name, month in months.items() if month and month < month_start(now))
+  if past:
+    failed = True
+  click.echo(f"{'MISSING' if past else 'ok':8}upcoming shows pruning: expected no past partition, plan reads {', '.join(past) or 'none'}")
+  # the shows of one month only read its partition, not the default one
+  month = month_start(now)
+  plan = db.session.execute(explain(Show.query.filter(Show.start_time >= month, Show.start_time < add_months(month, 1)).statement)).scalar()[0]['Plan']
+  read = sorted(plan_nodes(plan, 'Relation Name'))
+  if read != [partition_name(month)]:
+    failed = True
+  click.echo(f"{'ok' if read == [partition_name(month)] else 'MISSING':8}month pruning: expected {partition_name(month)}, plan reads {', '.join(read) or 'none'}")
+  # every query on "Show" reads the default partition, and it can't be detached
+  shows = default_shows(db.session)
+  if shows:
+    failed = True
+  click.echo(f"{'MISSING' if shows else 'ok':8}default partition: expected no shows, holds {shows}; `flask show-partitions` moves them out")
+  db.session.rollback()
+  if failed:
+    sys.exit(1)
+
+@bp.cli.command('roll-show-counters')
+def roll_show_counters_command():
+  """Stop counting shows that have started as upcoming, meant to be run periodically."""
+  passed = roll_show_counters(datetime.now())
+  db.session.commit()
+  click.echo(f'{passed} shows moved from upcoming to past')
+
+@bp.cli.command('reconcile-show-counters')
+@click.option('--dry-run', is_flag=True, help='Report drift without fixing it.')
+def reconcile_show_counters_command(dry_run):
+  """Recompute every upcoming_show_count from the Show table and report drift."""
+  flags, drift = reconcile_show_counters(datetime.now())
+  click.echo(f'{flags} show flags out of date')
+  for table, rows in drift.items():
+    total = sum(abs(row.stored - row.actual) for row in rows)
+    click.echo(f'{table}: {len(rows)} counters drifted, total drift {total}')
+    for row in rows[:10]:
+      click.echo(f'  {table} {row.id}: stored {row.stored}, actual {row.actual}')
+  if dry_run:
+    db.session.rollback()
+  else:
+    db.session.commit()
+
+@bp.cli.command('purge-venues')
+@click.option('--older-than', type=int, help='Days since the soft delete, VENUE_PURGE_AFTER_DAYS by default.')
+@click.option('--batch-size', default=500, show_default=True, help='Venues archived per transaction.')
+def purge_venues_command(older_than, batch_size):
+  """Move venues soft-deleted a while ago and their shows to VenueArchive, in batches."""
+  days = current_app.config['VENUE_PURGE_AFTER_DAYS'] if older_than is None else older_than
+  cutoff = datetime.now() - timedelta(days=days)
+  venues = shows = 0
+  while True:
+    # one short transaction per batch, so the app's writes never wait long on the purge
+    batch = purge_venues(cutoff, batch_size)
+    db.session.commit()
+    venues += batch.venues
+    shows += batch.shows
+    if batch.venues < batch_size:
+      break
+  click.echo(f'{venues} venues and {shows} shows archived')
+
+@bp.cli.command('show-partitions')
+@click.option('--months-ahead', type=int, help='Months to create partitions for, SHOW_PARTITION_MONTHS_AHEAD by default.')
+@click.option('--keep-months', type=int, help='Past months to keep attached, SHOW_PARTITION_KEEP_MONTHS by default; 0 keeps all.')
+def show_partitions_command(months_ahead, keep_months):
+  """Create the monthly Show partitions ahead of time and detach the old ones, meant to be run periodically."""
+  created, detached = maintain_partitions(
+    db.session,
+    datetime.now(),
+    current_app.config['SHOW_PARTITION_MONTHS_AHEAD'] if months_ahead is None else months_ahead,
+    current_app.config['SHOW_PARTITION_KEEP_MONTHS'] if keep_months is None else keep_months,
+  )
+  db.session.commit()
+  click.echo(f"{len(created)} partitions created{': ' + ', '.join(created) if created else ''}")
+  click.echo(f"{len(detached)} partitions detached{': ' + ', '.join(detached) if detached else ''}")
+
+@bp.cli.command('assets')
+@click.option('--clean', is_flag=True, help='Delete the files of earlier builds.')
+def assets_command(clean):
+  """Bundle, fingerprint and precompress the stylesheets and scripts of the layouts."""
+  built = build(current_app.static_folder, current_app.static_url_path, clean)
+  for bundle, (filename, sizes) in built.items():
+    compressed = ', '.join(f'{encoding} {sizes[encoding]}' for encoding in ('gzip', 'br') if encoding in sizes)
+    click.echo(f"{bundle:10}{filename}: {sizes['sources']} bytes in {len(BUNDLES[bundle])} files -> {sizes['bundle']} bytes, {compressed}")
+  click.echo('restart the app to serve the new bundles')
+
+@bp.cli.command('import')
+@click.argument('entity', type=click.Choice(sorted(EXPORT_MODELS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per COPY batch and transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False), help='Write rejected rows to this NDJSON file.')
+def import_command(entity, path, batch_size, rejects):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+  from importer import Importer
+  importer = Importer(db, {'venues': Venue, 'artists': Artist, 'shows': Show}, entity, batch_size)
+  loaded, rejected = importer.run(path)
+  for reject in rejected[:20]:
+    click.echo(f"line {reject['line']}: {json.dumps(reject['errors'])}", err=True)
+  if rejects:
+    with open(rejects, 'w') as output:
+      for reject in rejected:
+        output.write(json.dumps(reject, default=str) + '\n')
+  click.echo(f'{loaded} {entity} loaded, {len(rejected)} rejected')
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -584,11 +1763,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,292 @@
+import asyncio
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort, render_template, request
+from werkzeug.exceptions import HTTPException
+
+from app import create_app, db, page_cache, request_metrics, compression, Venue, Artist, Show, \
+  filter_by_genre, search_by_name, search_results, venues_with_upcoming_counts, venue_areas, VENUE_LISTING_KEY, \
+  artist_listing, shows_with_names, show_listing, with_show_counts, show_history_query, \
+  show_history, venue_page, artist_page, cached_page, keyset_query, keyset_page, get_value, \
+  entity_changes, entity_validators, listing_validators, revalidating, revalidate, past_shows_limit
+from database import AsyncDatabase
+
+#----------------------------------------------------------------------------#
+# ASGI entry point.
+#
+#   uvicorn asgi:application --workers 4
+#
+# The listings, the searches and the venue and artist pages are served here
+# with their queries awaited on an asyncpg pool, so a worker keeps serving
+# other requests while one waits on the database. Every other route goes to
+# the WSGI app in a thread.
+#
+# The views below build the same queries as the views in app.py and render
+# the same templates. A view is a generator: it yields the queries it needs,
+# which run concurrently, and gets their rows back.
+#----------------------------------------------------------------------------#
+
+database = AsyncDatabase()
+
+def venues():
+  genre=request.args.get('genre')
+  [rows] = yield [keyset_query(filter_by_genre(venues_with_upcoming_counts(), Venue, genre), *VENUE_LISTING_KEY)]
+  rows, page = keyset_page(rows, *VENUE_LISTING_KEY)
+  response=revalidate(listing_validators(rows, page))
+  if response is not None:
+    return response
+  return render_template('pages/venues.html', areas=venue_areas(rows), page=page, genre=genre)
+
+def search_venues():
+  [rows] = yield [search_by_name(Venue, get_value('search_term'), request.values.get('genre'))]
+  return render_template('pages/search_venues.html', results=search_results(rows), search_term=request.form.get('search_term', ''))
+
+def show_venue(venue_id):
+  generation=page_cache.generation()
+  now=datetime.now()
+  if revalidating():
+    counts=None
+    [changes] = yield [entity_changes(Venue, Show.venue_id, Artist, venue_id, now)]
+    validators=entity_validators(changes)
+  else:
+    [counts] = yield [with_show_counts(Venue, Show.venue_id, Artist, venue_id, now)]
+    validators=entity_validators(counts)
+  if validators is None:
+    abort(404)
+  response=revalidate(validators)
+  if response is not None:
+    return response
+  cached, cacheable = cached_page(('venue', venue_id), validators)
+  if cached:
+    compression.keep_variants(cached[1])
+    return cached[0]
+  past_limit=past_shows_limit()
+  if counts is None:
+    counts, history = yield [
+      with_show_counts(Venue, Show.venue_id, Artist, venue_id, now),
+      show_history_query(Show.venue_id, venue_id, Artist, 'artist', now, past_limit)
+    ]
+    if not counts:
+      abort(404)
+  else:
+    [history] = yield [show_history_query(Show.venue_id, venue_id, Artist, 'artist', now, past_limit)]
+  past_shows, upcoming_shows, next_show_time = show_history(history, 'artist')
+  html=render_template('pages/show_venue.html', venue=venue_page(counts[0], counts[0], past_shows, upcoming_shows, past_limit))
+  if cacheable:
+    page_cache.set(('venue', venue_id), validators[0], (html, compression.keep_variants()), generation, expires=next_show_time)
+  return html
+
+def artists():
+  genre=request.args.get('genre')
+  [rows] = yield [keyset_query(filter_by_genre(db.session.query(Artist.id, Artist.name, Artist.updated_at), Artist, genre), Artist.id)]
+  rows, page = keyset_page(rows, Artist.id)
+  response=revalidate(listing_validators(rows, page))
+  if response is not None:
+    return response
+  return render_template('pages/artists.html', artists=artist_listing(rows), page=page, genre=genre)
+
+def search_artists():
+  [rows] = yield [search_by_name(Artist, get_value('search_term'), request.values.get('genre'))]
+  return render_template('pages/search_artists.html', results=search_results(rows), search_term=request.form.get('search_term', ''))
+
+def show_artist(artist_id):
+  generation=page_cache.generation()
+  now=datetime.now()
+  if revalidating():
+    counts=None
+    [changes] = yield [entity_changes(Artist, Show.artist_id, Venue, artist_id, now)]
+    validators=entity_validators(changes)
+  else:
+    [counts] = yield [with_show_counts(Artist, Show.artist_id, Venue, artist_id, now)]
+    validators=entity_validators(counts)
+  if validators is None:
+    abort(404)
+  response=revalidate(validators)
+  if response is not None:
+    return response
+  cached, cacheable = cached_page(('artist', artist_id), validators)
+  if cached:
+    compression.keep_variants(cached[1])
+    return cached[0]
+  past_limit=past_shows_limit()
+  if counts is None:
+    counts, history = yield [
+      with_show_counts(Artist, Show.artist_id, Venue, artist_id, now),
+      show_history_query(Show.artist_id, artist_id, Venue, 'venue', now, past_limit)
+    ]
+    if not counts:
+      abort(404)
+  else:
+    [history] = yield [show_history_query(Show.artist_id, artist_id, Venue, 'venue', now, past_limit)]
+  past_shows, upcoming_shows, next_show_time = show_history(history, 'venue')
+  html=render_template('pages/show_artist.html', artist=artist_page(counts[0], counts[0], past_shows, upcoming_shows, past_limit))
+  if cacheable:
+    page_cache.set(('artist', artist_id), validators[0], (html, compression.keep_variants()), generation, expires=next_show_time)
+  return html
+
+def shows():
+  [rows] = yield [keyset_query(shows_with_names(), Show.id)]
+  rows, page = keyset_page(rows, Show.id)
+  response=revalidate(listing_validators(rows, page))
+  if response is not None:
+    return response
+  return render_template('pages/shows.html', shows=show_listing(rows), page=page)
+
+# endpoint -> async view, for the routes registered in app.py
+ASYNC_VIEWS = {
+  'fyyur.venues': venues,
+  'fyyur.search_venues': search_venues,
+  'fyyur.show_venue': show_venue,
+  'fyyur.artists': artists,
+  'fyyur.search_artists': search_artists,
+  'fyyur.show_artist': show_artist,
+  'fyyur.shows': shows,
+}
+
+#----------------------------------------------------------------------------#
+# Application.
+#----------------------------------------------------------------------------#
+
+def build_environ(scope, body):
+  # the WSGI environ of an ASGI http request, for Flask's request context
+  server = scope.get('server') or ('localhost', 80)
+  environ = {
+    'REQUEST_METHOD': scope['method'],
+    'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+    'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+    'QUERY_STRING': scope['query_string'].decode('latin1'),
+    'SERVER_NAME': server[0],
+    'SERVER_PORT': str(server[1]),
+    'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+    'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': scope.get('scheme', 'http'),
+    'wsgi.input': BytesIO(body),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': True,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+  }
+  for name, value in scope['headers']:
+    name = name.decode('latin1').upper().replace('-', '_')
+    if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+      name = 'HTTP_' + name
+    value = value.decode('latin1')
+    environ[name] = f'{environ[name]},{value}' if name in environ else value
+  return environ
+
+async def read_body(receive):
+  body = b''
+  while True:
+    message = await receive()
+    body += message.get('body', b'')
+    if not message.get('more_body'):
+      return body
+
+@contextmanager
+def pushed(contexts):
+  for context in contexts:
+    context.push()
+  try:
+    yield
+  finally:
+    for context in reversed(contexts):
+      context.pop()
+
+
+class Application:
+  '''
+  ASGI application serving the views in ASYNC_VIEWS with their queries run
+  on <database>, and everything else with the WSGI app <app>.
+  '''
+
+  def __init__(self, app, database, views):
+    self.app = app
+    self.database = database
+    self.views = views
+    self.urls = app.url_map.bind('localhost')
+    self.wsgi = WsgiToAsgi(app)
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      return await self.lifespan(receive, send)
+    view = self.async_view(scope) if scope['type'] == 'http' else None
+    if view is None:
+      return await self.wsgi(scope, receive, send)
+    response = await self.respond(view, build_environ(scope, await read_body(receive)))
+    await send({
+      'type': 'http.response.start',
+      'status': response.status_code,
+      'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.to_wsgi_list()],
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message['type'] == 'lifespan.startup':
+        await self.database.connect()
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        await self.database.close()
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+  def async_view(self, scope):
+    try:
+      endpoint, _ = self.urls.match(scope['path'], scope['method'])
+    except HTTPException:
+      # 404s, 405s and redirects are left to the WSGI app
+      return None
+    return self.views.get(endpoint)
+
+  async def respond(self, view, environ):
+    # Werkzeug keeps the Flask contexts per thread, and other requests run on this thread
+    # while one awaits its queries, so the contexts are pushed around each synchronous
+    # step of the request and popped again before every await
+    contexts = (self.app.app_context(), self.app.request_context(environ))
+    steps = self.dispatch(view)
+    results = error = None
+    statements, elapsed = 0, 0.0
+    try:
+      while True:
+        with pushed(contexts):
+          request_metrics.record_statements(statements, elapsed)
+          queries, rv = self.advance(steps, results, error)
+          if queries is None:
+            return self.app.finalize_request(rv)
+        started = time.perf_counter()
+        try:
+          results, error = await asyncio.gather(*[self.database.fetch(query) for query in queries]), None
+        except Exception as raised:
+          results, error = None, raised
+        statements, elapsed = len(queries), time.perf_counter() - started
+    except Exception as raised:
+      with pushed(contexts):
+        return self.app.handle_exception(raised)
+
+  def dispatch(self, view):
+    # the whole request as one generator: the before_request functions, then the view
+    rv = self.app.preprocess_request()
+    if rv is None:
+      rv = yield from view(**request.view_args)
+    return rv
+
+  def advance(self, steps, results, error):
+    # runs the request up to the next queries it yields and returns (queries, None), or
+    # (None, its return value) once the view has returned or raised an HTTP error
+    try:
+      return (steps.throw(error) if error is not None else steps.send(results)), None
+    except StopIteration as done:
+      return None, done.value
+    except Exception as raised:
+      return None, self.app.handle_user_exception(raised)
+
+app = create_app()
+database.init_app(app)
+application = Application(app, database, ASYNC_VIEWS)
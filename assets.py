@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import request, send_from_directory
+
+#----------------------------------------------------------------------------#
+# Static asset bundles.
+#
+# `flask assets` concatenates the stylesheets and scripts of the layouts
+# into one file per bundle, minifies the CSS, names every bundle after a
+# hash of its content and writes gzip and brotli copies next to it. The
+# names are recorded in a manifest the app reads at startup; until a build
+# exists the layouts link the source files one by one.
+#----------------------------------------------------------------------------#
+
+# bundle name -> source files under static/, in the order the browser runs them
+BUNDLES = {
+  'main.css': [
+    'css/bootstrap.min.css',
+    'css/layout.main.css',
+    'css/main.css',
+    'css/main.responsive.css',
+    'css/main.quickfix.css',
+  ],
+  # loaded synchronously in <head>
+  'head.js': [
+    'js/libs/modernizr-2.8.2.min.js',
+    'js/libs/moment.min.js',
+  ],
+  # deferred, after jQuery
+  'main.js': [
+    'js/script.js',
+    'js/libs/bootstrap-3.1.1.min.js',
+    'js/plugins.js',
+  ],
+}
+
+BUILD_DIRECTORY = 'build'
+MANIFEST = 'manifest.json'
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+?)\1\s*\)''')
+# strings and comments, which the CSS minifier leaves alone or drops whole
+CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/)''', re.S)
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+SOURCE_MAP = re.compile(r'^[/*#@ ]*sourceMappingURL=.*$', re.M)
+# a name fingerprinted() gives a bundle, of the current build or an earlier one
+FINGERPRINTED = re.compile(r'^([\w-]+)\.[0-9a-f]{12}(\.\w+)$')
+
+
+def absolute_css_urls(css, source_url):
+  # the bundle lives in another directory than its sources, so relative url()s are made absolute
+  def absolute(match):
+    quote, url = match.groups()
+    if url.startswith(('/', 'data:', 'http:', 'https:', '#')):
+      return match.group(0)
+    return f'url({quote}{posixpath.normpath(posixpath.join(posixpath.dirname(source_url), url))}{quote})'
+  return CSS_URL.sub(absolute, css)
+
+def minify_css(css):
+  # drops comments, except /*! licence */ ones, and the whitespace around punctuation;
+  # strings are copied untouched, whitespace in them is significant
+  parts, plain = [], []
+  def flush():
+    text = CSS_PUNCTUATION.sub(r'\1', re.sub(r'\s+', ' ', ' '.join(plain)))
+    parts.append(re.sub(r':\s', ':', text).replace(';}', '}'))
+    plain.clear()
+  for position, token in enumerate(CSS_TOKENS.split(css)):
+    if not position % 2:
+      plain.append(token)
+    elif token.startswith('/*') and not token.startswith('/*!'):
+      plain.append(' ')
+    else:
+      flush()
+      parts.append(token)
+  flush()
+  return ''.join(parts).strip()
+
+def bundle_content(bundle, static_folder, static_url_path):
+  sources = []
+  for source in BUNDLES[bundle]:
+    with open(os.path.join(static_folder, source), encoding='utf-8') as source_file:
+      content = SOURCE_MAP.sub('', source_file.read())
+    if bundle.endswith('.css'):
+      # an @charset is only valid at the very start of a stylesheet
+      content = re.sub(r'@charset [^;]+;', '', absolute_css_urls(content, f'{static_url_path}/{source}'))
+    sources.append(content)
+  if bundle.endswith('.css'):
+    return minify_css('\n'.join(sources))
+  # a script ending without a semicolon must not run into the next one
+  return '\n;\n'.join(sources)
+
+def fingerprinted(bundle, content):
+  name, extension = os.path.splitext(bundle)
+  return f'{name}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+
+def is_fingerprinted(filename):
+  match = FINGERPRINTED.match(filename)
+  return match is not None and match[1] + match[2] in BUNDLES
+
+def compressed_copies(path, content):
+  # writes <path>.gz and, if the brotli module is installed, <path>.br; returns their sizes
+  sizes = {}
+  with open(path + '.gz', 'wb') as output:
+    output.write(gzip.compress(content, compresslevel=9, mtime=0))
+  sizes['gzip'] = os.path.getsize(path + '.gz')
+  try:
+    import brotli
+  except ImportError:
+    return sizes
+  with open(path + '.br', 'wb') as output:
+    output.write(brotli.compress(content, quality=11))
+  sizes['br'] = os.path.getsize(path + '.br')
+  return sizes
+
+def send_bundle(directory, filename, max_age):
+  # the brotli or gzip copy of a bundle, whichever the client prefers, or the bundle itself
+  mimetype = mimetypes.guess_type(filename)[0]
+  suffixes = {'br': '.br', 'gzip': '.gz'}
+  available = [encoding for encoding, suffix in suffixes.items() if os.path.exists(os.path.join(directory, filename + suffix))]
+  encoding = request.accept_encodings.best_match(available)
+  if encoding is not None:
+    response = send_from_directory(directory, filename + suffixes[encoding], mimetype=mimetype)
+    response.headers['Content-Encoding'] = encoding
+  else:
+    response = send_from_directory(directory, filename, mimetype=mimetype)
+  response.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+  response.vary.add('Accept-Encoding')
+  return response
+
+def build(static_folder, static_url_path, clean=False):
+  # builds every bundle and writes the manifest; returns {bundle: (filename, sizes)}
+  directory = os.path.join(static_folder, BUILD_DIRECTORY)
+  os.makedirs(directory, exist_ok=True)
+  manifest = {}
+  built = {}
+  for bundle in BUNDLES:
+    content = bundle_content(bundle, static_folder, static_url_path).encode('utf-8')
+    filename = fingerprinted(bundle, content)
+    path = os.path.join(directory, filename)
+    with open(path, 'wb') as output:
+      output.write(content)
+    sizes = {'sources': sum(os.path.getsize(os.path.join(static_folder, source)) for source in BUNDLES[bundle]), 'bundle': len(content)}
+    sizes.update(compressed_copies(path, content))
+    manifest[bundle] = filename
+    built[bundle] = (filename, sizes)
+  with open(os.path.join(directory, MANIFEST), 'w') as output:
+    json.dump(manifest, output, indent=2)
+  if clean:
+    # earlier builds are kept by default, pages rendered before a deploy still link them
+    current = set(manifest.values()) | {MANIFEST}
+    for filename in os.listdir(directory):
+      name, extension = os.path.splitext(filename)
+      if (name if extension in ('.gz', '.br') else filename) not in current:
+        os.remove(os.path.join(directory, filename))
+  return built
+
+
+class Assets:
+  '''
+  The bundles built by `flask assets`, read from the manifest at startup.
+  '''
+
+  def __init__(self):
+    self.directory = None
+    self.manifest = {}
+    self.version = None
+
+  def init_app(self, app):
+    self.directory = os.path.join(app.static_folder, BUILD_DIRECTORY)
+    try:
+      with open(os.path.join(self.directory, MANIFEST)) as manifest:
+        self.manifest = json.load(manifest)
+    except FileNotFoundError:
+      self.manifest = {}
+    # changes whenever a bundle does, pages linking the bundles include it in their ETag
+    self.version = hashlib.sha256(json.dumps(self.manifest, sort_keys=True).encode()).hexdigest()[:12] if self.manifest else None
+
+  def built(self, bundle):
+    return self.manifest.get(bundle)
+
+  def exists(self, filename):
+    # any bundle still in the build directory, pages rendered before a deploy link earlier builds
+    return is_fingerprinted(filename) and os.path.isfile(os.path.join(self.directory, filename))
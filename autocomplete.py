@@ -0,0 +1,174 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+#----------------------------------------------------------------------------#
+# Prefix index for the typeahead autocomplete.
+#
+# An index keeps the names of one table in two parallel sorted lists: the
+# folded (lower case, accents removed) text from the start of each word of
+# a name to its end, and the (id, name) entry it belongs to, so "The Musical
+# Hop" is found by "the", "mus" and "hop". A lookup bisects to the first key
+# starting with the query and reads keys from there until enough distinct
+# names are found.
+#
+# The lists are filled on the first lookup of each process. The create and
+# edit handlers record their changes after they commit: new names go to a
+# small sorted list of their own, read alongside the main one, and replaced
+# names to a set of removed entries, since inserting into lists of millions
+# of keys would hold up lookups. Every <max_age> seconds the index is rebuilt
+# from the database in a background thread, which folds those changes in and
+# picks up the ones made by other processes.
+#----------------------------------------------------------------------------#
+
+
+def fold(text):
+  if text.isascii():
+    return ' '.join(text.lower().split())
+  decomposed = unicodedata.normalize('NFKD', text.casefold())
+  return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+def word_keys(name):
+  # the folded name from the start of each of its words
+  folded = fold(name)
+  keys = [folded]
+  position = folded.find(' ')
+  while position != -1:
+    keys.append(folded[position + 1:])
+    position = folded.find(' ', position + 1)
+  return keys
+
+def sorted_pairs(names):
+  # (keys, entries) for an iterable of (id, name); the keys of a name share its entry
+  pairs = []
+  for entity_id, name in names:
+    entry = (entity_id, name)
+    pairs.extend((key, entry) for key in word_keys(name))
+  pairs.sort(key=lambda pair: pair[0])
+  return [key for key, _ in pairs], [entry for _, entry in pairs]
+
+def matches(keys, entries, prefix):
+  # the (key, entry) pairs of a sorted list whose key starts with <prefix>, in order
+  position = bisect_left(keys, prefix)
+  while position < len(keys) and keys[position].startswith(prefix):
+    yield keys[position], entries[position]
+    position += 1
+
+
+class NameIndex:
+  '''
+  Sorted-array prefix index of the names of one table, see above. <load>
+  returns every (id, name) to index and is called inside an app context.
+  '''
+
+  def __init__(self):
+    self.load = None
+    self.max_age = 0
+    self.keys = []
+    self.entries = []
+    self.added_keys = []
+    self.added_entries = []
+    self.removed = set()
+    self.built_at = None
+    self.lock = threading.Lock()
+    self.build_lock = threading.Lock()
+    # changes made while a rebuild reads the table, replayed on the rebuilt lists
+    self.pending = None
+
+  def init_app(self, app, load):
+    self.load = load
+    self.max_age = app.config['AUTOCOMPLETE_MAX_AGE']
+
+  def rebuild(self):
+    # reads every name again, inside an app context
+    with self.lock:
+      self.pending = []
+    try:
+      keys, entries = sorted_pairs(self.load())
+    except Exception:
+      with self.lock:
+        self.pending = None
+      raise
+    with self.lock:
+      self.keys, self.entries = keys, entries
+      self.added_keys, self.added_entries, self.removed = [], [], set()
+      for change in self.pending:
+        self.apply(*change)
+      self.pending = None
+      self.built_at = time.monotonic()
+
+  def rebuild_in_background(self, app):
+    # started with build_lock held, which it releases when done
+    try:
+      with app.app_context():
+        self.rebuild()
+    except Exception:
+      app.logger.exception('rebuilding the autocomplete index failed')
+      # retried after another max_age
+      self.built_at = time.monotonic()
+    finally:
+      self.build_lock.release()
+
+  def ensure_current(self, app):
+    # the first lookup of a process builds the index and the ones racing it wait; later ones
+    # start a rebuild in the background once it is older than max_age and read the current lists
+    if self.built_at is None:
+      with self.build_lock:
+        if self.built_at is None:
+          self.rebuild()
+    elif self.max_age > 0 and time.monotonic() - self.built_at > self.max_age and self.build_lock.acquire(blocking=False):
+      threading.Thread(target=self.rebuild_in_background, args=(app,), daemon=True).start()
+
+  def search(self, query, limit):
+    # up to <limit> (id, name) whose name has a word starting with <query>, by matching word
+    prefix = fold(query)
+    if not prefix:
+      return []
+    found = []
+    seen = set()
+    with self.lock:
+      indexed = matches(self.keys, self.entries, prefix)
+      added = matches(self.added_keys, self.added_entries, prefix)
+      next_indexed, next_added = next(indexed, None), next(added, None)
+      while len(found) < limit and (next_indexed or next_added):
+        if next_added is None or (next_indexed is not None and next_indexed[0] <= next_added[0]):
+          (_, entry), next_indexed = next_indexed, next(indexed, None)
+        else:
+          (_, entry), next_added = next_added, next(added, None)
+        if entry[0] not in seen and entry not in self.removed:
+          seen.add(entry[0])
+          found.append(entry)
+    return found
+
+  def update(self, entity_id, old_name=None, new_name=None):
+    # records a created (no old_name), renamed or deleted (no new_name) row
+    with self.lock:
+      if self.pending is not None:
+        self.pending.append((entity_id, old_name, new_name))
+      if self.built_at is not None:
+        self.apply(entity_id, old_name, new_name)
+
+  def apply(self, entity_id, old_name, new_name):
+    # idempotent, a replayed change may already be part of the rebuilt lists
+    for name in {old_name, new_name} - {None}:
+      entry = (entity_id, name)
+      self.removed.add(entry)
+      for key in word_keys(name):
+        position = bisect_left(self.added_keys, key)
+        while position < len(self.added_keys) and self.added_keys[position] == key:
+          if self.added_entries[position] == entry:
+            del self.added_keys[position]
+            del self.added_entries[position]
+          else:
+            position += 1
+    if new_name is not None:
+      entry = (entity_id, new_name)
+      self.removed.discard(entry)
+      for key in word_keys(new_name):
+        position = bisect_left(self.added_keys, key)
+        self.added_keys.insert(position, key)
+        self.added_entries.insert(position, entry)
+
+  def __len__(self):
+    return len(self.keys) + len(self.added_keys)
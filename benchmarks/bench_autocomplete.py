@@ -0,0 +1,115 @@
+'''
+Autocomplete index benchmark.
+
+Builds a NameIndex from synthetic names shaped like the ones of
+benchmarks/generate_data.py and reports the memory it holds, the time to
+build it, and the latency of lookups and of the incremental updates the
+create and edit handlers make. No database is needed.
+
+  python benchmarks/bench_autocomplete.py [--names 1000000] [--lookups 10000] [--output autocomplete.json]
+
+Memory is measured with tracemalloc, as the Python allocations still held
+once the index is built, and scaled to one million names. The names and
+their entries are counted too, the index is their only reference.
+'''
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from autocomplete import NameIndex, sorted_pairs
+from generate_data import ADJECTIVES, NOUNS, FIRST_NAMES, LAST_NAMES
+
+
+def names(rng, count):
+  # half venue-like, half artist-like names, each made unique by its number
+  for number in range(1, count + 1):
+    if number % 2:
+      yield number, f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}'
+    else:
+      yield number, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {number}'
+
+def build(rng, count):
+  index = NameIndex()
+  index.keys, index.entries = sorted_pairs(names(rng, count))
+  index.built_at = time.monotonic()
+  return index
+
+def queries(rng, count):
+  # prefixes of one to six characters of the words the names are made of, plus misses
+  words = ADJECTIVES + NOUNS + FIRST_NAMES + LAST_NAMES + ['the', 'zzz']
+  return [rng.choice(words)[:rng.randint(1, 6)] for _ in range(count)]
+
+def timings(samples):
+  samples = sorted(samples)
+  return {
+    'p50_us': round(statistics.median(samples) * 1e6, 2),
+    'p99_us': round(samples[int(len(samples) * 0.99) - 1] * 1e6, 2),
+    'max_us': round(samples[-1] * 1e6, 2),
+  }
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--names', type=int, default=1000000)
+  parser.add_argument('--lookups', type=int, default=10000)
+  parser.add_argument('--updates', type=int, default=200)
+  parser.add_argument('--limit', type=int, default=10)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--output', help='Also write the results to this JSON file.')
+  args = parser.parse_args()
+
+  started = time.perf_counter()
+  build(random.Random(args.seed), args.names)
+  build_seconds = time.perf_counter() - started
+  # built a second time for the memory, tracing allocations slows the build down severalfold
+  tracemalloc.start()
+  index = build(random.Random(args.seed), args.names)
+  held, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  rng = random.Random(args.seed)
+
+  lookups = []
+  for query in queries(rng, args.lookups):
+    started = time.perf_counter()
+    index.search(query, args.limit)
+    lookups.append(time.perf_counter() - started)
+
+  updates = []
+  for number in range(args.updates):
+    entity_id, old_name = index.entries[rng.randrange(len(index))]
+    started = time.perf_counter()
+    index.update(entity_id, old_name, f'Renamed {number} {old_name}')
+    updates.append(time.perf_counter() - started)
+
+  results = {
+    'names': args.names,
+    'keys': len(index),
+    'build_s': round(build_seconds, 3),
+    'memory_mb': round(held / 2 ** 20, 1),
+    'peak_memory_mb': round(peak / 2 ** 20, 1),
+    'memory_mb_per_million_names': round(held / 2 ** 20 * 1e6 / args.names, 1),
+    'bytes_per_name': round(held / args.names),
+    'lookup': timings(lookups),
+    'update': timings(updates),
+  }
+  print(f"{results['names']} names, {results['keys']} keys, built in {results['build_s']} s")
+  print(f"memory {results['memory_mb']} MB held ({results['bytes_per_name']} bytes per name, "
+        f"{results['memory_mb_per_million_names']} MB per 1M names), {results['peak_memory_mb']} MB peak while building")
+  for name in ('lookup', 'update'):
+    print(f"{name:7} p50 {results[name]['p50_us']:9.2f} us  p99 {results[name]['p99_us']:9.2f} us  max {results[name]['max_us']:9.2f} us")
+
+  if args.output:
+    with open(args.output, 'w') as output:
+      json.dump({'timestamp': datetime.now().isoformat(timespec='seconds'), **results}, output, indent=2)
+    print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+  main()
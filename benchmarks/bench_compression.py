@@ -0,0 +1,106 @@
+'''
+Response compression benchmark.
+
+Requests the listings and the venue and artist pages through the Flask test
+client once per encoding, uncompressed, gzip and brotli, and records the
+bytes sent and the CPU time spent per request. Detail pages are measured
+with the render cache cleared before every request, so each one renders
+and compresses the page, and as cache hits, which reuse the compressed
+copy kept with the cached page.
+
+  python benchmarks/bench_compression.py [--iterations 100] [--output compression.json]
+'''
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app, compression, db, page_cache, Venue, Artist
+
+app = create_app()
+ENCODINGS = ('identity', 'gzip', 'br')
+
+
+def id_range(model):
+  with app.app_context():
+    low, high = db.session.query(db.func.min(model.id), db.func.max(model.id)).one()
+  if low is None:
+    sys.exit(f'{model.__tablename__} is empty, fill it with benchmarks/generate_data.py first')
+  return low, high
+
+def routes(rng, venue_ids, artist_ids):
+  # name -> (function returning a path, whether the page comes from the render cache)
+  return {
+    'venues': (lambda: '/venues', False),
+    'artists': (lambda: '/artists', False),
+    'shows': (lambda: '/shows', False),
+    'show_venue': (lambda: f'/venues/{rng.randint(*venue_ids)}', True),
+    'show_artist': (lambda: f'/artists/{rng.randint(*artist_ids)}', True),
+  }
+
+def measure(client, make_path, encoding, iterations, warmup, cached):
+  wire, cpu = [], []
+  for iteration in range(warmup + iterations):
+    path = make_path()
+    if cached:
+      # the first request renders and compresses the page, the measured one is a cache hit
+      client.get(path, headers={'Accept-Encoding': encoding}).get_data()
+    else:
+      page_cache.clear()
+    started = time.process_time()
+    response = client.get(path, headers={'Accept-Encoding': encoding})
+    body = response.get_data()
+    elapsed = time.process_time() - started
+    if iteration >= warmup:
+      wire.append(len(body))
+      cpu.append(elapsed)
+  return {
+    'encoding': response.headers.get('Content-Encoding', 'identity'),
+    'bytes_mean': round(statistics.mean(wire)),
+    'cpu_ms_mean': round(statistics.mean(cpu) * 1e3, 3),
+    'cpu_ms_p50': round(statistics.median(cpu) * 1e3, 3),
+  }
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--iterations', type=int, default=100)
+  parser.add_argument('--warmup', type=int, default=10)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--output', help='Also write the results to this JSON file.')
+  args = parser.parse_args()
+
+  if compression.brotli is None:
+    print('brotli is not installed, br requests are answered with gzip')
+  client = app.test_client()
+  venue_ids, artist_ids = id_range(Venue), id_range(Artist)
+  results = {}
+  for name, (_, cacheable) in routes(None, venue_ids, artist_ids).items():
+    for cached in ((False, True) if cacheable else (False,)):
+      label = f'{name} (cached)' if cached else name
+      results[label] = {}
+      for encoding in ENCODINGS:
+        # a fresh generator per encoding, so every encoding is measured on the same pages
+        make_path = routes(random.Random(args.seed), venue_ids, artist_ids)[name][0]
+        results[label][encoding] = result = measure(client, make_path, encoding, args.iterations, args.warmup, cached)
+        identity = results[label]['identity']['bytes_mean']
+        print(f"{label:22} {encoding:9} {result['bytes_mean']:9} bytes ({result['bytes_mean'] / identity:6.1%})  "
+              f"cpu {result['cpu_ms_mean']:8.3f} ms mean  {result['cpu_ms_p50']:8.3f} ms p50")
+
+  if args.output:
+    with open(args.output, 'w') as output:
+      json.dump({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'iterations': args.iterations,
+        'brotli': compression.brotli is not None,
+        'routes': results,
+      }, output, indent=2)
+    print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+  main()
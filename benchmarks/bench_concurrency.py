@@ -0,0 +1,170 @@
+'''
+Concurrency benchmark: the sync WSGI path against the ASGI entry point.
+
+Serves the app with `app.run()` (Werkzeug's threaded server, as started by
+`python app.py`) and with `uvicorn asgi:application`, one process each and
+one after the other, and drives each with N concurrent client connections
+requesting the read routes for a fixed time. Reports throughput and
+p50/p99 latency for every concurrency level.
+
+  python benchmarks/bench_concurrency.py [--concurrency 1,16,64,256] [--duration 10] [--output results.json]
+
+Fill the database with benchmarks/generate_data.py first. The render cache
+is disabled in both servers unless --cached is given.
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app, db, Venue, Artist
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {
+  'wsgi': [sys.executable, '-c', 'from app import create_app; create_app().run(port={port}, threaded=True, use_reloader=False, use_debugger=False)'],
+  'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', '{port}', '--log-level', 'warning', '--no-access-log'],
+}
+
+
+def id_ranges():
+  with create_app().app_context():
+    ranges = [db.session.query(db.func.min(model.id), db.func.max(model.id)).one() for model in (Venue, Artist)]
+    db.engine.dispose()
+  if None in ranges[0] + ranges[1]:
+    sys.exit('the Venue and Artist tables are empty, fill them with benchmarks/generate_data.py first')
+  return ranges
+
+def read_routes(rng, venue_ids, artist_ids):
+  # the routes served by asgi.py, as functions returning (method, path, form data)
+  middle_venue = (venue_ids[0] + venue_ids[1]) // 2
+  return [
+    lambda: ('GET', '/venues', None),
+    lambda: ('GET', f'/venues?after={middle_venue}', None),
+    lambda: ('GET', f'/venues/{rng.randint(*venue_ids)}', None),
+    lambda: ('POST', '/venues/search', {'search_term': rng.choice(['Hop', 'Music', 'Velvet Hall', 'zzz'])}),
+    lambda: ('GET', '/artists', None),
+    lambda: ('GET', f'/artists/{rng.randint(*artist_ids)}', None),
+    lambda: ('POST', '/artists/search', {'search_term': rng.choice(['Guns', 'Band', 'Luna Trio', 'zzz'])}),
+    lambda: ('GET', '/shows', None),
+  ]
+
+async def fetch(port, method, path, data):
+  # one request on a new connection, the same for both servers, read until the server closes it
+  body = urlencode(data).encode() if data else b''
+  head = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nConnection: close\r\n'
+  if body:
+    head += f'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n'
+  reader, writer = await asyncio.open_connection('127.0.0.1', port)
+  try:
+    writer.write(head.encode() + b'\r\n' + body)
+    response = await reader.read()
+  finally:
+    writer.close()
+  return int(response.split(b' ', 2)[1])
+
+async def load(port, routes, rng, concurrency, duration):
+  latencies, statuses, errors = [], [], 0
+  deadline = time.perf_counter() + duration
+
+  async def client():
+    nonlocal errors
+    while time.perf_counter() < deadline:
+      method, path, data = rng.choice(routes)()
+      started = time.perf_counter()
+      try:
+        status = await fetch(port, method, path, data)
+      except (OSError, IndexError, ValueError):
+        errors += 1
+        continue
+      latencies.append(time.perf_counter() - started)
+      statuses.append(status)
+
+  started = time.perf_counter()
+  await asyncio.gather(*[client() for _ in range(concurrency)])
+  elapsed = time.perf_counter() - started
+  latencies.sort()
+  return {
+    'concurrency': concurrency,
+    'requests': len(latencies),
+    'requests_per_second': round(len(latencies) / elapsed, 1),
+    'p50_ms': round(latencies[len(latencies) // 2] * 1e3, 2) if latencies else None,
+    'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3, 2) if latencies else None,
+    'errors': errors,
+    'statuses': sorted(set(statuses)),
+  }
+
+async def wait_for(port, process, timeout=30):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if process.poll() is not None:
+      sys.exit(f'the server on port {port} exited with status {process.returncode}')
+    try:
+      reader, writer = await asyncio.open_connection('127.0.0.1', port)
+      writer.close()
+      return
+    except OSError:
+      await asyncio.sleep(0.2)
+  sys.exit(f'the server on port {port} did not start within {timeout} seconds')
+
+async def bench_server(name, port, routes, args):
+  environ = dict(os.environ)
+  if not args.cached:
+    environ['RENDER_CACHE_SIZE'] = '0'
+  command = [part.format(port=port) for part in SERVERS[name]]
+  process = subprocess.Popen(command, cwd=ROOT, env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  try:
+    await wait_for(port, process)
+    rng = random.Random(args.seed)
+    # warm up the connection pool and the template cache before measuring
+    await load(port, routes, rng, max(args.concurrency), 1)
+    results = []
+    for concurrency in args.concurrency:
+      result = await load(port, routes, rng, concurrency, args.duration)
+      print(f"{name:5} {concurrency:6} {result['requests_per_second']:10.1f} {result['p50_ms']:10.2f} {result['p99_ms']:10.2f} "
+            f"{result['errors']:7}  {result['statuses']}")
+      results.append(result)
+    return results
+  finally:
+    process.terminate()
+    process.wait()
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--concurrency', default='1,16,64,256', help='Comma-separated numbers of concurrent connections.')
+  parser.add_argument('--duration', type=float, default=10, help='Seconds of load per concurrency level.')
+  parser.add_argument('--servers', default='wsgi,asgi', help='Comma-separated servers to run: wsgi, asgi.')
+  parser.add_argument('--port', type=int, default=5055)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--cached', action='store_true', help='Keep the render cache enabled in the servers.')
+  parser.add_argument('--output', default=f"benchmarks/concurrency-{datetime.now():%Y%m%d-%H%M%S}.json")
+  args = parser.parse_args()
+  args.concurrency = [int(level) for level in args.concurrency.split(',')]
+
+  venue_ids, artist_ids = id_ranges()
+  routes = read_routes(random.Random(args.seed), venue_ids, artist_ids)
+  print(f"{'server':5} {'conns':>6} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>7}")
+  results = {}
+  for name in args.servers.split(','):
+    results[name] = asyncio.run(bench_server(name, args.port, routes, args))
+
+  with open(args.output, 'w') as output:
+    json.dump({
+      'timestamp': datetime.now().isoformat(timespec='seconds'),
+      'duration': args.duration,
+      'cached': args.cached,
+      'venue_ids': venue_ids,
+      'artist_ids': artist_ids,
+      'servers': results,
+    }, output, indent=2)
+  print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+  main()
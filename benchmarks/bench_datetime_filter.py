@@ -0,0 +1,51 @@
+'''
+Micro-benchmark for the `datetime` Jinja filter.
+
+Compares the previous filter, which was handed strftime() strings and
+re-parsed both the value and the Babel pattern on every call, with the
+current one taking native datetimes and compiled patterns, called once per
+tile and batched for a whole page.
+
+  python benchmarks/bench_datetime_filter.py [tiles]
+'''
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import format_datetime, format_datetimes
+
+
+def format_datetime_before(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def main():
+  tiles = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+  start = datetime(2026, 1, 1, 20, 0)
+  values = [start + timedelta(hours=i) for i in range(tiles)]
+  strings = [value.strftime('%Y-%m-%d %H:%M:%S') for value in values]
+  assert [format_datetime_before(s, 'full') for s in strings] == format_datetimes(values, 'full')
+
+  cases = [
+    ('before: strftime string + reparse', lambda: [format_datetime_before(s, 'full') for s in strings]),
+    ('after: native datetime per call', lambda: [format_datetime(v, 'full') for v in values]),
+    ('after: batched page', lambda: format_datetimes(values, 'full')),
+  ]
+  print(f'{tiles} show tiles per page')
+  for name, case in cases:
+    best = min(timeit.repeat(case, number=1, repeat=5))
+    print(f'{name:36} {best * 1e6 / tiles:8.2f} us/call {best * 1e3:8.2f} ms/page')
+
+
+if __name__ == '__main__':
+  main()
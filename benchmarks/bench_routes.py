@@ -0,0 +1,235 @@
+'''
+Route benchmark suite.
+
+Drives every route through the Flask test client against the configured
+database and records p50/p95/p99 latency and SQL statements per request.
+Results are written as JSON so runs can be compared between commits; fill
+the database with benchmarks/generate_data.py first.
+
+  python benchmarks/bench_routes.py [--iterations 200] [--writes] [--output results.json]
+  python benchmarks/bench_routes.py --compare before.json after.json
+
+Detail pages are served from the render cache after the first hit, the
+cache is cleared before every request unless --cached is given.
+'''
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app, db, page_cache, Venue, Artist, Show, reconcile_show_counters
+from choices import GENRES
+
+app = create_app()
+BENCHMARK_PREFIX = 'Benchmark'
+
+
+class QueryCounter:
+
+  def __init__(self):
+    self.count = 0
+    event.listen(Engine, 'after_cursor_execute', self.statement)
+
+  def statement(self, conn, cursor, statement, parameters, context, executemany):
+    self.count += 1
+
+
+def percentile(samples, fraction):
+  # nearest-rank percentile of an already sorted list
+  return samples[max(0, min(len(samples) - 1, int(round(fraction * len(samples))) - 1))]
+
+def summarize(latencies, queries, statuses):
+  latencies = sorted(latencies)
+  return {
+    'requests': len(latencies),
+    'p50_ms': round(percentile(latencies, 0.50) * 1e3, 3),
+    'p95_ms': round(percentile(latencies, 0.95) * 1e3, 3),
+    'p99_ms': round(percentile(latencies, 0.99) * 1e3, 3),
+    'mean_ms': round(sum(latencies) / len(latencies) * 1e3, 3),
+    'queries_max': max(queries),
+    'queries_mean': round(sum(queries) / len(queries), 2),
+    'statuses': sorted(set(statuses)),
+  }
+
+def id_range(model):
+  with app.app_context():
+    low, high = db.session.query(db.func.min(model.id), db.func.max(model.id)).one()
+  if low is None:
+    sys.exit(f'{model.__tablename__} is empty, fill it with benchmarks/generate_data.py first')
+  return low, high
+
+def read_routes(rng, venue_ids, artist_ids):
+  # name -> function returning (method, path, form data) for one request
+  middle_venue = (venue_ids[0] + venue_ids[1]) // 2
+  middle_artist = (artist_ids[0] + artist_ids[1]) // 2
+  recently = (datetime.now() - timedelta(hours=1)).isoformat()
+  soon = datetime.now() + timedelta(days=7)
+  return {
+    'index': lambda: ('GET', '/', None),
+    'venues': lambda: ('GET', '/venues', None),
+    'venues_page': lambda: ('GET', f'/venues?after={middle_venue}', None),
+    'search_venues': lambda: ('POST', '/venues/search', {'search_term': rng.choice(['Hop', 'Music', 'Velvet Hall', 'zzz'])}),
+    'show_venue': lambda: ('GET', f'/venues/{rng.randint(*venue_ids)}', None),
+    'show_venue_more_past': lambda: ('GET', f'/venues/{rng.randint(*venue_ids)}?past_shows=48', None),
+    'create_venue_form': lambda: ('GET', '/venues/create', None),
+    'edit_venue_form': lambda: ('GET', f'/venues/{rng.randint(*venue_ids)}/edit', None),
+    'artists': lambda: ('GET', '/artists', None),
+    'artists_page': lambda: ('GET', f'/artists?after={middle_artist}', None),
+    'search_artists': lambda: ('POST', '/artists/search', {'search_term': rng.choice(['Guns', 'Band', 'Luna Trio', 'zzz'])}),
+    'show_artist': lambda: ('GET', f'/artists/{rng.randint(*artist_ids)}', None),
+    'create_artist_form': lambda: ('GET', '/artists/create', None),
+    'edit_artist_form': lambda: ('GET', f'/artists/{rng.randint(*artist_ids)}/edit', None),
+    'shows': lambda: ('GET', '/shows', None),
+    'create_show_form': lambda: ('GET', '/shows/create', None),
+    'genre': lambda: ('GET', f"/genres/{rng.choice(GENRES)}?state=CA", None),
+    'availability': lambda: ('GET', f"/availability?city=San+Francisco&state=CA&from={soon:%Y-%m-%d}+20:00&to={soon:%Y-%m-%d}+23:00", None),
+    'autocomplete': lambda: ('GET', f"/api/autocomplete?q={rng.choice(['m', 'mus', 'the v', 'luna t', 'zzz'])}", None),
+    'export_venues_recent': lambda: ('GET', f'/api/export/venues?updated_since={recently}', None),
+    'healthz': lambda: ('GET', '/healthz', None),
+    'metrics': lambda: ('GET', '/metrics', None),
+  }
+
+def write_routes(rng, venue_ids, artist_ids):
+  # every write creates rows named after BENCHMARK_PREFIX, removed again by cleanup()
+  def venue_form():
+    return {
+      'name': f'{BENCHMARK_PREFIX} Venue {rng.randint(1, 10 ** 9)}', 'city': 'San Francisco', 'state': 'CA',
+      'address': '1 Benchmark St', 'phone': '555-555-5555', 'genres': ['Jazz'], 'seeking_talent': 'y',
+      'facebook_link': '', 'image_link': '', 'website_link': '', 'seeking_description': '',
+    }
+  def artist_form():
+    return {
+      'name': f'{BENCHMARK_PREFIX} Artist {rng.randint(1, 10 ** 9)}', 'city': 'San Francisco', 'state': 'CA',
+      'phone': '555-555-5555', 'genres': ['Jazz'], 'seeking_venue': 'y',
+      'facebook_link': '', 'image_link': '', 'website_link': '', 'seeking_description': '',
+    }
+  def show_form():
+    start_time = datetime.now() + timedelta(days=rng.randint(1, 365))
+    return {'venue_id': str(rng.randint(*venue_ids)), 'artist_id': str(rng.randint(*artist_ids)), 'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+  def edit_venue():
+    with app.app_context():
+      venue_id = db.session.query(db.func.max(Venue.id)).filter(Venue.name.like(f'{BENCHMARK_PREFIX} %')).scalar()
+    return 'POST', f'/venues/{venue_id}/edit', venue_form()
+  return {
+    'create_venue': lambda: ('POST', '/venues/create', venue_form()),
+    'edit_venue': edit_venue,
+    'create_artist': lambda: ('POST', '/artists/create', artist_form()),
+    'create_show': lambda: ('POST', '/shows/create', show_form()),
+  }
+
+def cleanup(last_show):
+  # drops the rows added by the write routes and recomputes the counters the new shows bumped
+  with app.app_context():
+    db.session.query(Show).filter(Show.id > last_show).delete(synchronize_session=False)
+    db.session.query(Venue).filter(Venue.name.like(f'{BENCHMARK_PREFIX} %')).delete(synchronize_session=False)
+    db.session.query(Artist).filter(Artist.name.like(f'{BENCHMARK_PREFIX} %')).delete(synchronize_session=False)
+    reconcile_show_counters(datetime.now())
+    db.session.commit()
+
+def run(client, routes, iterations, warmup, cached, counter):
+  results = {}
+  for name, make_request in routes.items():
+    latencies, queries, statuses = [], [], []
+    for iteration in range(warmup + iterations):
+      method, path, data = make_request()
+      if not cached:
+        page_cache.clear()
+      before = counter.count
+      started = time.perf_counter()
+      response = client.open(path, method=method, data=data)
+      response.get_data()
+      elapsed = time.perf_counter() - started
+      if iteration >= warmup:
+        latencies.append(elapsed)
+        queries.append(counter.count - before)
+        statuses.append(response.status_code)
+    results[name] = summarize(latencies, queries, statuses)
+    print(f"{name:24} p50 {results[name]['p50_ms']:9.2f} ms  p95 {results[name]['p95_ms']:9.2f} ms  "
+          f"p99 {results[name]['p99_ms']:9.2f} ms  queries {results[name]['queries_max']:4}  {results[name]['statuses']}")
+  return results
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def row_counts():
+  with app.app_context():
+    return {
+      table: db.session.execute(db.text(f'SELECT count(*) FROM "{table}"')).scalar()
+      for table in ('Venue', 'Artist', 'Show')
+    }
+
+def compare(before_path, after_path):
+  with open(before_path) as before_file, open(after_path) as after_file:
+    before, after = json.load(before_file), json.load(after_file)
+  print(f"{'route':24} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20} {'queries':>12}")
+  for name in sorted(set(before['routes']) & set(after['routes'])):
+    old, new = before['routes'][name], after['routes'][name]
+    cells = [f"{old[key]:8.2f} -> {new[key]:8.2f}" for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+    print(f"{name:24} {cells[0]:>20} {cells[1]:>20} {cells[2]:>20} {old['queries_max']:5} -> {new['queries_max']:<4}")
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--iterations', type=int, default=200)
+  parser.add_argument('--warmup', type=int, default=10)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--routes', help='Comma-separated route names to run, all by default.')
+  parser.add_argument('--writes', action='store_true', help='Also benchmark the create and edit submissions.')
+  parser.add_argument('--cached', action='store_true', help='Keep the render cache between requests.')
+  parser.add_argument('--output', default=f"benchmarks/results-{datetime.now():%Y%m%d-%H%M%S}.json")
+  parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Print the difference between two result files.')
+  args = parser.parse_args()
+
+  if args.compare:
+    compare(*args.compare)
+    return
+
+  app.config['WTF_CSRF_ENABLED'] = False
+  rng = random.Random(args.seed)
+  venue_ids, artist_ids = id_range(Venue), id_range(Artist)
+  routes = read_routes(rng, venue_ids, artist_ids)
+  if args.writes:
+    routes.update(write_routes(rng, venue_ids, artist_ids))
+    with app.app_context():
+      last_show = db.session.query(db.func.coalesce(db.func.max(Show.id), 0)).scalar()
+  if args.routes:
+    wanted = args.routes.split(',')
+    unknown = set(wanted) - set(routes)
+    if unknown:
+      sys.exit(f"unknown routes: {', '.join(sorted(unknown))}")
+    routes = {name: routes[name] for name in wanted}
+
+  counter = QueryCounter()
+  rows = row_counts()
+  print(f"{rows['Venue']} venues, {rows['Artist']} artists, {rows['Show']} shows, {args.iterations} requests per route")
+  try:
+    results = run(app.test_client(), routes, args.iterations, args.warmup, args.cached, counter)
+  finally:
+    if args.writes:
+      cleanup(last_show)
+
+  with open(args.output, 'w') as output:
+    json.dump({
+      'commit': git_commit(),
+      'timestamp': datetime.now().isoformat(timespec='seconds'),
+      'rows': rows,
+      'iterations': args.iterations,
+      'seed': args.seed,
+      'cached': args.cached,
+      'routes': results,
+    }, output, indent=2)
+  print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,89 @@
+'''
+Startup benchmark.
+
+Starts fresh interpreters and times how long a cold `import app`, building
+the app with create_app() and the first requests through the Flask test
+client take, the costs a new worker pays before it serves anything.
+
+  python benchmarks/bench_startup.py [--runs 10] [--paths /,/venues] [--output startup.json]
+
+Each run is a separate process so nothing is shared between them.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs inside the child interpreter and prints its timings as JSON
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+client = application.test_client()
+requests = {}
+for path in sys.argv[1:]:
+  before = time.perf_counter()
+  client.get(path).get_data()
+  requests[path] = time.perf_counter() - before
+print(json.dumps({
+  'import_ms': (imported - started) * 1e3,
+  'create_app_ms': (created - imported) * 1e3,
+  'requests_ms': {path: elapsed * 1e3 for path, elapsed in requests.items()},
+  'modules': sorted(sys.modules),
+}))
+'''
+
+# imported lazily by the app, a worker that loads one of these at startup has regressed
+LAZY_MODULES = ('alembic', 'flask_migrate', 'wtforms', 'flask_wtf', 'babel', 'dateutil', 'importer')
+
+
+def probe(paths):
+  output = subprocess.check_output([sys.executable, '-c', PROBE, *paths], cwd=ROOT)
+  return json.loads(output.decode().splitlines()[-1])
+
+def median(samples):
+  return round(statistics.median(samples), 3)
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--runs', type=int, default=10)
+  parser.add_argument('--paths', default='/,/venues', help='Comma-separated paths requested after startup, in order.')
+  parser.add_argument('--output', help='Also write the medians to this JSON file.')
+  args = parser.parse_args()
+
+  paths = args.paths.split(',')
+  runs = [probe(paths) for run in range(args.runs)]
+  results = {
+    'import_ms': median([run['import_ms'] for run in runs]),
+    'create_app_ms': median([run['create_app_ms'] for run in runs]),
+    'requests_ms': {path: median([run['requests_ms'][path] for run in runs]) for path in paths},
+  }
+  print(f"import app         {results['import_ms']:9.2f} ms")
+  print(f"create_app()       {results['create_app_ms']:9.2f} ms")
+  for path, elapsed in results['requests_ms'].items():
+    print(f"first GET {path:8} {elapsed:9.2f} ms")
+  loaded = sorted({module.split('.')[0] for module in runs[0]['modules']} & set(LAZY_MODULES))
+  if loaded:
+    print(f"loaded at startup: {', '.join(loaded)}")
+
+  if args.output:
+    with open(args.output, 'w') as output:
+      json.dump({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'runs': args.runs,
+        'loaded_at_startup': loaded,
+        **results,
+      }, output, indent=2)
+    print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,151 @@
+'''
+Fills the Venue, Artist and Show tables with seeded synthetic data, for
+measuring Fyyur at realistic scale. Rows are written with COPY in batches
+and the upcoming show counters are rebuilt at the end.
+
+  python benchmarks/generate_data.py --venues 50000 --artists 500000 --shows 10000000 --seed 1 --base-date 2026-01-01
+
+Shows span the three years before the base date, today by default, and the
+year after it. The same seed, volumes and base date always produce the same
+venues, artists and shows; updated_at and the upcoming show counters follow
+the clock of the run. Existing rows are kept unless --truncate is given, but
+new shows are only guaranteed not to overlap each other, so start from empty
+tables when the Show table isn't.
+'''
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app, db, Venue, Artist, Show, reconcile_show_counters
+from choices import GENRES
+from importer import copy_rows
+from partitions import create_partitions, months_between
+
+ADJECTIVES = ['Musical', 'Electric', 'Velvet', 'Golden', 'Wild', 'Silent', 'Blue', 'Neon', 'Rusty', 'Hidden', 'Royal', 'Broken']
+NOUNS = ['Hop', 'Lounge', 'Hall', 'Room', 'Garden', 'Cellar', 'Stage', 'Barn', 'Club', 'Den', 'Theatre', 'Square']
+FIRST_NAMES = ['Guns', 'Matt', 'Sax', 'Luna', 'Ray', 'Nina', 'Otis', 'Ella', 'Miles', 'Joni', 'Prince', 'Aretha']
+LAST_NAMES = ['Petals', 'Quevado', 'Band', 'Collective', 'Trio', 'Quartet', 'Project', 'Orchestra', 'Crew', 'Ensemble']
+CITIES = [
+  ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'), ('Brooklyn', 'NY'), ('Austin', 'TX'),
+  ('Houston', 'TX'), ('Seattle', 'WA'), ('Portland', 'OR'), ('Chicago', 'IL'), ('Nashville', 'TN'),
+  ('New Orleans', 'LA'), ('Denver', 'CO'), ('Atlanta', 'GA'), ('Boston', 'MA'), ('Miami', 'FL'),
+]
+SLOT_HOURS = 3
+DURATIONS = (60, 90, 120, 150, 180)
+
+
+def venue_rows(rng, count):
+  for number in range(1, count + 1):
+    city, state = rng.choice(CITIES)
+    yield {
+      'name': f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}',
+      'city': city,
+      'state': state,
+      'address': f'{rng.randint(1, 9999)} {rng.choice(NOUNS)} St',
+      'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+      'genres': rng.sample(GENRES, rng.randint(1, 3)),
+      'facebook_link': f'https://www.facebook.com/venue{number}',
+      'website': f'https://venue{number}.example.com',
+      'seeking_talent': rng.random() < 0.5,
+      'seeking_description': 'We are on the lookout for local artists.',
+      'image_link': None,
+    }
+
+def artist_rows(rng, count):
+  for number in range(1, count + 1):
+    city, state = rng.choice(CITIES)
+    yield {
+      'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {number}',
+      'city': city,
+      'state': state,
+      'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+      'genres': rng.sample(GENRES, rng.randint(1, 3)),
+      'facebook_link': f'https://www.facebook.com/artist{number}',
+      'website': f'https://artist{number}.example.com',
+      'seeking_venue': rng.random() < 0.5,
+      'seeking_talent': 'Looking for shows to perform at in the area.',
+      'image_link': None,
+    }
+
+def show_rows(rng, count, venue_ids, artist_ids, base, now):
+  # shows sit on 3-hour slots over four years, three of them before <base>. A venue never gets
+  # the same slot twice and within one slot no two venues get the same artist, so the shows
+  # never trip the venue and artist booking constraints
+  venues = venue_ids[1] - venue_ids[0] + 1
+  artists = artist_ids[1] - artist_ids[0] + 1
+  slots = 4 * 365 * 24 // SLOT_HOURS
+  per_venue = -(-count // venues)
+  if per_venue > slots or venues > artists:
+    sys.exit(f'{count} shows need at most {slots} shows per venue and no more venues than artists')
+  stride = slots // per_venue
+  first = base - timedelta(days=3 * 365)
+  for number in range(count):
+    venue = number % venues
+    slot = number // venues * stride + rng.randrange(stride)
+    start_time = first + timedelta(hours=slot * SLOT_HOURS)
+    yield {
+      'venue_id': venue_ids[0] + venue,
+      'artist_id': artist_ids[0] + (venue + slot * 7919) % artists,
+      'start_time': start_time,
+      'duration_minutes': rng.choice(DURATIONS),
+      'counted_upcoming': start_time > now,
+    }
+
+def load(model, rows, batch_size):
+  connection = db.session.connection().connection
+  loaded = 0
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) >= batch_size:
+      copy_rows(connection, model.__tablename__, list(batch[0]), batch)
+      loaded += len(batch)
+      batch = []
+      print(f'\r{model.__tablename__}: {loaded}', end='', flush=True)
+  if batch:
+    copy_rows(connection, model.__tablename__, list(batch[0]), batch)
+    loaded += len(batch)
+  db.session.commit()
+  print(f'\r{model.__tablename__}: {loaded}')
+
+def id_range(model):
+  low, high = db.session.query(db.func.min(model.id), db.func.max(model.id)).one()
+  return low, high
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--venues', type=int, default=1000)
+  parser.add_argument('--artists', type=int, default=5000)
+  parser.add_argument('--shows', type=int, default=50000)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--batch-size', type=int, default=50000)
+  parser.add_argument('--base-date', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+    default=datetime.now().replace(hour=0, minute=0, second=0, microsecond=0),
+    help='YYYY-MM-DD, the day the shows are placed around. Defaults to today.')
+  parser.add_argument('--truncate', action='store_true', help='Empty the Show, Venue and Artist tables first.')
+  args = parser.parse_args()
+
+  rng = random.Random(args.seed)
+  base = args.base_date
+  now = datetime.now()
+  with create_app().app_context():
+    if args.truncate:
+      db.session.execute(db.text('TRUNCATE "Show", "Venue", "Artist" RESTART IDENTITY CASCADE'))
+      db.session.commit()
+    load(Venue, venue_rows(rng, args.venues), args.batch_size)
+    load(Artist, artist_rows(rng, args.artists), args.batch_size)
+    # the months of the shows get their partitions first, none of them lands in the default partition
+    create_partitions(db.session, months_between(base - timedelta(days=3 * 365), base + timedelta(days=365)))
+    db.session.commit()
+    load(Show, show_rows(rng, args.shows, id_range(Venue), id_range(Artist), base, now), args.batch_size)
+    reconcile_show_counters(now)
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+
+
+class RenderCache:
+  '''
+  Bounded LRU cache for rendered pages. Each entry is stored under a key
+  and a version, the ETag of the page, and is only returned for that same
+  version: a worker whose cached copy predates a write made through
+  another worker misses, since the page's timestamps, and with them its
+  ETag, have moved. Every entry expires after <ttl> seconds at the latest,
+  or earlier when given an expiry time, e.g. the moment an upcoming show on
+  the page turns into a past show.
+
+  A render reads generation() before its queries and passes it to set(),
+  which refuses the value if the key was invalidated in the meantime. For
+  <grace> seconds after a key is invalidated, new values for it are not
+  stored either, since they may have been rendered from a replica that has
+  not yet replayed the write behind the invalidation.
+  '''
+
+  def __init__(self, max_size=0, grace=0, ttl=0):
+    self.max_size = max_size
+    self.grace = grace
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.invalidated = OrderedDict()
+    # the generation each key was last invalidated at, the oldest forgotten beyond max_size
+    self.invalidations = 0
+    self.invalidated_at = OrderedDict()
+    self.forgotten = 0
+    self.lock = Lock()
+
+  def init_app(self, app, grace=0):
+    self.max_size = app.config['RENDER_CACHE_SIZE']
+    self.ttl = app.config['RENDER_CACHE_TTL']
+    self.grace = grace
+
+  def generation(self):
+    with self.lock:
+      return self.invalidations
+
+  def get(self, key, version):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      entry_version, value, expires = entry
+      if expires <= datetime.now():
+        del self.entries[key]
+        return None
+      if entry_version != version:
+        return None
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, version, value, generation, expires=None):
+    if self.max_size <= 0:
+      return
+    ttl_expires = datetime.now() + timedelta(seconds=self.ttl)
+    expires = ttl_expires if expires is None else min(expires, ttl_expires)
+    with self.lock:
+      if self.invalidated_at.get(key, self.forgotten) > generation:
+        return
+      self.forget_invalidations()
+      if key in self.invalidated:
+        return
+      self.entries[key] = (version, value, expires)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_size:
+        self.entries.popitem(last=False)
+
+  def invalidate(self, *keys):
+    with self.lock:
+      self.invalidations += 1
+      for key in keys:
+        self.entries.pop(key, None)
+        self.invalidated_at.pop(key, None)
+        self.invalidated_at[key] = self.invalidations
+        if self.grace > 0:
+          self.invalidated.pop(key, None)
+          self.invalidated[key] = time.monotonic() + self.grace
+      while len(self.invalidated_at) > max(self.max_size, 1):
+        _, self.forgotten = self.invalidated_at.popitem(last=False)
+
+  def forget_invalidations(self):
+    # invalidations are kept in the order they happened, so expired ones are at the front
+    now = time.monotonic()
+    while self.invalidated and next(iter(self.invalidated.values())) <= now:
+      self.invalidated.popitem(last=False)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  def __len__(self):
+    return len(self.entries)
@@ -0,0 +1,37 @@
+# Fixed choices shared by the forms and by the models and routes in app.py, kept
+# out of forms.py so the app can use them without loading WTForms.
+
+# the genres venues and artists can be tagged with, also the only valid /genres/<genre> pages
+GENRES = [
+    'Alternative',
+    'Blues',
+    'Classical',
+    'Country',
+    'Electronic',
+    'Folk',
+    'Funk',
+    'Hip-Hop',
+    'Heavy Metal',
+    'Instrumental',
+    'Jazz',
+    'Musical Theatre',
+    'Pop',
+    'Punk',
+    'R&B',
+    'Reggae',
+    'Rock n Roll',
+    'Soul',
+    'Other',
+]
+
+# how long a show books its venue and artist for when no duration is given
+SHOW_DURATION_MINUTES = 120
+# and at most; a show overlapping a time range starts less than this before the range
+SHOW_MAX_DURATION_MINUTES = 24 * 60
+
+# how often a recurring show repeats, as (value, label) form choices
+RECURRENCE_FREQUENCIES = [
+    ('daily', 'Daily'),
+    ('weekly', 'Weekly'),
+    ('monthly', 'Monthly'),
+]
@@ -0,0 +1,79 @@
+import gzip
+
+from flask import g, request
+
+#----------------------------------------------------------------------------#
+# Response compression.
+#
+# Responses of an allowed content type and at least COMPRESS_MIN_SIZE bytes
+# are sent with brotli, when the brotli module is installed, or gzip, which
+# ever the client prefers. Streamed responses and files, such as the export
+# API and the prebuilt asset bundles, are left alone.
+#
+# A view may hand over a dict in which the compressed copies of its response
+# are looked up and stored, see keep_variants(). Pages from the render cache
+# keep one there, so a cached page is compressed once per encoding instead
+# of on every hit.
+#----------------------------------------------------------------------------#
+
+
+class Compression:
+
+  def __init__(self):
+    self.min_size = 0
+    self.mimetypes = frozenset()
+    self.gzip_level = 6
+    self.brotli_quality = 5
+    self.brotli = None
+    self.encodings = ['gzip']
+
+  def init_app(self, app):
+    self.min_size = app.config['COMPRESS_MIN_SIZE']
+    self.mimetypes = frozenset(app.config['COMPRESS_MIMETYPES'])
+    self.gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+    self.brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+    try:
+      import brotli
+    except ImportError:
+      brotli = None
+    self.brotli = brotli
+    # on equal preference the first one wins
+    self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    app.after_request(self.compress_response)
+
+  def compress(self, data, encoding):
+    if encoding == 'br':
+      return self.brotli.compress(data, quality=self.brotli_quality)
+    return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+  def keep_variants(self, variants=None):
+    # the compressed copies of this response are looked up in and added to <variants>, a dict
+    # kept alongside the rendered page; returns the dict, a new one when none is given
+    g.compressed_variants = {} if variants is None else variants
+    return g.compressed_variants
+
+  def compress_response(self, response):
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers \
+        or response.status_code < 200 or response.status_code in (204, 206, 304) \
+        or response.mimetype not in self.mimetypes:
+      return response
+    data = response.get_data()
+    if len(data) < self.min_size:
+      return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(self.encodings)
+    if encoding is None:
+      return response
+    variants = g.get('compressed_variants')
+    body = variants.get(encoding) if variants is not None else None
+    if body is None:
+      body = self.compress(data, encoding)
+      if variants is not None:
+        variants[encoding] = body
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+      # a strong ETag names exact bytes, which the compressed body no longer are
+      response.set_etag(f'{etag}-{encoding}')
+    return response
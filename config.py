@@ -1,13 +1,92 @@
 import os
-SECRET_KEY = os.urandom(32)
+
+def env_int(name, default):
+  return int(os.environ.get(name, default))
+
+def env_bool(name, default):
+  return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+# Signs the session cookie, which every worker must be able to read: set it in production.
+# The development key is public, the app only starts with it in debug mode
+DEVELOPMENT_SECRET_KEY = 'fyyur-development-key'
+SECRET_KEY = os.environ.get('SECRET_KEY', DEVELOPMENT_SECRET_KEY)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Enable debug mode with FLASK_DEBUG=1, never in production
+DEBUG = env_bool('FLASK_DEBUG', False)
 
 # Connect to the database
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://sayananrajeswaran@localhost:5432/fyyurr')
+
+# Read replicas for read-only routes, comma separated database URLs
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# Seconds between replica health checks, and for which a failed replica is skipped
+REPLICA_RETRY_SECONDS = env_int('REPLICA_RETRY_SECONDS', 30)
+# Seconds after a write during which the same client reads from the primary
+REPLICA_LAG_WINDOW = env_int('REPLICA_LAG_WINDOW', 5)
+
+# Connection pool, see database.engine_options()
+DB_POOL_SIZE = env_int('DB_POOL_SIZE', 5)
+DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 10)
+DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 30)
+DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+# Per-statement timeout in milliseconds, 0 disables it
+DB_STATEMENT_TIMEOUT = env_int('DB_STATEMENT_TIMEOUT', 0)
+# Connect through PgBouncer in transaction pooling mode
+DB_PGBOUNCER = env_bool('DB_PGBOUNCER', False)
+
+# Maximum number of rows returned by the venue and artist searches
+SEARCH_RESULTS_LIMIT = 50
+
+# Default and maximum page sizes for the keyset paginated listings
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Number of past shows listed on a venue or artist page before "load more", and at most
+PAST_SHOWS_LIMIT = 12
+MAX_PAST_SHOWS_LIMIT = 240
+
+# Identifies the deployed code, part of every page ETag so clients refetch pages after a deploy
+RELEASE = os.environ.get('RELEASE', '')
+
+# Number of rendered venue and artist pages kept in the in-process page cache, and the seconds
+# each is kept at most
+RENDER_CACHE_SIZE = env_int('RENDER_CACHE_SIZE', 1024)
+RENDER_CACHE_TTL = env_int('RENDER_CACHE_TTL', 300)
+
+# Rows fetched per server-side cursor batch by the streaming export API
+EXPORT_BATCH_SIZE = 1000
+
+# Requests issuing more SQL statements than this are flagged in /metrics and logged
+SQL_QUERY_THRESHOLD = 20
+
+# Seconds browsers and proxies may keep a fingerprinted asset bundle, its name changes with its content
+ASSETS_MAX_AGE = env_int('ASSETS_MAX_AGE', 365 * 24 * 3600)
+
+# Response compression: smallest body worth compressing in bytes, the content types compressed,
+# and the gzip level and brotli quality used for pages compressed per request
+COMPRESS_MIN_SIZE = env_int('COMPRESS_MIN_SIZE', 1024)
+COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain', 'text/csv', 'application/json', 'application/javascript', 'application/x-ndjson', 'image/svg+xml']
+COMPRESS_GZIP_LEVEL = env_int('COMPRESS_GZIP_LEVEL', 6)
+COMPRESS_BROTLI_QUALITY = env_int('COMPRESS_BROTLI_QUALITY', 5)
+
+# Suggestions returned per type by /api/autocomplete by default and at most, and the age in
+# seconds after which a worker rebuilds its name index to pick up changes made by other workers
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+AUTOCOMPLETE_MAX_AGE = env_int('AUTOCOMPLETE_MAX_AGE', 300)
+
+# Most shows one recurring booking may create
+RECURRING_SHOWS_LIMIT = 366
 
+# Soft-delete venues: DELETE /venues/<id> only sets deleted_at, and `flask purge-venues` archives
+# the venues deleted more than VENUE_PURGE_AFTER_DAYS days ago
+VENUE_SOFT_DELETE = env_bool('VENUE_SOFT_DELETE', False)
+VENUE_PURGE_AFTER_DAYS = env_int('VENUE_PURGE_AFTER_DAYS', 30)
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://sayananrajeswaran@localhost:5432/fyyurr'
\ No newline at end of file
+# `flask show-partitions` creates the monthly Show partitions this many months ahead, and detaches
+# those of months ended more than SHOW_PARTITION_KEEP_MONTHS months ago; 0 keeps every month
+SHOW_PARTITION_MONTHS_AHEAD = env_int('SHOW_PARTITION_MONTHS_AHEAD', 12)
+SHOW_PARTITION_KEEP_MONTHS = env_int('SHOW_PARTITION_KEEP_MONTHS', 0)
@@ -0,0 +1,295 @@
+import asyncio
+import itertools
+import os
+import re
+import time
+import weakref
+
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.selectable import SelectBase
+
+#----------------------------------------------------------------------------#
+# Engine factory.
+#
+# Builds the create_engine() options from the DB_* settings in config.py,
+# which are read from the environment.
+#----------------------------------------------------------------------------#
+
+def database_uri(uri):
+  # postgres:// is what Heroku and older tooling hand out, SQLAlchemy only accepts postgresql://
+  if uri.startswith('postgres://'):
+    return 'postgresql://' + uri[len('postgres://'):]
+  return uri
+
+def engine_options(config):
+  if config['DB_PGBOUNCER']:
+    # PgBouncer in transaction pooling mode does the pooling and hands a server connection
+    # to a client for one transaction only: keep no idle connections of our own and leave
+    # session state alone, the statement timeout is set per transaction in configure_engine()
+    return {'poolclass': NullPool}
+
+  options = {
+    'pool_size': config['DB_POOL_SIZE'],
+    'max_overflow': config['DB_MAX_OVERFLOW'],
+    'pool_timeout': config['DB_POOL_TIMEOUT'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+  }
+  if config['DB_STATEMENT_TIMEOUT']:
+    options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"}
+  return options
+
+def configure_engine(engine, config):
+  if config['DB_PGBOUNCER'] and config['DB_STATEMENT_TIMEOUT']:
+    timeout = int(config['DB_STATEMENT_TIMEOUT'])
+
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(connection):
+      connection.execute(text(f'SET LOCAL statement_timeout = {timeout}'))
+
+# the engines disposed before a fork, held weakly so the engines of discarded apps can go
+FORK_ENGINES = weakref.WeakSet()
+
+def dispose_fork_engines():
+  for engine in list(FORK_ENGINES):
+    engine.dispose()
+
+# fork hooks can't be unregistered, so there is one per process rather than one per app
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(before=dispose_fork_engines)
+
+def dispose_before_fork(engines):
+  # a worker forked with the parent's pooled connections would share their sockets with it,
+  # so the parent closes its idle connections right before a fork and every worker opens its
+  # own; disposing them in the child instead would end the parent's sessions on the server
+  FORK_ENGINES.update(engines)
+
+def pool_status(pool):
+  # live checkout numbers of a QueuePool, a NullPool only reports its class
+  status = {'pool': type(pool).__name__}
+  for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+    if hasattr(pool, name):
+      status[name] = getattr(pool, name)()
+  return status
+
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#----------------------------------------------------------------------------#
+
+def read_only(view):
+  # marks a view whose queries may be answered by a replica
+  view.read_only = True
+  return view
+
+def reads_from_replica():
+  return has_request_context() and g.get('read_only', False) and not g.get('db_wrote', False)
+
+# a text() statement only reads if it is a SELECT, or a WITH query, that modifies, locks and
+# creates nothing and draws no sequence value; a false match only costs a trip to the primary
+TEXT_READ = re.compile(r'^\s*(?:SELECT|WITH)\b', re.I)
+TEXT_WRITE = re.compile(r'\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE|COPY|LOCK|SHARE|INTO|NEXTVAL|SETVAL|SET_CONFIG|PG_ADVISORY_\w+)\b', re.I)
+
+def may_write(clause):
+  # anything but a SELECT may write, raw connections included
+  if isinstance(clause, SelectBase):
+    return False
+  if isinstance(clause, TextClause):
+    return not TEXT_READ.match(clause.text) or TEXT_WRITE.search(clause.text) is not None
+  return True
+
+
+class ReplicaRouter:
+  '''
+  Hands out replica engines round-robin, one per request. A replica is health checked at most
+  once every <retry_after> seconds, and one that fails is skipped until
+  <retry_after> seconds have passed.
+  '''
+
+  def __init__(self, engines, retry_after):
+    self.engines = engines
+    self.retry_after = retry_after
+    self.positions = itertools.count()
+    self.checked_at = {}
+    self.down_until = {}
+
+  def replica(self):
+    # the replica of the current request, picked on its first read, so all its reads see
+    # the same point of replication
+    if 'db_replica' not in g:
+      g.db_replica = self.pick()
+    return g.db_replica
+
+  def pick(self):
+    for _ in range(len(self.engines)):
+      engine = self.engines[next(self.positions) % len(self.engines)]
+      if self.healthy(engine):
+        return engine
+    return None
+
+  def healthy(self, engine):
+    now = time.monotonic()
+    if self.down_until.get(engine, 0) > now:
+      return False
+    if self.checked_at.get(engine, 0) + self.retry_after > now:
+      return True
+    try:
+      with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    except Exception:
+      self.down_until[engine] = now + self.retry_after
+      return False
+    self.checked_at[engine] = now
+    return True
+
+
+class RoutingSession(SignallingSession):
+  '''
+  Sends the SELECTs of read-only requests to a replica. Flushes, DML, textual
+  statements other than plain SELECTs, raw connections and every query of a
+  request after its first write stay on the primary.
+  '''
+
+  def __init__(self, db, **options):
+    self.router = getattr(db, 'router', None)
+    SignallingSession.__init__(self, db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    if self._flushing or may_write(clause):
+      if has_request_context():
+        g.db_wrote = True
+    elif self.router is not None and reads_from_replica():
+      replica = self.router.replica()
+      if replica is not None:
+        return replica
+    return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+  router = None
+
+  def init_app(self, app):
+    SQLAlchemy.init_app(self, app)
+    engines = [self.get_engine(app)]
+    configure_engine(engines[0], app.config)
+    self.router = None
+    if app.config['DATABASE_REPLICA_URLS']:
+      replicas = [create_replica_engine(database_uri(url), app.config) for url in app.config['DATABASE_REPLICA_URLS']]
+      self.router = ReplicaRouter(replicas, app.config['REPLICA_RETRY_SECONDS'])
+      engines += replicas
+    dispose_before_fork(engines)
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+def create_replica_engine(url, config):
+  # pool options only apply to server databases, a SQLite file can stand in for a replica in tests
+  options = engine_options(config) if make_url(url).get_backend_name() == 'postgresql' else {}
+  engine = create_engine(url, **options)
+  configure_engine(engine, config)
+  return engine
+
+
+#----------------------------------------------------------------------------#
+# Async reads.
+#
+# The ASGI entry point (asgi.py) runs the queries of the read-only views on an
+# asyncpg pool. SQLAlchemy 1.3 has no asyncio support, so those queries are
+# still built with the models and are compiled to Postgres SQL here.
+#----------------------------------------------------------------------------#
+
+# asyncpg takes $1, $2, ... placeholders; numeric (:1, :2, ...) compiles to the same positions
+ASYNC_DIALECT = postgresql.dialect(paramstyle='numeric')
+# a connected dialect learns this from the server: standard_conforming_strings has been on
+# by default since Postgres 9.1, so backslashes in literals such as ESCAPE '\' stay single
+ASYNC_DIALECT._backslash_escapes = False
+NUMERIC_PLACEHOLDER = re.compile(r'(?<!:):(\d+)')
+
+def compile_query(query):
+  # a Query or Core statement as asyncpg SQL and its positional parameters
+  compiled = getattr(query, 'statement', query).compile(dialect=ASYNC_DIALECT)
+  params = compiled.construct_params()
+  return NUMERIC_PLACEHOLDER.sub(r'$\1', compiled.string), [params[name] for name in compiled.positiontup]
+
+def asyncpg_dsn(uri):
+  # asyncpg reads libpq style URLs, without SQLAlchemy's +driver suffix
+  return 'postgresql://' + database_uri(uri).split('://', 1)[1]
+
+def asyncpg_options(config):
+  options = {
+    'min_size': config['DB_POOL_SIZE'],
+    'max_size': config['DB_POOL_SIZE'] + config['DB_MAX_OVERFLOW'],
+    'max_inactive_connection_lifetime': config['DB_POOL_RECYCLE'],
+  }
+  if config['DB_PGBOUNCER']:
+    # a server connection is only ours for one transaction, so no prepared statements are
+    # kept on it, and the statement timeout is enforced by the client
+    options['statement_cache_size'] = 0
+    if config['DB_STATEMENT_TIMEOUT']:
+      options['command_timeout'] = config['DB_STATEMENT_TIMEOUT'] / 1000
+  elif config['DB_STATEMENT_TIMEOUT']:
+    options['server_settings'] = {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}
+  return options
+
+
+class Row(dict):
+  '''
+  An asyncpg record with attribute access to its columns, like the rows of a
+  SQLAlchemy query, so both can be passed to the same code.
+  '''
+
+  def __getattr__(self, name):
+    try:
+      return self[name]
+    except KeyError:
+      raise AttributeError(name)
+
+
+class AsyncDatabase:
+  '''
+  asyncpg connection pool on the primary database, sized and configured from
+  the same DB_* settings as the SQLAlchemy engine. The pool is opened inside
+  the server's event loop, at startup or by the first query; concurrent first
+  queries wait for the same pool rather than each opening one.
+  '''
+
+  def __init__(self):
+    self.dsn = None
+    self.options = {}
+    self.acquire_timeout = None
+    self.pool = None
+    self.opening = None
+
+  def init_app(self, app):
+    self.dsn = asyncpg_dsn(app.config['SQLALCHEMY_DATABASE_URI'])
+    self.options = asyncpg_options(app.config)
+    self.acquire_timeout = app.config['DB_POOL_TIMEOUT']
+
+  async def connect(self):
+    # asyncpg is only needed by the ASGI entry point
+    import asyncpg
+    if self.pool is None:
+      # created on first use, so that it belongs to the server's event loop
+      if self.opening is None:
+        self.opening = asyncio.Lock()
+      async with self.opening:
+        if self.pool is None:
+          self.pool = await asyncpg.create_pool(self.dsn, **self.options)
+    return self.pool
+
+  async def close(self):
+    if self.pool is not None:
+      pool, self.pool = self.pool, None
+      await pool.close()
+
+  async def fetch(self, query):
+    sql, params = compile_query(query)
+    pool = await self.connect()
+    async with pool.acquire(timeout=self.acquire_timeout) as connection:
+      return [Row(record) for record in await connection.fetch(sql, *params)]
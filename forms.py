@@ -1,7 +1,10 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField
-from wtforms.validators import DataRequired, AnyOf, URL, Length, Optional
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, DateField, BooleanField, TextAreaField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Length, Optional, NumberRange
+
+from choices import GENRES, SHOW_DURATION_MINUTES, SHOW_MAX_DURATION_MINUTES, RECURRENCE_FREQUENCIES
+
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +18,38 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration_minutes = IntegerField(
+        'duration_minutes',
+        validators=[Optional(), NumberRange(min=1, max=SHOW_MAX_DURATION_MINUTES)],
+        default=SHOW_DURATION_MINUTES
+    )
+
+class RecurringShowForm(ShowForm):
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired()]
+    )
+    venue_id = IntegerField(
+        'venue_id', validators=[DataRequired()]
+    )
+    frequency = SelectField(
+        'frequency', validators=[DataRequired()],
+        choices=RECURRENCE_FREQUENCIES,
+        default='weekly'
+    )
+    interval = IntegerField(
+        # repeats every <interval> days, weeks or months
+        'interval',
+        validators=[Optional(), NumberRange(min=1, max=52)],
+        default=1
+    )
+    until = DateField(
+        # the date of the last show, included
+        'until', validators=[DataRequired()]
+    )
+    skip_conflicts = BooleanField(
+        # book the free dates when some are taken, instead of none
+        'skip_conflicts'
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -91,27 +126,7 @@ class VenueForm(Form):
     genres = SelectMultipleField(
         # TODO implement enum restriction
         'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        choices=[(genre, genre) for genre in GENRES]
     )
     seeking_talent = BooleanField(
         'seeking_talent', default='checked'
@@ -205,27 +220,7 @@ class ArtistForm(Form):
     genres = SelectMultipleField(
         # TODO implement enum restriction
         'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        choices=[(genre, genre) for genre in GENRES]
     )
     facebook_link = StringField(
         # TODO implement enum restriction
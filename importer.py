@@ -0,0 +1,287 @@
+import csv
+import io
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+
+from choices import SHOW_DURATION_MINUTES
+from forms import VenueForm, ArtistForm, ShowForm
+from partitions import SHOW_PERIOD, OVERLAPPING_START, create_partitions, month_start
+
+#----------------------------------------------------------------------------#
+# Bulk import of venue, artist and show catalogues.
+#
+# Rows are read from CSV or NDJSON files, validated with the same forms the
+# create pages use and written to the database with COPY, one batch at a time.
+# A batch the database refuses is written again row by row, each row in its
+# own savepoint, so only the failing rows are rejected. Shows are checked for
+# overlaps with the same probe as the booking statement, which also catches
+# those across a month boundary that the partition constraints can't see.
+#----------------------------------------------------------------------------#
+
+ENTITY_FORMS = {'venues': VenueForm, 'artists': ArtistForm, 'shows': ShowForm}
+
+# form fields stored under a different column name, as in the create/edit controllers
+COLUMN_NAMES = {
+  'venues': {'website_link': 'website'},
+  'artists': {'website_link': 'website', 'seeking_description': 'seeking_talent'},
+  'shows': {},
+}
+
+FALSE_VALUES = ('', '0', 'false', 'f', 'n', 'no', 'off')
+
+# COPY marker for NULL, so that empty strings survive as empty strings
+COPY_NULL = '\\N'
+
+# locks the venues or artists of a batch of shows, venues first like book_shows() in app.py
+LOCK_BOOKED = '''
+  SELECT 1 FROM "{table}" WHERE id = ANY(CAST(:ids AS integer[])) ORDER BY id FOR UPDATE
+'''
+
+# for each show of a batch, whether its venue or its artist already has a show then
+PROBE_BOOKED = text(f'''
+  WITH requested AS (
+    SELECT number, venue, artist, tsrange(requested_start, requested_start + duration * interval '1 minute') AS period
+    FROM unnest(CAST(:venue_ids AS integer[]), CAST(:artist_ids AS integer[]), CAST(:start_times AS timestamp[]), CAST(:durations AS integer[]))
+      WITH ORDINALITY AS requested(venue, artist, requested_start, duration, number)
+  )
+  SELECT number,
+    EXISTS (SELECT 1 FROM "Show" WHERE venue_id = venue AND {SHOW_PERIOD} && period AND {OVERLAPPING_START} AND NOT cancelled) AS venue_booked,
+    EXISTS (SELECT 1 FROM "Show" WHERE artist_id = artist AND {SHOW_PERIOD} && period AND {OVERLAPPING_START} AND NOT cancelled) AS artist_booked
+  FROM requested
+  ORDER BY number
+''')
+
+
+def read_rows(path):
+  # yields (line number, record, errors) triples, errors only for a line that isn't a JSON
+  # object, with the line itself as the record. CSV cells of multi-valued fields are ;-separated
+  with open(path, newline='') as source:
+    if path.endswith('.csv'):
+      reader = csv.DictReader(source)
+      for record in reader:
+        yield reader.line_num, record, None
+    else:
+      for number, line in enumerate(source, 1):
+        if not line.strip():
+          continue
+        try:
+          record = json.loads(line)
+        except ValueError as error:
+          yield number, line.strip(), {'row': [f'Not valid JSON: {error}']}
+          continue
+        if not isinstance(record, dict):
+          yield number, record, {'row': ['Not a JSON object.']}
+          continue
+        yield number, record, None
+
+def to_formdata(record, form_class):
+  formdata = MultiDict()
+  # dir() also lists the fields a form inherits
+  for field in dir(form_class):
+    unbound = getattr(form_class, field)
+    if not hasattr(unbound, 'field_class') or record.get(field) is None:
+      continue
+    value = record[field]
+    field_type = unbound.field_class.__name__
+    if field_type == 'SelectMultipleField':
+      values = value if isinstance(value, list) else [part.strip() for part in str(value).split(';') if part.strip()]
+      formdata.setlist(field, values)
+    elif field_type == 'BooleanField':
+      if value is True or (value is not False and str(value).strip().lower() not in FALSE_VALUES):
+        formdata.add(field, 'y')
+    else:
+      formdata.add(field, str(value))
+  return formdata
+
+def validate_row(entity, record, known_ids):
+  # returns (column values, None) for a valid row and (None, errors) otherwise
+  form_class = ENTITY_FORMS[entity]
+  form = form_class(formdata=to_formdata(record, form_class), meta={'csrf': False})
+  if not form.validate():
+    return None, form.errors
+  names = COLUMN_NAMES[entity]
+  values = {names.get(name, name): value for name, value in form.data.items()}
+
+  if entity == 'shows':
+    errors = {}
+    for field in ('venue_id', 'artist_id'):
+      try:
+        values[field] = int(values[field])
+      except (TypeError, ValueError):
+        errors[field] = ['Not a valid id.']
+        continue
+      if values[field] not in known_ids[field]:
+        errors[field] = ['No such record.']
+    if errors:
+      return None, errors
+    values['duration_minutes'] = values['duration_minutes'] or SHOW_DURATION_MINUTES
+  return values, None
+
+def overlapping_rows(batch, booked):
+  # adds the indexes of the shows of a batch overlapping an earlier one of the batch for the
+  # same venue or artist to <booked>, since no constraint sees the two when they fall into
+  # different partitions
+  for field, entity in (('venue_id', 'venue'), ('artist_id', 'artist')):
+    ends = {}
+    for index in sorted(range(len(batch)), key=lambda index: batch[index]['start_time']):
+      row = batch[index]
+      if index in booked:
+        continue
+      end = row['start_time'] + timedelta(minutes=row['duration_minutes'])
+      if row['start_time'] < ends.get(row[field], row['start_time']):
+        booked[index] = entity
+      else:
+        ends[row[field]] = end
+  return booked
+
+def pg_array(values):
+  return '{' + ','.join('"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"' for value in values) + '}'
+
+def copy_rows(connection, table, columns, rows):
+  # writes a batch with COPY ... FROM STDIN
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    writer.writerow([
+      COPY_NULL if row[column] is None else
+      pg_array(row[column]) if isinstance(row[column], list) else
+      ('t' if row[column] else 'f') if isinstance(row[column], bool) else
+      row[column].isoformat() if isinstance(row[column], datetime) else
+      row[column]
+      for column in columns
+    ])
+  buffer.seek(0)
+  column_list = ', '.join(f'"{column}"' for column in columns)
+  with connection.cursor() as cursor:
+    cursor.copy_expert(f"COPY \"{table}\" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+
+
+class Importer:
+  '''
+  Loads one file into the table behind <entity>. Valid rows are buffered and
+  copied in batches of <batch_size>, each batch in its own transaction, while
+  invalid rows are collected as rejects with their line number and errors.
+  Rows the database refuses, and shows overlapping one already booked, are
+  rejected the same way.
+  '''
+
+  def __init__(self, db, models, entity, batch_size):
+    self.db = db
+    self.models = models
+    self.entity = entity
+    self.model = models[entity]
+    self.batch_size = batch_size
+    self.loaded = 0
+    self.rejects = []
+    # COPY runs on the DBAPI connection, whose errors SQLAlchemy doesn't wrap
+    self.copy_errors = (DBAPIError, db.engine.dialect.dbapi.Error)
+    self.known_ids = {}
+    if entity == 'shows':
+      # existence checks happen in memory so one bad row can't abort a whole COPY
+      self.known_ids = {
+        'venue_id': {id for (id,) in db.session.query(models['venues'].id).filter(models['venues'].deleted_at.is_(None))},
+        'artist_id': {id for (id,) in db.session.query(models['artists'].id)},
+      }
+
+  def run(self, path):
+    batch = []
+    for line, record, errors in read_rows(path):
+      values, errors = (None, errors) if errors else validate_row(self.entity, record, self.known_ids)
+      if errors:
+        self.reject(line, errors, record)
+        continue
+      batch.append((line, record, values))
+      if len(batch) >= self.batch_size:
+        self.flush(batch)
+        batch = []
+    if batch:
+      self.flush(batch)
+    return self.loaded, self.rejects
+
+  def reject(self, line, errors, record):
+    self.rejects.append({'line': line, 'errors': errors, 'row': record})
+
+  def flush(self, batch):
+    now = datetime.now()
+    columns = sorted(batch[0][2])
+    if self.entity == 'shows':
+      # COPY skips the Show mapper events, keep the upcoming show counters in step here
+      for line, record, row in batch:
+        row['counted_upcoming'] = row['start_time'] > now
+      columns.append('counted_upcoming')
+      # a show of a month without a partition would land in the default partition
+      if create_partitions(self.db.session, {month_start(row['start_time']) for line, record, row in batch}):
+        self.db.session.commit()
+    try:
+      if self.entity == 'shows':
+        batch = self.unbooked(batch)
+      rows = [row for line, record, row in batch]
+      try:
+        with self.db.session.begin_nested():
+          copy_rows(self.db.session.connection().connection, self.model.__tablename__, columns, rows)
+      except self.copy_errors:
+        rows = self.insert_rows(batch, columns)
+      if self.entity == 'shows':
+        self.count_upcoming_shows([row for row in rows if row['counted_upcoming']])
+      self.db.session.commit()
+    except Exception:
+      self.db.session.rollback()
+      raise
+    self.loaded += len(rows)
+
+  def unbooked(self, batch):
+    # the shows of the batch whose venue and artist are free then, the others are rejected. The
+    # venues and artists stay locked until the batch commits, so no booking can slip in between
+    rows = [row for line, record, row in batch]
+    for entity, field in (('venues', 'venue_id'), ('artists', 'artist_id')):
+      self.db.session.execute(
+        text(LOCK_BOOKED.format(table=self.models[entity].__tablename__)),
+        {'ids': sorted({row[field] for row in rows})}
+      )
+    probed = self.db.session.execute(PROBE_BOOKED, {
+      **{name: [row[field] for row in rows] for name, field in (('venue_ids', 'venue_id'), ('artist_ids', 'artist_id'))},
+      'start_times': [row['start_time'] for row in rows],
+      'durations': [row['duration_minutes'] for row in rows],
+    }).fetchall()
+    booked = {
+      probe.number - 1: 'venue' if probe.venue_booked else 'artist'
+      for probe in probed if probe.venue_booked or probe.artist_booked
+    }
+    overlapping_rows(rows, booked)
+    for index, entity in sorted(booked.items()):
+      line, record, row = batch[index]
+      self.reject(line, {f'{entity}_id': [f'The {entity} is already booked at that time.']}, record)
+    return [entry for index, entry in enumerate(batch) if index not in booked]
+
+  def insert_rows(self, batch, columns):
+    # writes the rows of a batch COPY refused one by one, each in a savepoint, and rejects those
+    # the database refuses; returns the rows written
+    table = self.model.__table__
+    written = []
+    for line, record, row in batch:
+      try:
+        with self.db.session.begin_nested():
+          self.db.session.execute(table.insert().values({column: row[column] for column in columns}))
+      except DBAPIError as error:
+        self.reject(line, {'row': [str(error.orig).strip()]}, record)
+        continue
+      written.append(row)
+    return written
+
+  def count_upcoming_shows(self, upcoming):
+    for entity, foreign_key in (('venues', 'venue_id'), ('artists', 'artist_id')):
+      table = self.models[entity].__table__
+      counts = Counter(row[foreign_key] for row in upcoming)
+      if not counts:
+        continue
+      self.db.session.execute(
+        table.update()
+          .where(table.c.id == bindparam('entity_id'))
+          .values(upcoming_show_count=table.c.upcoming_show_count + bindparam('shows')),
+        [{'entity_id': id, 'shows': shows} for id, shows in counts.items()]
+      )
@@ -0,0 +1,147 @@
+import time
+from threading import Lock
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Per-route request metrics in the Prometheus text format.
+#
+# Latency, SQL statement counts and time spent in the database are recorded
+# per endpoint. Statements are counted with engine events on every Engine,
+# so queries sent to replicas are included. A streamed response, such as an
+# export, is recorded once it has been sent, with the statements it ran.
+#
+# The series are kept in memory per process and not shared between worker
+# processes, so a scrape sees the worker that happened to answer it.
+#----------------------------------------------------------------------------#
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def label_text(labels):
+  escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+  return ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped))
+
+
+class Histogram:
+
+  def __init__(self, name, help, buckets):
+    self.name = name
+    self.help = help
+    self.buckets = buckets
+    self.series = {}
+
+  def observe(self, labels, value):
+    counts = self.series.setdefault(labels, [0] * len(self.buckets) + [0, 0.0])
+    for position, bound in enumerate(self.buckets):
+      if value <= bound:
+        counts[position] += 1
+    counts[-2] += 1
+    counts[-1] += value
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+    for labels, counts in sorted(self.series.items()):
+      for bound, count in zip(self.buckets, counts):
+        lines.append(f'{self.name}_bucket{{{label_text(labels + (("le", bound),))}}} {count}')
+      lines.append(f'{self.name}_bucket{{{label_text(labels + (("le", "+Inf"),))}}} {counts[-2]}')
+      lines.append(f'{self.name}_sum{{{label_text(labels)}}} {counts[-1]}')
+      lines.append(f'{self.name}_count{{{label_text(labels)}}} {counts[-2]}')
+    return lines
+
+
+class Counter:
+
+  def __init__(self, name, help):
+    self.name = name
+    self.help = help
+    self.series = {}
+
+  def inc(self, labels, amount=1):
+    self.series[labels] = self.series.get(labels, 0) + amount
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+    for labels, value in sorted(self.series.items()):
+      lines.append(f'{self.name}{{{label_text(labels)}}} {value}')
+    return lines
+
+
+class RequestMetrics:
+  '''
+  Collects per-endpoint request metrics for one process. Requests issuing
+  more than <query_threshold> SQL statements are counted separately and
+  logged, which is how N+1 query loops show up.
+  '''
+
+  def __init__(self):
+    self.lock = Lock()
+    self.latency = Histogram('fyyur_request_duration_seconds', 'Request latency by endpoint.', LATENCY_BUCKETS)
+    self.queries = Histogram('fyyur_request_sql_queries', 'SQL statements issued per request by endpoint.', QUERY_BUCKETS)
+    self.db_time = Histogram('fyyur_request_db_seconds', 'Time spent executing SQL per request by endpoint.', LATENCY_BUCKETS)
+    self.over_threshold = Counter('fyyur_request_query_threshold_exceeded_total', 'Requests that issued more SQL statements than the configured threshold.')
+    self.query_threshold = None
+    self.logger = None
+
+  def init_app(self, app):
+    self.query_threshold = app.config['SQL_QUERY_THRESHOLD']
+    self.logger = app.logger
+    app.before_request(self.start_request)
+    app.after_request(self.finish_request)
+    # the listeners are global, every app created after the first one shares them
+    if not event.contains(Engine, 'before_cursor_execute', self.start_statement):
+      event.listen(Engine, 'before_cursor_execute', self.start_statement)
+      event.listen(Engine, 'after_cursor_execute', self.finish_statement)
+
+  def start_request(self):
+    g.metrics_started = time.perf_counter()
+    g.sql_queries = 0
+    g.db_seconds = 0.0
+
+  def finish_request(self, response):
+    if 'metrics_started' not in g:
+      return response
+    labels = (('endpoint', request.endpoint or 'unknown'), ('method', request.method))
+    target = f'{request.method} {request.path}'
+    # the statements of a streamed body run after this, on the same g, until the server closes the response
+    stats = g._get_current_object()
+    if response.is_streamed:
+      response.call_on_close(lambda: self.record_request(labels, target, stats))
+    else:
+      self.record_request(labels, target, stats)
+    return response
+
+  def record_request(self, labels, target, stats):
+    elapsed = time.perf_counter() - stats.metrics_started
+    with self.lock:
+      self.latency.observe(labels, elapsed)
+      self.queries.observe(labels, stats.sql_queries)
+      self.db_time.observe(labels, stats.db_seconds)
+      if stats.sql_queries > self.query_threshold:
+        self.over_threshold.inc(labels)
+    if stats.sql_queries > self.query_threshold:
+      self.logger.warning('%s issued %d SQL statements (threshold %d)', target, stats.sql_queries, self.query_threshold)
+
+  def start_statement(self, conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+      conn.info['statement_started'] = time.perf_counter()
+
+  def finish_statement(self, conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('statement_started', None)
+    if started is not None and has_request_context() and 'sql_queries' in g:
+      g.sql_queries += 1
+      g.db_seconds += time.perf_counter() - started
+
+  def record_statements(self, count, seconds):
+    # statements sent without a SQLAlchemy Engine, such as the asyncpg queries of asgi.py
+    if has_request_context() and 'sql_queries' in g:
+      g.sql_queries += count
+      g.db_seconds += seconds
+
+  def render(self):
+    with self.lock:
+      lines = self.latency.render() + self.queries.render() + self.db_time.render() + self.over_threshold.render()
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,44 @@
+"""denormalized upcoming show counters on Venue and Artist
+
+Revision ID: 0124290b801b
+Revises: 2923560b10d9
+Create Date: 2026-10-18 11:26:04.873310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0124290b801b'
+down_revision = '2923560b10d9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('upcoming_show_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('upcoming_show_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Show', sa.Column('counted_upcoming', sa.Boolean(), server_default='false', nullable=False))
+    op.create_index('ix_Show_counted_upcoming_start_time', 'Show', ['start_time'], unique=False,
+                    postgresql_where=sa.text('counted_upcoming'))
+
+    # backfill the flags and counters from the existing shows
+    op.execute('UPDATE "Show" SET counted_upcoming = true WHERE start_time > LOCALTIMESTAMP')
+    op.execute('''
+        UPDATE "Venue" SET upcoming_show_count = counts.shows
+        FROM (SELECT venue_id, count(*) AS shows FROM "Show" WHERE counted_upcoming GROUP BY venue_id) AS counts
+        WHERE "Venue".id = counts.venue_id
+    ''')
+    op.execute('''
+        UPDATE "Artist" SET upcoming_show_count = counts.shows
+        FROM (SELECT artist_id, count(*) AS shows FROM "Show" WHERE counted_upcoming GROUP BY artist_id) AS counts
+        WHERE "Artist".id = counts.artist_id
+    ''')
+
+
+def downgrade():
+    op.drop_index('ix_Show_counted_upcoming_start_time', table_name='Show')
+    op.drop_column('Show', 'counted_upcoming')
+    op.drop_column('Artist', 'upcoming_show_count')
+    op.drop_column('Venue', 'upcoming_show_count')
@@ -0,0 +1,35 @@
+"""show durations and venue/artist double-booking exclusion constraints
+
+Revision ID: 5a7ecefde9f6
+Revises: c41a80ee6572
+Create Date: 2026-10-18 20:24:37.550912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7ecefde9f6'
+down_revision = 'c41a80ee6572'
+branch_labels = None
+depends_on = None
+
+SHOW_PERIOD = "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+
+
+def upgrade():
+    # btree_gist lets the integer venue_id / artist_id equality share a GiST index with the time range
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('Show', sa.Column('duration_minutes', sa.Integer(), server_default='120', nullable=False))
+    op.create_check_constraint('ck_Show_duration_minutes', 'Show', 'duration_minutes > 0')
+    # fails, naming the two conflicting shows, if existing shows already overlap
+    op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_booking" EXCLUDE USING gist (venue_id WITH =, {SHOW_PERIOD} WITH &&)')
+    op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_artist_booking" EXCLUDE USING gist (artist_id WITH =, {SHOW_PERIOD} WITH &&)')
+
+
+def downgrade():
+    op.drop_constraint('ex_Show_artist_booking', 'Show')
+    op.drop_constraint('ex_Show_venue_booking', 'Show')
+    op.drop_constraint('ck_Show_duration_minutes', 'Show')
+    op.drop_column('Show', 'duration_minutes')
@@ -0,0 +1,72 @@
+"""cancel the upcoming shows of soft-deleted venues
+
+Revision ID: a2d6e4f8c1b3
+Revises: f1c3a6e8b2d4
+Create Date: 2026-10-19 13:42:08.915263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2d6e4f8c1b3'
+down_revision = 'f1c3a6e8b2d4'
+branch_labels = None
+depends_on = None
+
+SHOW_PERIOD = "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+PARTITIONS = '''
+    SELECT child.relname
+    FROM pg_inherits JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = '"Show"'::regclass
+'''
+# cancelled shows that overlap a show of the same venue or artist booked since
+CONFLICTS = '''
+    SELECT DISTINCT cancelled.id
+    FROM "Show" AS cancelled JOIN "Show" AS booked
+      ON (booked.venue_id = cancelled.venue_id OR booked.artist_id = cancelled.artist_id)
+      AND NOT booked.cancelled
+      AND tsrange(booked.start_time, booked.start_time + booked.duration_minutes * interval '1 minute')
+        && tsrange(cancelled.start_time, cancelled.start_time + cancelled.duration_minutes * interval '1 minute')
+    WHERE cancelled.cancelled
+    ORDER BY cancelled.id
+    LIMIT 50
+'''
+
+
+def replace_booking_constraints(where):
+    # swaps the booking constraints of every partition, one partition and transaction at a
+    # time: each is locked while its GiST indexes are rebuilt, the others stay available
+    connection = op.get_bind()
+    partitions = [row[0] for row in connection.execute(sa.text(PARTITIONS))]
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(f'ALTER TABLE "{partition}" ' + ', '.join(
+                f'DROP CONSTRAINT "ex_{partition}_{entity}_booking", ADD CONSTRAINT "ex_{partition}_{entity}_booking" '
+                f'EXCLUDE USING gist ({entity}_id WITH =, {SHOW_PERIOD} WITH &&){where}'
+                for entity in ('venue', 'artist')
+            ))
+
+
+def upgrade():
+    # soft deletes now keep the upcoming shows of the venue but mark them cancelled, which
+    # frees its artists; those of venues deleted before are marked here. They were already
+    # taken off the counters when the venue was deleted
+    op.add_column('Show', sa.Column('cancelled', sa.Boolean(), server_default='false', nullable=False))
+    op.execute('''
+        UPDATE "Show" SET cancelled = true, updated_at = timezone('utc', now())
+        WHERE start_time > LOCALTIMESTAMP
+          AND venue_id IN (SELECT id FROM "Venue" WHERE deleted_at IS NOT NULL)
+    ''')
+    replace_booking_constraints(' WHERE (NOT cancelled)')
+
+
+def downgrade():
+    # the cancelled shows book their venue and artist again, which fails for those whose
+    # time has been given to another show since: they have to be moved or deleted first
+    conflicts = [row[0] for row in op.get_bind().execute(sa.text(CONFLICTS))]
+    if conflicts:
+        raise RuntimeError(f'cancelled shows {conflicts} overlap shows booked since, move or delete them first')
+    replace_booking_constraints('')
+    op.drop_column('Show', 'cancelled')
@@ -0,0 +1,28 @@
+"""updated_at timestamps on Venue, Artist and Show
+
+Revision ID: a7a6c2b91aeb
+Revises: 0124290b801b
+Create Date: 2026-10-18 12:41:52.306174
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7a6c2b91aeb'
+down_revision = '0124290b801b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text('LOCALTIMESTAMP'), nullable=False))
+        op.create_index(f'ix_{table}_updated_at', table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_index(f'ix_{table}_updated_at', table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,197 @@
+"""partition Show by month of start_time, online
+
+Revision ID: b8f4c2d17e65
+Revises: e3b7d9a41c26
+Create Date: 2026-10-19 01:12:48.530274
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f4c2d17e65'
+down_revision = 'e3b7d9a41c26'
+branch_labels = None
+depends_on = None
+
+SHOW_PERIOD = "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+SHOW_MAX_DURATION_MINUTES = 24 * 60
+COLUMNS = 'id, venue_id, artist_id, start_time, duration_minutes, counted_upcoming, updated_at'
+INDEXES = [
+    ('ix_Show_updated_at', ['updated_at'], {}),
+    ('ix_Show_venue_id_start_time', ['venue_id', 'start_time'], {}),
+    ('ix_Show_artist_id_start_time', ['artist_id', 'start_time'], {}),
+    ('ix_Show_start_time', ['start_time'], {}),
+    ('ix_Show_counted_upcoming_start_time', ['start_time'], {'postgresql_where': sa.text('counted_upcoming')}),
+]
+# shows copied per transaction, and the changes left over once the copy caught up
+BATCH_SIZE = 50000
+CATCH_UP_CHANGES = 1000
+# replays before the rest is left to the locked swap, and failed replays in a row before giving up
+CATCH_UP_ROUNDS = 50
+CATCH_UP_FAILURES = 5
+MONTHS_AHEAD = 12
+
+# the shows written since the copy started, replayed onto the new table by id
+REPLAY_CHANGES = f'''
+DO $$
+DECLARE
+    last bigint := (SELECT max(change) FROM "Show_changes");
+BEGIN
+    DELETE FROM "Show_partitioned" WHERE id IN (SELECT id FROM "Show_changes" WHERE change <= last);
+    INSERT INTO "Show_partitioned" ({COLUMNS})
+    SELECT {COLUMNS} FROM "Show" WHERE id IN (SELECT id FROM "Show_changes" WHERE change <= last);
+    DELETE FROM "Show_changes" WHERE change <= last;
+END
+$$
+'''
+
+
+def month_name(month):
+    return f'Show_{month.year}_{month.month:02d}'
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def booking_constraints(partition):
+    return [
+        f'ALTER TABLE "{partition}" ADD CONSTRAINT "ex_{partition}_{entity}_booking" '
+        f'EXCLUDE USING gist ({entity}_id WITH =, {SHOW_PERIOD} WITH &&)'
+        for entity in ('venue', 'artist')
+    ]
+
+def show_table(name, *constraints, **kw):
+    return op.create_table(name,
+        sa.Column('id', sa.Integer(), server_default=sa.text('nextval(\'"Show_id_seq"\'::regclass)'), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('duration_minutes', sa.Integer(), server_default='120', nullable=False),
+        sa.Column('counted_upcoming', sa.Boolean(), server_default='false', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('LOCALTIMESTAMP'), nullable=False),
+        sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], name='Show_venue_id_fkey', onupdate='CASCADE', ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], name='Show_artist_id_fkey', onupdate='CASCADE', ondelete='CASCADE'),
+        *constraints,
+        **kw
+    )
+
+
+def upgrade():
+    # "Show" is copied into a partitioned table while the app keeps writing to it. A trigger
+    # logs the ids of the shows written meanwhile, which are copied again until the copy has
+    # caught up; "Show" is only locked for the last few changes and the swap
+    connection = op.get_bind()
+    too_long = connection.execute(sa.text(
+        f'SELECT count(*) FROM "Show" WHERE duration_minutes > {SHOW_MAX_DURATION_MINUTES}')).scalar()
+    if too_long:
+        raise RuntimeError(f'{too_long} shows last longer than {SHOW_MAX_DURATION_MINUTES} minutes, shorten them first')
+
+    # what an earlier, interrupted run left behind
+    op.execute('DROP TRIGGER IF EXISTS "Show_changes" ON "Show"')
+    op.execute('DROP FUNCTION IF EXISTS "Show_log_change"()')
+    op.execute('DROP TABLE IF EXISTS "Show_changes", "Show_partitioned"')
+
+    show_table('Show_partitioned',
+        sa.PrimaryKeyConstraint('id', 'start_time', name='Show_partitioned_pkey'),
+        sa.CheckConstraint(f'duration_minutes BETWEEN 1 AND {SHOW_MAX_DURATION_MINUTES}', name='ck_Show_duration_minutes'),
+        postgresql_partition_by='RANGE (start_time)',
+    )
+    # a partition for every month with shows and for the coming months, the rest go to the default one
+    months = {row[0] for row in connection.execute(sa.text('SELECT DISTINCT date_trunc(\'month\', start_time)::date FROM "Show"'))}
+    current = date.today().replace(day=1)
+    months |= {add_months(current, offset) for offset in range(MONTHS_AHEAD + 1)}
+    partitions = ['Show_default']
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show_partitioned" DEFAULT')
+    for month in sorted(months):
+        partitions.append(month_name(month))
+        op.execute(f'''CREATE TABLE "{month_name(month)}" PARTITION OF "Show_partitioned" '''
+                   f'''FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')''')
+
+    op.execute('CREATE TABLE "Show_changes" (change bigserial PRIMARY KEY, id integer NOT NULL)')
+    op.execute('''
+        CREATE FUNCTION "Show_log_change"() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO "Show_changes" (id) VALUES (OLD.id);
+            ELSE
+                INSERT INTO "Show_changes" (id) VALUES (NEW.id);
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    ''')
+    op.execute('''
+        CREATE TRIGGER "Show_changes" AFTER INSERT OR UPDATE OR DELETE ON "Show"
+        FOR EACH ROW EXECUTE FUNCTION "Show_log_change"()
+    ''')
+
+    with op.get_context().autocommit_block():
+        # the trigger is committed from here on, every show written after a batch is logged
+        last_id = connection.execute(sa.text('SELECT max(id) FROM "Show"')).scalar() or 0
+        for start in range(0, last_id + 1, BATCH_SIZE):
+            op.execute(f'''
+                INSERT INTO "Show_partitioned" ({COLUMNS})
+                SELECT {COLUMNS} FROM "Show" WHERE id >= {start} AND id < {start + BATCH_SIZE}
+            ''')
+
+        # built once the rows are in, rather than updated row by row; renamed at the swap
+        for name, columns, kw in INDEXES:
+            op.create_index(name.replace('Show', 'Show_partitioned', 1), 'Show_partitioned', columns, unique=False, **kw)
+        for partition in partitions:
+            for statement in booking_constraints(partition):
+                op.execute(statement)
+        connection.execute(sa.text('ANALYZE "Show_partitioned"'))
+
+        failures = 0
+        for _ in range(CATCH_UP_ROUNDS):
+            if connection.execute(sa.text('SELECT count(*) FROM "Show_changes"')).scalar() <= CATCH_UP_CHANGES:
+                break
+            try:
+                op.execute(REPLAY_CHANGES)
+                failures = 0
+            except IntegrityError as error:
+                # a show was moved onto the time another one just left, and only one of the two
+                # was replayed; the next round replays the other. Shows that keep conflicting
+                # overlap for real, and have to be fixed by hand
+                failures += 1
+                if failures >= CATCH_UP_FAILURES:
+                    ids = [row[0] for row in connection.execute(sa.text('SELECT DISTINCT id FROM "Show_changes" ORDER BY id LIMIT 50'))]
+                    detail = getattr(getattr(error.orig, 'diag', None), 'message_detail', None) or error.orig
+                    raise RuntimeError(f'replaying the changes to shows {ids} failed {failures} times in a row: {detail}') from error
+
+    # the swap, in one transaction: the app's queries wait for the lock, then see the new table
+    op.execute('LOCK TABLE "Show" IN ACCESS EXCLUSIVE MODE')
+    op.execute(REPLAY_CHANGES)
+    op.execute('DROP TRIGGER "Show_changes" ON "Show"')
+    op.execute('DROP FUNCTION "Show_log_change"()')
+    op.execute('DROP TABLE "Show_changes"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show_partitioned".id')
+    op.execute('DROP TABLE "Show"')
+    op.rename_table('Show_partitioned', 'Show')
+    op.execute('ALTER TABLE "Show" RENAME CONSTRAINT "Show_partitioned_pkey" TO "Show_pkey"')
+    for name, columns, kw in INDEXES:
+        op.execute(f'''ALTER INDEX "{name.replace('Show', 'Show_partitioned', 1)}" RENAME TO "{name}"''')
+
+
+def downgrade():
+    # back to one plain table, in one transaction that blocks the app while it copies
+    op.execute('LOCK TABLE "Show" IN ACCESS EXCLUSIVE MODE')
+    show_table('Show_plain',
+        sa.PrimaryKeyConstraint('id', name='Show_plain_pkey'),
+        sa.CheckConstraint('duration_minutes > 0', name='ck_Show_duration_minutes'),
+    )
+    op.execute(f'INSERT INTO "Show_plain" ({COLUMNS}) SELECT {COLUMNS} FROM "Show"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show_plain".id')
+    # drops the partitions with it, the detached ones stay behind
+    op.execute('DROP TABLE "Show"')
+    op.rename_table('Show_plain', 'Show')
+    op.execute('ALTER TABLE "Show" RENAME CONSTRAINT "Show_plain_pkey" TO "Show_pkey"')
+    for name, columns, kw in INDEXES:
+        op.create_index(name, 'Show', columns, unique=False, **kw)
+    op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_booking" EXCLUDE USING gist (venue_id WITH =, {SHOW_PERIOD} WITH &&)')
+    op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_artist_booking" EXCLUDE USING gist (artist_id WITH =, {SHOW_PERIOD} WITH &&)')
@@ -0,0 +1,50 @@
+"""genres as varchar[] with GIN indexes on Venue and Artist
+
+Revision ID: c41a80ee6572
+Revises: a7a6c2b91aeb
+Create Date: 2026-10-18 19:52:10.418307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41a80ee6572'
+down_revision = 'a7a6c2b91aeb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # earlier migrations created genres as VARCHAR(120) while the models write arrays,
+    # which Postgres stored as '{Jazz,"Rock n Roll"}' text; parse those into real arrays
+    columns = {
+        table: {column['name']: column['type'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+        for table in ('Venue', 'Artist')
+    }
+    for table in ('Venue', 'Artist'):
+        if not isinstance(columns[table]['genres'], postgresql.ARRAY):
+            op.alter_column(
+                table, 'genres',
+                existing_type=sa.VARCHAR(length=120),
+                type_=postgresql.ARRAY(sa.String()),
+                existing_nullable=False,
+                postgresql_using="CASE WHEN left(genres, 1) = '{' THEN genres::varchar[] ELSE string_to_array(genres, ',')::varchar[] END"
+            )
+        op.create_index(f'ix_{table}_genres', table, ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    # back to the '{Jazz,"Rock n Roll"}' text the upgrade parses; a list too long for
+    # VARCHAR(120) fails the downgrade rather than being cut off
+    for table in ('Artist', 'Venue'):
+        op.drop_index(f'ix_{table}_genres', table_name=table)
+        op.alter_column(
+            table, 'genres',
+            existing_type=postgresql.ARRAY(sa.String()),
+            type_=sa.VARCHAR(length=120),
+            existing_nullable=False,
+            postgresql_using='genres::text'
+        )
@@ -0,0 +1,29 @@
+"""page the venue listing by area: add id to ix_Venue_city_state
+
+Revision ID: d5e1a9c3f7b2
+Revises: b8f4c2d17e65
+Create Date: 2026-10-19 09:20:14.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e1a9c3f7b2'
+down_revision = 'b8f4c2d17e65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the listing seeks on (city, state, id), the area lookups still use the leading columns
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state', 'id'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NULL'))
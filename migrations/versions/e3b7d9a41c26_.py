@@ -0,0 +1,65 @@
+"""venue soft delete with partial indexes, and the VenueArchive table
+
+Revision ID: e3b7d9a41c26
+Revises: 5a7ecefde9f6
+Create Date: 2026-10-18 23:41:12.208416
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b7d9a41c26'
+down_revision = '5a7ecefde9f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a nullable column without a default is added without rewriting the table
+    op.add_column('Venue', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    # the listing, search, genre and area indexes only cover the venues that are not deleted
+    op.create_index('ix_Venue_live_id', 'Venue', ['id'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.drop_index('ix_Venue_genres', table_name='Venue')
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], unique=False,
+                    postgresql_using='gin', postgresql_where=sa.text('deleted_at IS NULL'))
+    # and the purge finds the deleted ones through this one
+    op.create_index('ix_Venue_deleted_at', 'Venue', ['deleted_at'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+    op.create_table('VenueArchive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), server_default=sa.text('LOCALTIMESTAMP'), nullable=False),
+        sa.Column('venue', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('shows', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('VenueArchive')
+    op.drop_index('ix_Venue_deleted_at', table_name='Venue')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False)
+    op.drop_index('ix_Venue_live_id', table_name='Venue')
+    # soft-deleted venues would show up again once the column is gone
+    op.execute('DELETE FROM "Venue" WHERE deleted_at IS NOT NULL')
+    op.drop_column('Venue', 'deleted_at')
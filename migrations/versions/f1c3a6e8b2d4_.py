@@ -0,0 +1,96 @@
+"""keep updated_at in UTC
+
+Revision ID: f1c3a6e8b2d4
+Revises: d5e1a9c3f7b2
+Create Date: 2026-10-19 11:05:37.204918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c3a6e8b2d4'
+down_revision = 'd5e1a9c3f7b2'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+# rows shifted per transaction
+BATCH_SIZE = 10000
+# set on the migration's own connection, whose updates the trigger doesn't log
+CONVERTING = 'fyyur.converting_updated_at'
+
+
+def local_offset():
+    # the database's time zone, which LOCALTIMESTAMP wrote the existing timestamps in
+    return op.get_bind().execute(sa.text("SELECT now()::timestamp - timezone('utc', now())")).scalar()
+
+
+def convert(default, shifted, written):
+    # switches the default of updated_at to <default> and, unless the database is on UTC, sets
+    # every stored updated_at to <shifted>, one batch of ids per transaction. A trigger logs the
+    # rows the app writes meanwhile: the batches leave them alone, and they are set to <written>
+    # at the end. The batches done are recorded, a run that was interrupted resumes after them
+    connection = op.get_bind()
+    for table in TABLES:
+        op.alter_column(table, 'updated_at', server_default=sa.text(default))
+    if not local_offset():
+        return
+
+    op.execute('CREATE TABLE IF NOT EXISTS "updated_at_written" ("table" text NOT NULL, id integer NOT NULL)')
+    op.execute('CREATE TABLE IF NOT EXISTS "updated_at_converted" ("table" text PRIMARY KEY, next_id integer NOT NULL)')
+    op.execute(f'''
+        CREATE OR REPLACE FUNCTION "updated_at_log_write"() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('{CONVERTING}', true) IS DISTINCT FROM 'on' THEN
+                INSERT INTO "updated_at_written" VALUES (TG_ARGV[0], NEW.id);
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    ''')
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER IF EXISTS "updated_at_written" ON "{table}"')
+        op.execute(f'''
+            CREATE TRIGGER "updated_at_written" AFTER INSERT OR UPDATE ON "{table}"
+            FOR EACH ROW EXECUTE FUNCTION "updated_at_log_write"('{table}')
+        ''')
+        op.execute(f'''INSERT INTO "updated_at_converted" VALUES ('{table}', 0) ON CONFLICT DO NOTHING''')
+
+    with op.get_context().autocommit_block():
+        # the trigger is committed from here on, every row written after a batch is logged
+        op.execute(f"SET {CONVERTING} = 'on'")
+        for table in TABLES:
+            last_id = connection.execute(sa.text(f'SELECT max(id) FROM "{table}"')).scalar() or 0
+            first_id = connection.execute(sa.text(f'''SELECT next_id FROM "updated_at_converted" WHERE "table" = '{table}' ''')).scalar()
+            for start in range(first_id, last_id + 1, BATCH_SIZE):
+                op.execute(f'''
+                    WITH shifted AS (
+                        UPDATE "{table}" SET updated_at = {shifted}
+                        WHERE id >= {start} AND id < {start + BATCH_SIZE}
+                          AND id NOT IN (SELECT id FROM "updated_at_written" WHERE "table" = '{table}')
+                    )
+                    UPDATE "updated_at_converted" SET next_id = {start + BATCH_SIZE} WHERE "table" = '{table}'
+                ''')
+
+    # the rows written meanwhile, in one transaction that holds off further writes. A write
+    # racing a batch may have been shifted, these are set again whatever they hold
+    for table in TABLES:
+        op.execute(f'LOCK TABLE "{table}" IN SHARE ROW EXCLUSIVE MODE')
+        op.execute(f'''
+            UPDATE "{table}" SET updated_at = {written}
+            WHERE id IN (SELECT id FROM "updated_at_written" WHERE "table" = '{table}')
+        ''')
+        op.execute(f'DROP TRIGGER "updated_at_written" ON "{table}"')
+    op.execute('DROP FUNCTION "updated_at_log_write"()')
+    op.execute('DROP TABLE "updated_at_written", "updated_at_converted"')
+    op.execute(f'RESET {CONVERTING}')
+
+
+def upgrade():
+    convert("timezone('utc', now())", "timezone('utc', updated_at::timestamptz)", "timezone('utc', now())")
+
+
+def downgrade():
+    convert('LOCALTIMESTAMP', "timezone('utc', updated_at)::timestamp", 'LOCALTIMESTAMP')
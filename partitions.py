@@ -0,0 +1,140 @@
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+from choices import SHOW_MAX_DURATION_MINUTES
+
+#----------------------------------------------------------------------------#
+# Monthly partitions of the Show table.
+#
+# "Show" is range-partitioned on start_time, one partition per calendar
+# month named Show_<year>_<month>, plus Show_default for shows of any month
+# without one. Queries bounded on start_time, such as the upcoming shows and
+# the booking probes, only read the partitions of their range. `flask
+# show-partitions` creates the partitions of the coming months ahead of
+# time, and those of every month found in the default partition, moving its
+# shows over, and detaches the months that are no longer kept. A detached
+# partition stays behind as a plain table, to be dumped and dropped. The
+# importer and the data generator create the partitions of the months they
+# load first, so that the default partition, which is always read and can't
+# be detached, stays empty; `flask check-indexes` fails when it isn't.
+#
+# Exclusion constraints can't span partitions, so each partition carries
+# its own venue and artist booking constraints. They can't see two shows
+# overlapping across a month boundary; the booking statement probes the
+# whole table for those before it inserts. Cancelled shows, those of
+# soft-deleted venues, are left out of both, so they book nobody.
+#----------------------------------------------------------------------------#
+
+DEFAULT_PARTITION = 'Show_default'
+PARTITION_NAME = re.compile(r'^Show_(\d{4})_(\d{2})$')
+BOOKING_CONSTRAINT = re.compile(r'^ex_Show_(?:\d{4}_\d{2}|default)_(venue|artist)_booking$')
+
+# the time range a show books its venue and artist for
+SHOW_PERIOD = "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+# a show overlapping <period> starts in this range
+OVERLAPPING_START = f"start_time > lower(period) - {SHOW_MAX_DURATION_MINUTES} * interval '1 minute' AND start_time < upper(period)"
+
+DEFAULT_MONTHS = text(f'''
+  SELECT DISTINCT date_trunc('month', start_time)::date AS month FROM "{DEFAULT_PARTITION}"
+''')
+
+DEFAULT_SHOWS = text(f'SELECT count(*) FROM "{DEFAULT_PARTITION}"')
+
+PARTITIONS = text('''
+  SELECT child.relname
+  FROM pg_inherits JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+  WHERE pg_inherits.inhparent = '"Show"'::regclass
+''')
+
+
+def month_start(moment):
+  return date(moment.year, moment.month, 1)
+
+def add_months(month, months):
+  index = month.year * 12 + month.month - 1 + months
+  return date(index // 12, index % 12 + 1, 1)
+
+def months_between(start, end):
+  # the first days of the months from the one of <start> through the one of <end>
+  month, last = month_start(start), month_start(end)
+  while month <= last:
+    yield month
+    month = add_months(month, 1)
+
+def partition_name(month):
+  return f'Show_{month.year}_{month.month:02d}'
+
+def partition_month(name):
+  # the month a partition holds, None for the default partition or any other table
+  match = PARTITION_NAME.match(name)
+  return date(int(match[1]), int(match[2]), 1) if match else None
+
+def booking_constraint(name):
+  # 'venue' or 'artist' for the booking exclusion constraint of a partition, otherwise None
+  match = BOOKING_CONSTRAINT.match(name or '')
+  return match[1] if match else None
+
+def booking_constraints(partition):
+  # the statements adding the venue and artist booking constraints to a partition
+  return [
+    f'ALTER TABLE "{partition}" ADD CONSTRAINT "ex_{partition}_{entity}_booking" '
+    f'EXCLUDE USING gist ({entity}_id WITH =, {SHOW_PERIOD} WITH &&) WHERE (NOT cancelled)'
+    for entity in ('venue', 'artist')
+  ]
+
+def partitions(connection):
+  return [row.relname for row in connection.execute(PARTITIONS)]
+
+def create_partition(connection, month):
+  # creates the partition of <month> next to "Show", moves the shows of that month booked into
+  # the default partition over, and attaches it. Attaching scans the new partition and the
+  # default one, both small, and doesn't block the other partitions
+  name = partition_name(month)
+  end = add_months(month, 1)
+  connection.execute(text(f'CREATE TABLE "{name}" (LIKE "Show" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+  for statement in booking_constraints(name):
+    connection.execute(text(statement))
+  connection.execute(text(f'''
+    WITH moved AS (
+      DELETE FROM "{DEFAULT_PARTITION}" WHERE start_time >= :start AND start_time < :end
+      RETURNING *
+    )
+    INSERT INTO "{name}" SELECT * FROM moved
+  '''), {'start': month, 'end': end})
+  connection.execute(text(f'''ALTER TABLE "Show" ATTACH PARTITION "{name}" FOR VALUES FROM ('{month}') TO ('{end}')'''))
+  return name
+
+def create_partitions(connection, months):
+  # creates the partitions missing for <months>; returns their names
+  existing = {partition_month(name) for name in partitions(connection)}
+  return [create_partition(connection, month) for month in sorted(set(months) - existing)]
+
+def default_shows(connection):
+  return connection.execute(DEFAULT_SHOWS).scalar()
+
+def detach_partition(connection, name):
+  # needs a brief exclusive lock on "Show", DETACH CONCURRENTLY isn't allowed next to a
+  # default partition; gives up rather than queueing the app's queries behind it
+  connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+  connection.execute(text(f'ALTER TABLE "Show" DETACH PARTITION "{name}"'))
+
+def maintain_partitions(connection, today, months_ahead, keep_months):
+  # creates the missing partitions from this month to <months_ahead> months ahead and those of
+  # the months with shows in the default partition, then, unless <keep_months> is 0, detaches
+  # those of months ending more than <keep_months> months ago; returns the names of the
+  # created and the detached partitions
+  current = month_start(today)
+  months = {add_months(current, offset) for offset in range(months_ahead + 1)}
+  months |= {row.month for row in connection.execute(DEFAULT_MONTHS)}
+  created = create_partitions(connection, months)
+  existing = {partition_month(name) for name in partitions(connection)} - {None}
+  detached = []
+  if keep_months > 0:
+    # only months long past, whose shows no longer count as upcoming
+    for month in sorted(existing):
+      if month < add_months(current, -keep_months):
+        detach_partition(connection, partition_name(month))
+        detached.append(partition_name(month))
+  return created, detached
@@ -2,3 +2,24 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// suggests names from /api/autocomplete in the datalist of each search box
+$(function () {
+  $('input[data-autocomplete]').each(function () {
+    var input = $(this);
+    var type = input.data('autocomplete');
+    var list = $('#' + input.attr('list'));
+    var timer = null;
+    input.on('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        $.getJSON('/api/autocomplete', {q: input.val(), type: type}, function (results) {
+          list.empty();
+          $.each(results[type], function (index, result) {
+            list.append($('<option>').attr('value', result.name));
+          });
+        });
+      }, 100);
+    });
+  });
+});
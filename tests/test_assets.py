@@ -0,0 +1,67 @@
+import pytest
+
+from assets import absolute_css_urls, is_fingerprinted, minify_css
+
+#----------------------------------------------------------------------------#
+# The CSS a bundle is made of: url()s of its sources made absolute, then
+# minified, and the bundle names served from the build directory.
+#----------------------------------------------------------------------------#
+
+SOURCE_URL = '/static/css/bootstrap.min.css'
+
+
+@pytest.mark.parametrize('css, expected', [
+  ("src: url('../fonts/glyphicons.eot')", "src: url('/static/fonts/glyphicons.eot')"),
+  ('src: url("../fonts/glyphicons.eot?#iefix")', 'src: url("/static/fonts/glyphicons.eot?#iefix")'),
+  ('background: url( img/bg.png )', 'background: url(/static/css/img/bg.png)'),
+  ('background: url(./img/../bg.png)', 'background: url(/static/css/bg.png)'),
+])
+def test_relative_urls_are_resolved_against_the_source(css, expected):
+  assert absolute_css_urls(css, SOURCE_URL) == expected
+
+@pytest.mark.parametrize('css', [
+  'background: url(/static/img/bg.png)',
+  'background: url("data:image/svg+xml;charset=utf8,%3Csvg%3E")',
+  "src: url('https://fonts.example.com/font.woff')",
+  'fill: url(#gradient)',
+])
+def test_absolute_data_and_fragment_urls_are_kept(css):
+  assert absolute_css_urls(css, SOURCE_URL) == css
+
+def test_minify_drops_whitespace_and_the_last_semicolon():
+  css = '''
+    .navbar  >  li ,
+    .navbar a {
+      color : #fff ;
+      margin:  0   auto;
+    }
+  '''
+  assert minify_css(css) == '.navbar>li,.navbar a{color :#fff;margin:0 auto}'
+
+def test_minify_drops_comments_but_keeps_licences():
+  css = '/*! Bootstrap | MIT */\n/* layout */ body { /* inline */ margin: 0; }'
+  assert minify_css(css) == '/*! Bootstrap | MIT */ body{margin:0}'
+
+@pytest.mark.parametrize('css, expected', [
+  ('a::after { content: "  ;  }  " ; }', 'a::after{content:"  ;  }  "}'),
+  ("q { quotes: '\\'  /*' '*/' ; }", "q{quotes:'\\'  /*' '*/'}"),
+])
+def test_minify_leaves_strings_alone(css, expected):
+  assert minify_css(css) == expected
+
+def test_minify_keeps_the_spaces_that_matter():
+  css = '@media (min-width: 768px) and (max-width: 991px) { .col { width: calc(100% - 2px) } }'
+  assert minify_css(css) == '@media (min-width:768px) and (max-width:991px){.col{width:calc(100% - 2px)}}'
+
+@pytest.mark.parametrize('filename, expected', [
+  ('main.0123456789ab.css', True),
+  ('head.0123456789ab.js', True),
+  ('main.0123456789ab.js', True),
+  ('main.css', False),
+  ('other.0123456789ab.css', False),
+  ('main.0123456789AB.css', False),
+  ('main.0123456789ab.css.gz', False),
+  ('../main.0123456789ab.css', False),
+])
+def test_only_bundle_names_are_fingerprinted(filename, expected):
+  assert is_fingerprinted(filename) is expected
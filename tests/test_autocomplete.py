@@ -0,0 +1,103 @@
+import pytest
+from flask import Flask
+
+from autocomplete import NameIndex, fold
+
+#----------------------------------------------------------------------------#
+# Prefix lookups of the autocomplete index, and the creates, renames and
+# deletes recorded on it before and during a rebuild.
+#----------------------------------------------------------------------------#
+
+NAMES = [
+  (1, 'The Musical Hop'),
+  (2, 'Park Square Live Music & Coffee'),
+  (3, 'The Dueling Pianos Bar'),
+  (4, 'Café Brûlé'),
+  (5, 'Hop Hop  Hop'),
+]
+
+
+@pytest.fixture
+def table():
+  return dict(NAMES)
+
+@pytest.fixture
+def index(table):
+  app = Flask(__name__)
+  app.config['AUTOCOMPLETE_MAX_AGE'] = 0
+  index = NameIndex()
+  index.init_app(app, lambda: list(table.items()))
+  index.ensure_current(app)
+  return index
+
+def ids(index, query, limit=10):
+  return [entity_id for entity_id, name in index.search(query, limit)]
+
+
+def test_fold_ignores_case_accents_and_spacing():
+  assert fold('  Café   BRÛLÉ ') == 'cafe brule'
+  assert fold('Straße') == 'strasse'
+
+@pytest.mark.parametrize('query, expected', [
+  ('the', [3, 1]),
+  ('mus', [2, 1]),
+  ('MUSICAL h', [1]),
+  ('hop', [1, 5]),
+  ('cafe', [4]),
+  ('brûlé', [4]),
+  ('usical', []),
+  ('live music &', [2]),
+])
+def test_any_word_of_the_name_matches_its_start(index, query, expected):
+  assert ids(index, query) == expected
+
+@pytest.mark.parametrize('query', ['', '   '])
+def test_blank_query_finds_nothing(index, query):
+  assert index.search(query, 10) == []
+
+def test_repeated_word_lists_the_name_once(index):
+  assert index.search('hop hop', 10) == [(5, 'Hop Hop  Hop')]
+
+def test_limit_counts_names(index):
+  assert ids(index, 'the', limit=1) == [3]
+  assert ids(index, 'h', limit=2) == [1, 5]
+
+def test_created_renamed_and_deleted_names(index):
+  index.update(6, new_name='Musicians Corner')
+  index.update(1, 'The Musical Hop', 'The Jazz Hop')
+  index.update(3, 'The Dueling Pianos Bar')
+  assert ids(index, 'mus') == [2, 6]
+  assert ids(index, 'the') == [1]
+  assert ids(index, 'jazz') == [1]
+  assert ids(index, 'pianos') == []
+  index.update(6, 'Musicians Corner', 'The Musical Hop')
+  assert index.search('mus', 10) == [(2, 'Park Square Live Music & Coffee'), (6, 'The Musical Hop')]
+
+def test_name_restored_after_a_rename_is_found_again(index):
+  index.update(1, 'The Musical Hop', 'The Jazz Hop')
+  index.update(1, 'The Jazz Hop', 'The Musical Hop')
+  assert ids(index, 'musical') == [1]
+  assert ids(index, 'jazz') == []
+
+def test_rebuild_reads_the_table_and_clears_the_changes(index, table):
+  index.update(6, new_name='Musicians Corner')
+  table[6] = 'Musicians Corner'
+  del table[2]
+  index.rebuild()
+  assert ids(index, 'mus') == [1, 6]
+  assert index.added_keys == [] and index.removed == set()
+
+def test_changes_made_during_a_rebuild_are_kept(index, table):
+  load = index.load
+
+  def load_racing_an_edit():
+    names = load()
+    # committed after the table was read
+    table[1] = 'The Jazz Hop'
+    index.update(1, 'The Musical Hop', 'The Jazz Hop')
+    return names
+
+  index.load = load_racing_an_edit
+  index.rebuild()
+  assert ids(index, 'jazz') == [1]
+  assert ids(index, 'musical') == []
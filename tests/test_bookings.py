@@ -0,0 +1,223 @@
+import os
+import re
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+from flask_migrate import Migrate, downgrade, upgrade
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+import config
+from app import Artist, Show, Venue, book_shows, create_app, db
+from partitions import OVERLAPPING_START, SHOW_PERIOD, create_partitions, partitions
+
+#----------------------------------------------------------------------------#
+# Bookings and their migrations on PostgreSQL, with the btree_gist and
+# pg_trgm extensions the migrations create. They run when TEST_DATABASE_URL
+# names a database of their own, which they empty and migrate to the head
+# revision, and are skipped otherwise.
+#----------------------------------------------------------------------------#
+
+DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+EXTENSIONS = {'btree_gist', 'pg_trgm'}
+NOW = datetime(2031, 1, 1)
+EXCLUSION_VIOLATION = '23P01'
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason='TEST_DATABASE_URL is not set')
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+  engine = create_engine(DATABASE_URL)
+  with engine.begin() as connection:
+    missing = EXTENSIONS - {row.name for row in connection.execute(text('SELECT name FROM pg_available_extensions'))}
+    if missing:
+      pytest.skip(f"the {', '.join(sorted(missing))} extensions are not available")
+    connection.execute(text('DROP SCHEMA public CASCADE'))
+    connection.execute(text('CREATE SCHEMA public'))
+  engine.dispose()
+  settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+  settings.update(SQLALCHEMY_DATABASE_URI=DATABASE_URL, DATABASE_REPLICA_URLS=[], SECRET_KEY='test')
+  # create_app() logs to error.log in the working directory
+  working_directory = os.getcwd()
+  os.chdir(tmp_path_factory.mktemp('app'))
+  try:
+    app = create_app(SimpleNamespace(**settings))
+  finally:
+    os.chdir(working_directory)
+  Migrate(app, db)
+  with app.app_context():
+    upgrade(MIGRATIONS)
+    yield app
+    db.session.remove()
+    db.get_engine().dispose()
+
+@pytest.fixture
+def booking(app):
+  venues = [venue(name) for name in ('The Musical Hop', 'Park Square Live Music & Coffee')]
+  artists = [artist(name) for name in ('Guns N Petals', 'Matt Quevedo')]
+  db.session.add_all(venues + artists)
+  db.session.commit()
+  yield SimpleNamespace(venue_ids=[row.id for row in venues], artist_ids=[row.id for row in artists])
+  db.session.rollback()
+  db.session.execute(text('TRUNCATE "Show", "Venue", "Artist" RESTART IDENTITY CASCADE'))
+  db.session.commit()
+
+def venue(name):
+  return Venue(name=name, city='San Francisco', state='CA', address='1015 Folsom Street', phone='123-123-1234',
+               genres=['Jazz'], seeking_description='')
+
+def artist(name):
+  return Artist(name=name, city='San Francisco', state='CA', phone='326-123-5000', genres=['Rock n Roll'])
+
+def book(venue_id, artist_id, *start_times, duration_minutes=120, skip_conflicts=False):
+  rows = book_shows(venue_id, artist_id, [datetime.fromisoformat(start_time) for start_time in start_times],
+                    duration_minutes, skip_conflicts, NOW)
+  db.session.commit()
+  return rows
+
+def conflicts(rows):
+  # whether the venue and the artist were taken, for rows that booked nothing
+  assert all(row.id is None for row in rows)
+  return [(row.venue_booked, row.artist_booked) for row in rows]
+
+def shows():
+  return db.session.query(Show.venue_id, Show.artist_id, Show.start_time).order_by(Show.start_time, Show.id).all()
+
+def migrate(command, revision):
+  # the migrations run on connections of their own, which the session mustn't hold locks against
+  db.session.remove()
+  command(MIGRATIONS, revision)
+
+def columns(table):
+  return {row.column_name for row in db.session.execute(text(
+    'SELECT column_name FROM information_schema.columns WHERE table_name = :table'), {'table': table})}
+
+def relkind(table):
+  return db.session.execute(text('SELECT relkind FROM pg_class WHERE oid = CAST(:table AS regclass)'), {'table': f'"{table}"'}).scalar()
+
+def constraints(table):
+  return {row.conname for row in db.session.execute(text(
+    'SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass)'), {'table': f'"{table}"'})}
+
+
+def test_overlapping_booking_is_rejected(booking):
+  (venue_a, venue_b), (artist_a, artist_b) = booking.venue_ids, booking.artist_ids
+  [booked] = book(venue_a, artist_a, '2031-06-01 20:00')
+  assert (booked.venue_booked, booked.artist_booked) == (False, False) and booked.id is not None
+  assert conflicts(book(venue_a, artist_b, '2031-06-01 21:00')) == [(True, False)]
+  assert conflicts(book(venue_b, artist_a, '2031-06-01 18:30')) == [(False, True)]
+  assert shows() == [(venue_a, artist_a, datetime(2031, 6, 1, 20))]
+  assert Venue.query.get(venue_b).upcoming_show_count == 0
+  assert Artist.query.get(artist_a).upcoming_show_count == 1
+
+def test_back_to_back_bookings_are_accepted(booking):
+  (venue_a, _), (artist_a, artist_b) = booking.venue_ids, booking.artist_ids
+  book(venue_a, artist_a, '2031-06-01 20:00')
+  assert book(venue_a, artist_b, '2031-06-01 22:00', '2031-06-01 18:00')[0].id is not None
+  assert len(shows()) == 3
+
+def test_one_taken_date_books_no_show_unless_skipped(booking):
+  (venue_a, _), (artist_a, artist_b) = booking.venue_ids, booking.artist_ids
+  book(venue_a, artist_a, '2031-06-08 20:00')
+  dates = ('2031-06-01 20:00', '2031-06-08 20:00', '2031-06-15 20:00')
+  assert [row.id for row in book(venue_a, artist_b, *dates)] == [None, None, None]
+  assert len(shows()) == 1
+  booked = book(venue_a, artist_b, *dates, skip_conflicts=True)
+  assert [row.id is None for row in booked] == [False, True, False]
+  assert len(shows()) == 3
+  assert Venue.query.get(venue_a).upcoming_show_count == 3
+  assert Artist.query.get(artist_b).upcoming_show_count == 2
+
+@pytest.mark.parametrize('entity', ['venue', 'artist'])
+def test_exclusion_constraint_rejects_an_overlapping_insert(booking, entity):
+  (venue_a, venue_b), (artist_a, artist_b) = booking.venue_ids, booking.artist_ids
+  book(venue_a, artist_a, '2031-06-01 20:00')
+  other = {'venue': (venue_a, artist_b), 'artist': (venue_b, artist_a)}[entity]
+  db.session.add(Show(venue_id=other[0], artist_id=other[1], start_time=datetime(2031, 6, 1, 21), duration_minutes=30))
+  with pytest.raises(IntegrityError) as error:
+    db.session.commit()
+  assert error.value.orig.pgcode == EXCLUSION_VIOLATION
+  assert f'_{entity}_booking' in error.value.orig.diag.constraint_name
+
+def test_booking_constraints_migration_round_trip(booking):
+  (venue_a, _), (artist_a, artist_b) = booking.venue_ids, booking.artist_ids
+  migrate(downgrade, 'c41a80ee6572')
+  try:
+    assert 'duration_minutes' not in columns('Show')
+    assert not {'ex_Show_venue_booking', 'ex_Show_artist_booking'} & constraints('Show')
+    for artist_id in (artist_a, artist_b):
+      db.session.execute(text('INSERT INTO "Show" (venue_id, artist_id, start_time) VALUES (:venue_id, :artist_id, :start_time)'),
+                         {'venue_id': venue_a, 'artist_id': artist_id, 'start_time': datetime(2031, 6, 1, 20)})
+    db.session.commit()
+    # the shows already overlapping are named, and nothing changes
+    with pytest.raises(IntegrityError) as error:
+      migrate(upgrade, '5a7ecefde9f6')
+    assert error.value.orig.pgcode == EXCLUSION_VIOLATION
+    db.session.remove()
+    assert 'duration_minutes' not in columns('Show')
+
+    db.session.execute(text('DELETE FROM "Show" WHERE artist_id = :artist_id'), {'artist_id': artist_b})
+    db.session.commit()
+    migrate(upgrade, '5a7ecefde9f6')
+    assert {'ex_Show_venue_booking', 'ex_Show_artist_booking', 'ck_Show_duration_minutes'} <= constraints('Show')
+    assert [row.duration_minutes for row in db.session.execute(text('SELECT duration_minutes FROM "Show"'))] == [120]
+    migrate(downgrade, 'c41a80ee6572')
+    assert 'duration_minutes' not in columns('Show')
+    assert not {'ex_Show_venue_booking', 'ex_Show_artist_booking', 'ck_Show_duration_minutes'} & constraints('Show')
+  finally:
+    migrate(upgrade, 'head')
+
+def test_overlap_across_a_month_boundary_is_found(booking):
+  (venue_a, venue_b), (artist_a, artist_b) = booking.venue_ids, booking.artist_ids
+  create_partitions(db.session.connection(), [date(2031, 6, 1), date(2031, 7, 1), date(2031, 8, 1)])
+  book(venue_a, artist_a, '2031-06-30 23:00', duration_minutes=180)
+  # the July partition's constraints don't see the June show
+  db.session.add(Show(venue_id=venue_a, artist_id=artist_b, start_time=datetime(2031, 7, 1, 1), duration_minutes=30))
+  db.session.flush()
+  db.session.rollback()
+  assert conflicts(book(venue_a, artist_b, '2031-07-01 01:00', duration_minutes=30)) == [(True, False)]
+  assert conflicts(book(venue_b, artist_a, '2031-07-01 01:30')) == [(False, True)]
+  assert book(venue_b, artist_a, '2031-07-01 02:00')[0].id is not None
+  assert [row.start_time for row in shows()] == [datetime(2031, 6, 30, 23), datetime(2031, 7, 1, 2)]
+  # and only the partitions of the month and the one before are read
+  plan = db.session.execute(text(f'''
+    EXPLAIN SELECT 1 FROM "Show", (SELECT CAST(:period AS tsrange) AS period) AS requested
+    WHERE venue_id = :venue_id AND {SHOW_PERIOD} && period AND {OVERLAPPING_START}
+  '''), {'period': '[2031-07-01 01:00, 2031-07-01 01:30)', 'venue_id': venue_a}).fetchall()
+  assert set(re.findall(r' on "(Show_\w+)"', '\n'.join(row[0] for row in plan))) == {'Show_2031_06', 'Show_2031_07'}
+
+def test_partition_migration_round_trip(booking):
+  (venue_a, venue_b), (artist_a, artist_b) = booking.venue_ids, booking.artist_ids
+  migrate(downgrade, 'e3b7d9a41c26')
+  try:
+    added = [(venue_a, artist_a, datetime(2031, 6, 30, 23)), (venue_b, artist_b, datetime(2031, 7, 1, 0)), (venue_a, artist_b, datetime(2031, 8, 15, 20))]
+    for venue_id, artist_id, start_time in added:
+      db.session.execute(text('INSERT INTO "Show" (venue_id, artist_id, start_time) VALUES (:venue_id, :artist_id, :start_time)'),
+                         {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time})
+    db.session.commit()
+    before = db.session.execute(text('SELECT id, venue_id, artist_id, start_time FROM "Show" ORDER BY id')).fetchall()
+
+    migrate(upgrade, 'b8f4c2d17e65')
+    assert relkind('Show') == 'p'
+    assert {'Show_default', 'Show_2031_06', 'Show_2031_07', 'Show_2031_08'} <= set(partitions(db.session.connection()))
+    assert db.session.execute(text('SELECT id, venue_id, artist_id, start_time FROM "Show" ORDER BY id')).fetchall() == before
+    assert db.session.execute(text('SELECT count(*) FROM "Show_2031_07"')).scalar() == 1
+    assert db.session.execute(text('SELECT count(*) FROM "Show_default"')).scalar() == 0
+    assert {'ex_Show_2031_06_venue_booking', 'ex_Show_2031_06_artist_booking'} <= constraints('Show_2031_06')
+    next_id = db.session.execute(text('''
+      INSERT INTO "Show" (venue_id, artist_id, start_time) VALUES (:venue_id, :artist_id, '2031-06-01 20:00') RETURNING id
+    '''), {'venue_id': venue_b, 'artist_id': artist_a}).scalar()
+    assert next_id > before[-1].id
+    db.session.commit()
+
+    migrate(downgrade, 'e3b7d9a41c26')
+    assert relkind('Show') == 'r'
+    assert {'ex_Show_venue_booking', 'ex_Show_artist_booking'} <= constraints('Show')
+    after = db.session.execute(text('SELECT id, venue_id, artist_id, start_time FROM "Show" ORDER BY id')).fetchall()
+    assert after == before + [(next_id, venue_b, artist_a, datetime(2031, 6, 1, 20))]
+    assert db.session.execute(text("SELECT to_regclass('\"Show_2031_06\"')")).scalar() is None
+  finally:
+    migrate(upgrade, 'head')
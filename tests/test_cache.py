@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timedelta
+
+from cache import RenderCache
+
+#----------------------------------------------------------------------------#
+# The rendered page cache: versions, expiry, invalidation and size.
+#----------------------------------------------------------------------------#
+
+KEY = ('venue', 1)
+
+
+def cached(max_size=4, grace=0, ttl=300):
+  cache = RenderCache(max_size=max_size, grace=grace, ttl=ttl)
+  return cache, cache.generation()
+
+
+def test_entry_is_only_returned_for_its_version():
+  cache, generation = cached()
+  cache.set(KEY, 'etag-1', 'page', generation)
+  assert cache.get(KEY, 'etag-1') == 'page'
+  assert cache.get(KEY, 'etag-2') is None
+  assert cache.get(('artist', 1), 'etag-1') is None
+
+def test_newer_version_replaces_the_entry():
+  cache, generation = cached()
+  cache.set(KEY, 'etag-1', 'old page', generation)
+  cache.set(KEY, 'etag-2', 'new page', generation)
+  assert cache.get(KEY, 'etag-1') is None
+  assert cache.get(KEY, 'etag-2') == 'new page'
+
+def test_entry_expires_at_the_given_time():
+  cache, generation = cached()
+  cache.set(KEY, 'etag', 'page', generation, expires=datetime.now() - timedelta(seconds=1))
+  assert cache.get(KEY, 'etag') is None
+  assert len(cache) == 0
+
+def test_entry_expires_after_the_ttl():
+  cache, generation = cached(ttl=0)
+  cache.set(KEY, 'etag', 'page', generation, expires=datetime.now() + timedelta(days=1))
+  assert cache.get(KEY, 'etag') is None
+
+def test_invalidate_drops_the_entry():
+  cache, generation = cached()
+  cache.set(KEY, 'etag', 'page', generation)
+  cache.invalidate(KEY)
+  assert cache.get(KEY, 'etag') is None
+
+def test_render_started_before_an_invalidation_is_not_stored():
+  cache, generation = cached()
+  cache.invalidate(KEY)
+  cache.set(KEY, 'etag', 'stale page', generation)
+  assert cache.get(KEY, 'etag') is None
+  cache.set(KEY, 'etag', 'page', cache.generation())
+  assert cache.get(KEY, 'etag') == 'page'
+
+def test_invalidating_another_key_keeps_the_render():
+  cache, generation = cached()
+  cache.invalidate(('artist', 1))
+  cache.set(KEY, 'etag', 'page', generation)
+  assert cache.get(KEY, 'etag') == 'page'
+
+def test_nothing_is_stored_during_the_grace_period():
+  cache, generation = cached(grace=0.05)
+  cache.invalidate(KEY)
+  cache.set(KEY, 'etag', 'page', cache.generation())
+  assert cache.get(KEY, 'etag') is None
+  time.sleep(0.06)
+  cache.set(KEY, 'etag', 'page', cache.generation())
+  assert cache.get(KEY, 'etag') == 'page'
+
+def test_least_recently_used_entry_goes_first():
+  cache, generation = cached(max_size=2)
+  cache.set(('venue', 1), 'etag', 'one', generation)
+  cache.set(('venue', 2), 'etag', 'two', generation)
+  assert cache.get(('venue', 1), 'etag') == 'one'
+  cache.set(('venue', 3), 'etag', 'three', generation)
+  assert cache.get(('venue', 2), 'etag') is None
+  assert cache.get(('venue', 1), 'etag') == 'one'
+  assert len(cache) == 2
+
+def test_forgotten_invalidations_still_refuse_older_renders():
+  cache, generation = cached(max_size=1)
+  cache.invalidate(('venue', 1))
+  cache.invalidate(('venue', 2))
+  cache.set(('venue', 1), 'etag', 'stale page', generation)
+  assert cache.get(('venue', 1), 'etag') is None
+
+def test_disabled_cache_stores_nothing():
+  cache, generation = cached(max_size=0)
+  cache.set(KEY, 'etag', 'page', generation)
+  assert cache.get(KEY, 'etag') is None
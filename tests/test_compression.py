@@ -0,0 +1,98 @@
+import gzip
+
+import pytest
+from flask import Flask, Response
+
+from compression import Compression
+
+#----------------------------------------------------------------------------#
+# Choosing the encoding from Accept-Encoding, what is left alone, and the
+# compressed copies a cached page keeps between requests.
+#----------------------------------------------------------------------------#
+
+PAGE = '<p>The Musical Hop</p>' * 100
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+
+@pytest.fixture
+def variants():
+  return {}
+
+@pytest.fixture
+def app(variants):
+  app = Flask(__name__)
+  app.config.update(
+    COMPRESS_MIN_SIZE=1024, COMPRESS_MIMETYPES=['text/html'], COMPRESS_GZIP_LEVEL=6, COMPRESS_BROTLI_QUALITY=5,
+  )
+  compression = Compression()
+  compression.init_app(app)
+  app.compression = compression
+
+  @app.route('/page')
+  def page():
+    response = Response(PAGE)
+    response.set_etag('page-1')
+    return response
+
+  @app.route('/cached')
+  def cached():
+    compression.keep_variants(variants)
+    return PAGE
+
+  app.add_url_rule('/short', 'short', lambda: 'short')
+  app.add_url_rule('/text', 'text', lambda: Response(PAGE, mimetype='text/plain'))
+  app.add_url_rule('/not-modified', 'not_modified', lambda: Response(PAGE, status=304))
+  return app
+
+def get(app, url, accept_encoding=None):
+  headers = {'Accept-Encoding': accept_encoding} if accept_encoding is not None else {}
+  return app.test_client().get(url, headers=headers)
+
+
+def test_gzip_body_decompresses_to_the_page(app):
+  response = get(app, '/page', 'gzip')
+  assert response.headers['Content-Encoding'] == 'gzip'
+  assert 'Accept-Encoding' in response.headers['Vary']
+  assert gzip.decompress(response.data).decode() == PAGE
+
+def test_strong_etag_names_the_encoding(app):
+  response = get(app, '/page', 'gzip')
+  assert response.get_etag() == ('page-1-gzip', False)
+
+@pytest.mark.skipif(brotli is None, reason='brotli is not installed')
+@pytest.mark.parametrize('accept_encoding, encoding', [
+  ('gzip, deflate, br', 'br'),
+  ('br;q=0.5, gzip', 'gzip'),
+  ('*', 'br'),
+])
+def test_preferred_encoding_wins(app, accept_encoding, encoding):
+  response = get(app, '/page', accept_encoding)
+  assert response.headers['Content-Encoding'] == encoding
+  if encoding == 'br':
+    assert brotli.decompress(response.data).decode() == PAGE
+
+@pytest.mark.parametrize('accept_encoding', [None, 'identity', 'deflate', 'gzip;q=0'])
+def test_no_accepted_encoding_sends_the_page_as_is(app, accept_encoding):
+  response = get(app, '/page', accept_encoding)
+  assert 'Content-Encoding' not in response.headers
+  assert response.data.decode() == PAGE
+  assert response.get_etag() == ('page-1', False)
+
+@pytest.mark.parametrize('url', ['/short', '/text', '/not-modified'])
+def test_small_other_type_and_bodiless_responses_are_left_alone(app, url):
+  assert 'Content-Encoding' not in get(app, url, 'gzip').headers
+
+def test_cached_page_is_compressed_once_per_encoding(app, variants, monkeypatch):
+  calls = []
+  compress = app.compression.compress
+  monkeypatch.setattr(app.compression, 'compress', lambda data, encoding: calls.append(encoding) or compress(data, encoding))
+  first = get(app, '/cached', 'gzip')
+  second = get(app, '/cached', 'gzip')
+  assert calls == ['gzip']
+  assert second.data == first.data == variants['gzip']
+  assert get(app, '/cached').data.decode() == PAGE
+  assert list(variants) == ['gzip']
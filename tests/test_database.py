@@ -0,0 +1,164 @@
+import os
+import sqlite3
+
+import pytest
+from flask import Flask, g
+from sqlalchemy import text
+
+from database import RoutingSQLAlchemy, dispose_fork_engines, may_write
+
+#----------------------------------------------------------------------------#
+# Read replica routing, with SQLite files standing in for the primary and
+# the replicas. Each database holds one row naming it, so a query tells
+# which one answered it.
+#----------------------------------------------------------------------------#
+
+DATABASES = ('primary', 'replica_a', 'replica_b')
+
+
+@pytest.fixture
+def files(tmp_path):
+  paths = {}
+  for name in DATABASES:
+    paths[name] = tmp_path / f'{name}.db'
+    with sqlite3.connect(paths[name]) as connection:
+      connection.execute('CREATE TABLE source (id INTEGER PRIMARY KEY, name TEXT)')
+      connection.execute('INSERT INTO source (id, name) VALUES (1, ?)', (name,))
+  return paths
+
+def create_app(files, replicas):
+  app = Flask(__name__)
+  app.config.update(
+    SQLALCHEMY_DATABASE_URI=f"sqlite:///{files['primary']}",
+    SQLALCHEMY_TRACK_MODIFICATIONS=False,
+    DATABASE_REPLICA_URLS=[f'sqlite:///{files[name]}' for name in replicas],
+    REPLICA_RETRY_SECONDS=30,
+    DB_PGBOUNCER=False,
+    DB_STATEMENT_TIMEOUT=0,
+  )
+  db = RoutingSQLAlchemy()
+
+  class Source(db.Model):
+    __tablename__ = 'source'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+
+  db.init_app(app)
+  return app, db, Source
+
+def source(db, Source):
+  return db.session.query(Source.name).filter(Source.id == 1).scalar()
+
+
+def test_read_only_request_reads_from_replica(files):
+  app, db, Source = create_app(files, ['replica_a'])
+  with app.test_request_context():
+    g.read_only = True
+    assert source(db, Source) == 'replica_a'
+    assert not g.get('db_wrote', False)
+
+def test_other_requests_read_from_primary(files):
+  app, db, Source = create_app(files, ['replica_a'])
+  with app.test_request_context():
+    g.read_only = False
+    assert source(db, Source) == 'primary'
+
+def test_flush_pins_request_to_primary(files):
+  app, db, Source = create_app(files, ['replica_a'])
+  with app.test_request_context():
+    g.read_only = True
+    db.session.add(Source(id=2, name='added'))
+    db.session.flush()
+    assert g.db_wrote
+    assert source(db, Source) == 'primary'
+    db.session.rollback()
+
+@pytest.mark.parametrize('statement', [
+  "UPDATE source SET name = name WHERE id = 1",
+  "WITH changed AS (SELECT 1) DELETE FROM source WHERE id = 0",
+])
+def test_text_statement_pins_request_to_primary(files, statement):
+  app, db, Source = create_app(files, ['replica_a'])
+  with app.test_request_context():
+    g.read_only = True
+    db.session.execute(text(statement))
+    assert g.db_wrote
+    assert source(db, Source) == 'primary'
+    db.session.rollback()
+
+@pytest.mark.parametrize('statement', [
+  "SELECT 1",
+  "WITH named AS (SELECT name FROM source) SELECT count(*) FROM named",
+])
+def test_text_select_keeps_request_on_replica(files, statement):
+  app, db, Source = create_app(files, ['replica_a'])
+  with app.test_request_context():
+    g.read_only = True
+    db.session.execute(text(statement))
+    assert not g.get('db_wrote', False)
+    assert source(db, Source) == 'replica_a'
+
+@pytest.mark.parametrize('statement', [
+  'SELECT 1 FROM "Venue" WHERE id = 1 FOR UPDATE',
+  'SELECT 1 FROM "Venue" FOR KEY SHARE',
+  "SELECT nextval('\"Show_id_seq\"')",
+  'SELECT * INTO copied FROM source',
+  'SET LOCAL enable_seqscan = off',
+])
+def test_text_statements_that_may_write(statement):
+  assert may_write(text(statement))
+
+def test_core_update_pins_request_to_primary(files):
+  app, db, Source = create_app(files, ['replica_a'])
+  with app.test_request_context():
+    g.read_only = True
+    db.session.execute(Source.__table__.update().values(name='changed').where(Source.id == 0))
+    assert g.db_wrote
+    assert source(db, Source) == 'primary'
+    db.session.rollback()
+
+def test_one_replica_per_request(files):
+  app, db, Source = create_app(files, ['replica_a', 'replica_b'])
+  seen = []
+  for _ in range(4):
+    with app.test_request_context():
+      g.read_only = True
+      answers = {source(db, Source) for _ in range(3)}
+      assert len(answers) == 1
+      seen.append(answers.pop())
+    db.session.remove()
+  assert seen == ['replica_a', 'replica_b', 'replica_a', 'replica_b']
+
+def test_failed_replica_is_skipped(files, tmp_path):
+  files['missing'] = tmp_path / 'missing' / 'replica.db'
+  app, db, Source = create_app(files, ['missing', 'replica_b'])
+  for _ in range(2):
+    with app.test_request_context():
+      g.read_only = True
+      assert source(db, Source) == 'replica_b'
+    db.session.remove()
+
+def test_primary_when_no_replica_is_healthy(files, tmp_path):
+  files['missing'] = tmp_path / 'missing' / 'replica.db'
+  app, db, Source = create_app(files, ['missing'])
+  with app.test_request_context():
+    g.read_only = True
+    assert source(db, Source) == 'primary'
+
+
+#----------------------------------------------------------------------------#
+# Disposal before a fork.
+#----------------------------------------------------------------------------#
+
+def test_creating_apps_adds_no_fork_hooks(files, monkeypatch):
+  hooks = []
+  monkeypatch.setattr(os, 'register_at_fork', lambda **hook: hooks.append(hook))
+  apps = [create_app(files, ['replica_a']) for _ in range(3)]
+  assert hooks == []
+
+  disposed = []
+  for app, db, Source in apps:
+    engine = db.get_engine(app)
+    monkeypatch.setattr(engine, 'dispose', lambda engine=engine: disposed.append(engine))
+  dispose_fork_engines()
+  assert {db.get_engine(app) for app, db, Source in apps} <= set(disposed)
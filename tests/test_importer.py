@@ -0,0 +1,119 @@
+import json
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from choices import SHOW_DURATION_MINUTES, SHOW_MAX_DURATION_MINUTES
+from importer import overlapping_rows, read_rows, validate_row
+
+#----------------------------------------------------------------------------#
+# Reading, validation and overlap checks of `flask import`, up to the point
+# where the rows are handed to COPY.
+#----------------------------------------------------------------------------#
+
+VENUE = {
+  'name': 'The Musical Hop',
+  'city': 'San Francisco',
+  'state': 'CA',
+  'address': '1015 Folsom Street',
+  'phone': '123-123-1234',
+  'genres': 'Jazz;Reggae',
+  'facebook_link': 'https://www.facebook.com/TheMusicalHop',
+  'website_link': 'https://www.themusicalhop.com',
+  'seeking_talent': 'yes',
+}
+KNOWN_IDS = {'venue_id': {1, 2}, 'artist_id': {4, 5}}
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+  with Flask(__name__).app_context():
+    yield
+
+def show(venue_id, artist_id, start_time, duration_minutes=60):
+  return {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': datetime.fromisoformat(start_time), 'duration_minutes': duration_minutes}
+
+
+def test_ndjson_lines_that_are_not_objects_are_reported(tmp_path):
+  path = tmp_path / 'venues.ndjson'
+  path.write_text('\n'.join([json.dumps(VENUE), '', '{"name": ', '["a list"]', json.dumps(VENUE)]) + '\n')
+  rows = list(read_rows(str(path)))
+  assert [number for number, record, errors in rows] == [1, 3, 4, 5]
+  assert rows[0][2] is None and rows[3][2] is None
+  assert rows[1][1] == '{"name":'
+  assert rows[1][2]['row'][0].startswith('Not valid JSON')
+  assert rows[2][2] == {'row': ['Not a JSON object.']}
+
+def test_csv_rows_carry_their_line_numbers(tmp_path):
+  path = tmp_path / 'venues.csv'
+  path.write_text('name,city,genres\n"The Hop","San Francisco","Jazz;Blues"\n"Multi\nline","Austin",Rock\n')
+  rows = list(read_rows(str(path)))
+  assert [(number, record['name'], errors) for number, record, errors in rows] == [(2, 'The Hop', None), (4, 'Multi\nline', None)]
+
+def test_valid_venue_is_mapped_to_columns():
+  values, errors = validate_row('venues', VENUE, {})
+  assert errors is None
+  assert values['genres'] == ['Jazz', 'Reggae']
+  assert values['website'] == VENUE['website_link']
+  assert 'website_link' not in values
+  assert values['seeking_talent'] is True
+
+@pytest.mark.parametrize('value, expected', [('no', False), ('0', False), ('', False), (False, False), ('true', True), (True, True)])
+def test_boolean_cells(value, expected):
+  values, errors = validate_row('venues', dict(VENUE, seeking_talent=value), {})
+  assert values['seeking_talent'] is expected
+
+@pytest.mark.parametrize('change, field', [
+  ({'name': ''}, 'name'),
+  ({'genres': 'Polka'}, 'genres'),
+  ({'state': 'XX'}, 'state'),
+  ({'facebook_link': 'not a url'}, 'facebook_link'),
+])
+def test_invalid_venue_is_rejected_with_the_field(change, field):
+  values, errors = validate_row('venues', dict(VENUE, **change), {})
+  assert values is None
+  assert field in errors
+
+def test_valid_show_gets_the_default_duration():
+  values, errors = validate_row('shows', {'venue_id': '1', 'artist_id': 4, 'start_time': '2031-06-01 20:00:00'}, KNOWN_IDS)
+  assert errors is None
+  assert values['venue_id'] == 1 and values['artist_id'] == 4
+  assert values['start_time'] == datetime(2031, 6, 1, 20)
+  assert values['duration_minutes'] == SHOW_DURATION_MINUTES
+
+@pytest.mark.parametrize('record, errors', [
+  ({'venue_id': '3', 'artist_id': '4'}, {'venue_id': ['No such record.']}),
+  ({'venue_id': 'one', 'artist_id': '6'}, {'venue_id': ['Not a valid id.'], 'artist_id': ['No such record.']}),
+])
+def test_show_of_unknown_venue_or_artist_is_rejected(record, errors):
+  record['start_time'] = '2031-06-01 20:00:00'
+  assert validate_row('shows', record, KNOWN_IDS) == (None, errors)
+
+@pytest.mark.parametrize('change, field', [
+  ({'start_time': 'tomorrow'}, 'start_time'),
+  ({'duration_minutes': SHOW_MAX_DURATION_MINUTES + 1}, 'duration_minutes'),
+  ({'duration_minutes': 0}, 'duration_minutes'),
+])
+def test_invalid_show_is_rejected_with_the_field(change, field):
+  record = dict({'venue_id': '1', 'artist_id': '4', 'start_time': '2031-06-01 20:00:00'}, **change)
+  values, errors = validate_row('shows', record, KNOWN_IDS)
+  assert values is None
+  assert field in errors
+
+def test_overlaps_within_a_batch_are_flagged_across_months():
+  batch = [
+    show(1, 4, '2031-06-30 23:00:00', 120),
+    show(2, 4, '2031-07-01 00:30:00'),
+    show(1, 5, '2031-07-01 00:00:00'),
+    show(2, 5, '2031-07-01 01:30:00'),
+  ]
+  assert overlapping_rows(batch, {}) == {1: 'artist', 2: 'venue'}
+
+def test_back_to_back_shows_do_not_overlap():
+  batch = [show(1, 4, '2031-06-01 20:00:00', 60), show(1, 4, '2031-06-01 21:00:00', 60)]
+  assert overlapping_rows(batch, {}) == {}
+
+def test_rows_already_booked_do_not_block_later_ones():
+  batch = [show(1, 4, '2031-06-01 20:00:00', 120), show(1, 5, '2031-06-01 21:00:00')]
+  assert overlapping_rows(batch, {0: 'venue'}) == {0: 'venue'}
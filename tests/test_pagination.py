@@ -0,0 +1,107 @@
+import pytest
+from flask import Flask
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from app import keyset_page, keyset_query
+
+#----------------------------------------------------------------------------#
+# Keyset pagination over a SQLite table of venues, paged by (city, state, id)
+# like the venue listing and by id like the artist and show listings. The
+# page links are followed as a browser would.
+#----------------------------------------------------------------------------#
+
+Base = declarative_base()
+
+
+class Place(Base):
+  __tablename__ = 'place'
+  id = Column(Integer, primary_key=True)
+  city = Column(String, nullable=False)
+  state = Column(String, nullable=False)
+
+
+KEY = (Place.city, Place.state, Place.id)
+PLACES = [
+  ('San Francisco', 'CA'), ('Austin', 'TX'), ('New York', 'NY'), ('Austin', 'TX'),
+  ('Brooklyn', 'NY'), ('San Francisco', 'CA'), ('Austin', 'TX'),
+]
+
+
+@pytest.fixture
+def session():
+  engine = create_engine('sqlite://')
+  Base.metadata.create_all(engine)
+  session = sessionmaker(bind=engine)()
+  session.add_all([Place(id=number, city=city, state=state) for number, (city, state) in enumerate(PLACES, 1)])
+  session.commit()
+  return session
+
+@pytest.fixture
+def app():
+  app = Flask(__name__)
+  app.config.update(PAGE_SIZE=3, MAX_PAGE_SIZE=4)
+  app.add_url_rule('/places', 'places', lambda: '')
+  return app
+
+def page(app, session, url, *key_columns):
+  with app.test_request_context(url):
+    rows, page = keyset_page(keyset_query(session.query(Place), *key_columns).all(), *key_columns)
+    return [row.id for row in rows], page
+
+def ordered(session, *key_columns):
+  return [place.id for place in session.query(Place).order_by(*key_columns)]
+
+
+@pytest.mark.parametrize('key_columns', [KEY, (Place.id,)])
+def test_next_links_walk_every_row_once(app, session, key_columns):
+  ids, url = [], '/places'
+  while url:
+    rows, links = page(app, session, url, *key_columns)
+    assert 0 < len(rows) <= 3
+    ids += rows
+    url = links['next_url']
+  assert ids == ordered(session, *key_columns)
+
+@pytest.mark.parametrize('key_columns', [KEY, (Place.id,)])
+def test_prev_links_walk_back_through_the_same_pages(app, session, key_columns):
+  forward, url = [], '/places'
+  while url:
+    rows, links = page(app, session, url, *key_columns)
+    forward.append(rows)
+    url = links['next_url']
+  backward, url = [], links['prev_url']
+  while url:
+    rows, links = page(app, session, url, *key_columns)
+    backward.append(rows)
+    url = links['prev_url']
+  assert backward == forward[-2::-1]
+
+def test_first_and_last_pages_link_one_way(app, session):
+  rows, links = page(app, session, '/places', *KEY)
+  assert links['prev_url'] is None and links['next_url'] is not None
+  rows, links = page(app, session, '/places?after=%5B%22San+Francisco%22%2C+%22CA%22%2C+1%5D', *KEY)
+  assert rows == [6]
+  assert links['next_url'] is None and links['prev_url'] is not None
+
+def test_links_keep_the_other_arguments(app, session):
+  rows, links = page(app, session, '/places?genre=Jazz&limit=2', *KEY)
+  assert 'genre=Jazz' in links['next_url']
+  assert 'limit=2' in links['next_url']
+
+@pytest.mark.parametrize('query', [
+  'after=not-json',
+  'after=%5B%22Austin%22%5D',
+  'after=%5B1%2C+2%2C+3%5D',
+  'after=%7B%22city%22%3A+%22Austin%22%7D',
+  'before=%5B%22Austin%22%2C+%22TX%22%2C+%224%22%5D',
+])
+def test_malformed_cursor_shows_the_first_page(app, session, query):
+  assert page(app, session, f'/places?{query}', *KEY)[0] == ordered(session, *KEY)[:3]
+
+@pytest.mark.parametrize('limit, size', [('100', 4), ('0', 1), ('-5', 1), ('many', 3)])
+def test_page_size_is_clamped(app, session, limit, size):
+  rows, links = page(app, session, f'/places?limit={limit}', Place.id)
+  assert len(rows) == size
+  assert links['limit'] == size
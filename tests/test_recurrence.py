@@ -0,0 +1,46 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import recurring_start_times
+
+#----------------------------------------------------------------------------#
+# Start times of a recurring booking: the frequencies, the day it runs until
+# and the limit on how many shows one booking may create.
+#----------------------------------------------------------------------------#
+
+START = datetime(2031, 1, 31, 20, 30)
+
+
+def test_daily_runs_through_the_until_day():
+  start_times = recurring_start_times(START, 'daily', 1, date(2031, 2, 2), 10)
+  assert start_times == [datetime(2031, 1, 31, 20, 30), datetime(2031, 2, 1, 20, 30), datetime(2031, 2, 2, 20, 30)]
+
+def test_weekly_with_an_interval():
+  start_times = recurring_start_times(START, 'weekly', 2, date(2031, 3, 1), 10)
+  assert start_times == [datetime(2031, 1, 31, 20, 30), datetime(2031, 2, 14, 20, 30), datetime(2031, 2, 28, 20, 30)]
+
+def test_monthly_on_day_31_skips_the_shorter_months():
+  start_times = recurring_start_times(START, 'monthly', 1, date(2031, 8, 31), 10)
+  assert [start_time.date() for start_time in start_times] == [
+    date(2031, 1, 31), date(2031, 3, 31), date(2031, 5, 31), date(2031, 7, 31), date(2031, 8, 31),
+  ]
+
+def test_monthly_on_february_29_only_in_leap_years():
+  start_times = recurring_start_times(datetime(2032, 2, 29, 19), 'monthly', 12, date(2040, 12, 31), 10)
+  assert [start_time.year for start_time in start_times] == [2032, 2036, 2040]
+
+def test_until_before_the_start_gives_no_times():
+  assert recurring_start_times(START, 'daily', 1, date(2031, 1, 30), 10) == []
+
+def test_until_the_start_day_gives_the_first_show_only():
+  assert recurring_start_times(START, 'weekly', 1, START.date(), 10) == [START]
+
+@pytest.mark.parametrize('until, limit, count', [
+  (date(2031, 2, 9), 10, 10),
+  (date(2031, 2, 10), 10, None),
+  (date(2031, 2, 10), 11, 11),
+])
+def test_more_times_than_the_limit_gives_none(until, limit, count):
+  start_times = recurring_start_times(START, 'daily', 1, until, limit)
+  assert (start_times if start_times is None else len(start_times)) == count